@@ -7,11 +7,12 @@ from django.core.files.base import ContentFile
 from django.utils import timezone
 from django.conf import settings
 from .models import (
-    Bot, BotUser, Campaign, CampaignMessage, CampaignAssignment, SendLog, WebhookEvent, MessageLog,
+    Bot, BotUser, Campaign, CampaignMessage, CampaignAssignment, SendLog, WebhookEvent, MessageLog, BroadcastJob,
+    ReportJob,
     # Election 360 models
     Candidate, CandidateUser, Event, EventAttendance, Speech, Poll, PollResponse, Supporter, 
     Volunteer, VolunteerActivity, FakeNewsAlert, DailyQuestion, CampaignAnalytics, Gallery, Testimonial, CampaignBenefit,
-    ContactMessage,
+    ContactMessage, CampaignAnalyticsSnapshot,
 )
 
 
@@ -39,6 +40,9 @@ class BotAdminForm(forms.ModelForm):
                 else:
                     url = settings.MEDIA_URL + path
             instance.image_url = url
+        if "token" in self.changed_data:
+            # update_ids are per bot; a new token starts a fresh sequence
+            instance.last_update_id = None
         if commit:
             instance.save()
         return instance
@@ -84,10 +88,24 @@ class SendLogAdmin(admin.ModelAdmin):
     search_fields = ("message_id", "error")
 
 
+@admin.register(BroadcastJob)
+class BroadcastJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "bot", "action", "status", "sent_count", "failed_count", "total_recipients", "created_at")
+    list_filter = ("status", "action", "bot")
+    readonly_fields = ("cursor", "worker", "heartbeat_at", "started_at", "finished_at")
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "rows", "created_by", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("fingerprint", "worker", "started_at", "heartbeat_at", "finished_at")
+
+
 @admin.register(WebhookEvent)
 class WebhookEventAdmin(admin.ModelAdmin):
-    list_display = ("bot", "event_type", "created_at")
-    list_filter = ("event_type", "bot")
+    list_display = ("bot", "update_id", "event_type", "status", "attempts", "created_at", "processed_at")
+    list_filter = ("status", "event_type", "bot")
     search_fields = ("event_type",)
 
 
@@ -174,10 +192,11 @@ class PollResponseInline(admin.TabularInline):
 
 @admin.register(Poll)
 class PollAdmin(admin.ModelAdmin):
-    list_display = ['title', 'candidate', 'is_active', 'expires_at', 'created_at']
+    list_display = ['title', 'candidate', 'is_active', 'response_count', 'expires_at', 'created_at']
     list_filter = ['is_active', 'is_anonymous', 'allows_multiple_answers', 'candidate']
     search_fields = ['title', 'question']
-    readonly_fields = ['id', 'created_at', 'updated_at']
+    # Maintained by hub.polls.record_vote; run reconcile_poll_tallies after editing responses here
+    readonly_fields = ['id', 'response_count', 'created_at', 'updated_at']
     inlines = [PollResponseInline]
 
 
@@ -224,8 +243,20 @@ class DailyQuestionAdmin(admin.ModelAdmin):
 
 @admin.register(CampaignAnalytics)
 class CampaignAnalyticsAdmin(admin.ModelAdmin):
-    list_display = ['candidate', 'total_supporters', 'total_volunteers', 'total_events', 'last_updated']
-    readonly_fields = ['last_updated']
+    list_display = ['candidate', 'total_supporters', 'total_volunteers', 'total_events', 'total_public_events', 'last_updated']
+    # Running counters (hub/counters.py); fix drift with update_analytics
+    readonly_fields = [
+        'total_supporters', 'total_volunteers', 'total_events', 'total_public_events', 'total_polls',
+        'total_speeches', 'total_fake_news_alerts', 'last_updated',
+    ]
+
+
+@admin.register(CampaignAnalyticsSnapshot)
+class CampaignAnalyticsSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['candidate', 'date', 'total_supporters', 'total_volunteers', 'total_events', 'recorded_at']
+    list_filter = ['date']
+    date_hierarchy = 'date'
+    readonly_fields = ['recorded_at']
 
 @admin.register(ContactMessage)
 class ContactMessageAdmin(admin.ModelAdmin):
@@ -0,0 +1,217 @@
+"""
+Asyncio broadcast sender.
+
+Works the same BroadcastJob queue as hub/broadcast.py, but every recipient
+is a coroutine on one event loop sharing a pooled ``httpx`` client, so one
+process can keep hundreds of requests in flight per bot and run several
+bots' broadcasts side by side without a thread per request. The per-bot
+token bucket, per-chat gate and 429 ``retry_after`` handling are the same
+objects the threaded engine uses; database work goes through
+``sync_to_async``.
+
+Started with ``python manage.py run_broadcast_jobs --async``. Requires the
+optional ``httpx`` package.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+
+from .broadcast import (
+    BroadcastJobLost, ChatGate, TokenBucket, UploadedMedia, broadcast_settings, checkpoint_broadcast_job,
+    finish_broadcast_job, heartbeat_broadcast_job, is_cancelled, next_recipients, parse_action_payload,
+)
+from .models import BroadcastJob
+from .telegram import AsyncTelegramClient, TelegramNetworkError
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBroadcastEngine:
+    """Run one Telegram call sequence per chat as coroutines on the current loop.
+
+    ``send(api, chat_id)`` is a coroutine function that must only use
+    ``await api(method, http_method='POST', **request_kwargs)`` for network
+    access and returns the Telegram JSON dict for the chat.
+    """
+
+    def __init__(self, bot, concurrency: int | None = None, rate: float | None = None,
+                 chat_interval: float | None = None, max_retries: int | None = None):
+        conf = broadcast_settings()
+        self.bot = bot
+        self.concurrency = max(1, int(concurrency or conf['ASYNC_CONCURRENCY']))
+        self.max_retries = int(conf['MAX_RETRIES'] if max_retries is None else max_retries)
+        self.bucket = TokenBucket(rate or conf['MESSAGES_PER_SECOND'])
+        self.gate = ChatGate(conf['PER_CHAT_INTERVAL'] if chat_interval is None else chat_interval)
+        self.client = AsyncTelegramClient(bot.token, max_connections=self.concurrency)
+
+    async def api(self, method: str, http_method: str = 'POST', chat_id=None, timeout: float = 15, **kwargs) -> dict:
+        """Rate-limited Telegram call with 429 ``retry_after`` handling."""
+        attempt = 0
+        while True:
+            await self.bucket.acquire_async()
+            if chat_id is not None:
+                await self.gate.wait_async(chat_id)
+            try:
+                js = await self.client.request(method, http_method=http_method, timeout=timeout, **kwargs)
+            except TelegramNetworkError as ex:
+                if attempt >= self.max_retries:
+                    return {'ok': False, 'description': f'Network error: {ex}'}
+                attempt += 1
+                await asyncio.sleep(min(2 ** attempt, 10))
+                continue
+
+            if js.get('error_code') == 429 and attempt < self.max_retries:
+                retry_after = (js.get('parameters') or {}).get('retry_after') or 1
+                logger.warning("Bot %s throttled by Telegram, retrying after %ss", self.bot.id, retry_after)
+                self.bucket.pause(float(retry_after))
+                if chat_id is not None:
+                    self.gate.forget(chat_id)
+                attempt += 1
+                continue
+            return js
+
+    async def _run_one(self, send, chat_id, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                js = await send(self.api, chat_id)
+            except Exception as ex:
+                logger.exception("Broadcast send to %s failed", chat_id)
+                js = {'ok': False, 'description': f'Unhandled exception: {ex}'}
+        return chat_id, js or {'ok': False, 'description': 'Empty response'}
+
+    async def run(self, chat_ids, send, heartbeat=None) -> list:
+        """Send to ``chat_ids`` with at most ``concurrency`` requests in flight.
+
+        ``await heartbeat()`` runs every ``HEARTBEAT_EVERY`` seconds until the
+        sends finish; if it raises, the remaining sends are cancelled.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sends = asyncio.gather(*(self._run_one(send, chat_id, semaphore) for chat_id in chat_ids))
+        if heartbeat is None:
+            return await sends
+        beat_every = float(broadcast_settings()['HEARTBEAT_EVERY'])
+        while True:
+            done, _ = await asyncio.wait({sends}, timeout=beat_every)
+            if done:
+                return sends.result()
+            try:
+                await heartbeat()
+            except BaseException:
+                sends.cancel()
+                await asyncio.gather(sends, return_exceptions=True)
+                raise
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class AsyncUploadedMedia(UploadedMedia):
+    """Event-loop variant of UploadedMedia: the first recipient uploads, the rest wait."""
+
+    def __init__(self, field: str, method: str, path: str):
+        super().__init__(field, method, path)
+        self.lock = asyncio.Lock()
+
+    async def send(self, api, chat_id, caption=None) -> dict:
+        if self.file_id is None:
+            async with self.lock:
+                if self.file_id is None:
+                    content = await sync_to_async(self._read, thread_sensitive=False)()
+                    data_fields = {'chat_id': str(chat_id)}
+                    if caption:
+                        data_fields['caption'] = caption
+                    js = await api(
+                        self.method,
+                        chat_id=chat_id,
+                        data=data_fields,
+                        files={self.field: (self.filename, content, self.mime)},
+                        timeout=60,
+                    )
+                    if js.get('ok'):
+                        self.file_id = self._extract_file_id(js)
+                    return js
+        payload = {'chat_id': chat_id, self.field: self.file_id}
+        if caption:
+            payload['caption'] = caption
+        return await api(self.method, chat_id=chat_id, json=payload, timeout=30)
+
+    def _read(self) -> bytes:
+        with default_storage.open(self.path, 'rb') as fh:
+            return fh.read()
+
+
+def build_async_action_sender(action: str, data: dict):
+    """Async counterpart of ``build_action_sender``; returns ``(send, error)``."""
+    spec, error = parse_action_payload(action, data)
+    if error:
+        return None, error
+
+    if action == 'text':
+        async def send(api, chat_id):
+            return await api(
+                'sendMessage',
+                chat_id=chat_id,
+                json={'chat_id': chat_id, 'text': spec['text'], 'disable_web_page_preview': True},
+                timeout=15,
+            )
+    elif action == 'pin':
+        async def send(api, chat_id):
+            send_js = await api('sendMessage', chat_id=chat_id, json={'chat_id': chat_id, 'text': spec['text']}, timeout=15)
+            if not send_js.get('ok'):
+                return send_js
+            mid = (send_js.get('result') or {}).get('message_id')
+            return await api(
+                'pinChatMessage',
+                json={'chat_id': chat_id, 'message_id': mid, 'disable_notification': True},
+                timeout=15,
+            )
+    elif action == 'poll':
+        async def send(api, chat_id):
+            payload = {'chat_id': chat_id, 'question': spec['question'], 'options': spec['options'], **spec['extra']}
+            return await api('sendPoll', chat_id=chat_id, json=payload, timeout=20)
+    elif spec['path']:
+        media = AsyncUploadedMedia(action, spec['method'], spec['path'])
+
+        async def send(api, chat_id):
+            return await media.send(api, chat_id, caption=spec['caption'])
+    else:
+        async def send(api, chat_id):
+            payload = {'chat_id': chat_id, action: spec['url']}
+            if spec['caption']:
+                payload['caption'] = spec['caption']
+            return await api(spec['method'], chat_id=chat_id, json=payload, timeout=spec['timeout'])
+    return send, None
+
+
+async def run_broadcast_job_async(job: BroadcastJob) -> BroadcastJob:
+    """Async counterpart of ``run_broadcast_job`` for a claimed job."""
+    send, error = await sync_to_async(build_async_action_sender)(job.action, job.payload or {})
+    if error:
+        return await sync_to_async(finish_broadcast_job)(job, BroadcastJob.STATUS_FAILED, error)
+
+    bot = await sync_to_async(lambda: job.bot)()
+    engine = AsyncBroadcastEngine(bot)
+    try:
+        while True:
+            if await sync_to_async(is_cancelled)(job):
+                return await sync_to_async(finish_broadcast_job)(job, BroadcastJob.STATUS_CANCELLED)
+            user_ids = await sync_to_async(next_recipients)(job)
+            if not user_ids:
+                break
+            results = await engine.run(
+                sorted(user_ids), send, heartbeat=lambda: sync_to_async(heartbeat_broadcast_job)(job),
+            )
+            await sync_to_async(checkpoint_broadcast_job)(job, user_ids, results)
+    except BroadcastJobLost:
+        logger.warning("Broadcast job %s was reclaimed by another worker", job.pk)
+        await sync_to_async(job.refresh_from_db)()
+        return job
+    except Exception as ex:
+        logger.exception("Broadcast job %s crashed", job.pk)
+        return await sync_to_async(finish_broadcast_job)(job, BroadcastJob.STATUS_FAILED, str(ex))
+    finally:
+        await engine.aclose()
+
+    return await sync_to_async(finish_broadcast_job)(job, BroadcastJob.STATUS_COMPLETED)
@@ -0,0 +1,552 @@
+"""
+Concurrent, rate-limited broadcast engine for Telegram bots.
+
+Sends are fanned out over a bounded thread pool that shares the bot's pooled
+Telegram client (hub/telegram.py). A token bucket keeps the bot under Telegram's global
+limit (~30 msg/s), a per-chat gate spaces messages to the same chat, and
+HTTP 429 responses pause the whole bucket for ``retry_after`` seconds before
+the request is retried.
+
+Broadcasts are persisted as BroadcastJob rows and executed by the
+``run_broadcast_jobs`` worker, which checkpoints progress after every chunk
+of recipients and refreshes the job's heartbeat while a chunk is sending.
+Every write the worker makes is conditional on still owning the job: once
+another worker has reclaimed it, the first one stops.
+"""
+import asyncio
+import logging
+import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import user_cache
+from .models import BotUser, BroadcastJob, SendLog
+from .telegram import TelegramNetworkError, get_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROADCAST_SETTINGS = {
+    'WORKERS': 16,
+    'MESSAGES_PER_SECOND': 30,
+    'PER_CHAT_INTERVAL': 1.0,
+    'MAX_RETRIES': 3,
+    'CHECKPOINT_EVERY': 500,
+    'STALE_AFTER': 300,
+    'HEARTBEAT_EVERY': 30,
+    'LOG_BATCH_SIZE': 500,
+    'ASYNC_CONCURRENCY': 500,
+}
+
+
+def broadcast_settings() -> dict:
+    """Return TELEGRAM_BROADCAST settings merged over the defaults."""
+    merged = dict(DEFAULT_BROADCAST_SETTINGS)
+    merged.update(getattr(settings, 'TELEGRAM_BROADCAST', {}) or {})
+    return merged
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until a token is free.
+
+    ``acquire_async`` is the event-loop variant used by hub/async_broadcast.py.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token and return 0, or return how long to wait for one."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        while delay := self._take():
+            time.sleep(delay)
+
+    async def acquire_async(self) -> None:
+        while delay := self._take():
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for ``seconds`` (used on HTTP 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated_at = self.paused_until
+
+
+class ChatGate:
+    """Enforces a minimum interval between two sends to the same chat."""
+
+    def __init__(self, interval: float):
+        self.interval = float(interval)
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def _reserve(self, chat_id) -> float:
+        """Book the next slot for ``chat_id`` and return the delay until it."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed.get(chat_id, 0.0))
+            self.next_allowed[chat_id] = slot + self.interval
+        return slot - now
+
+    def wait(self, chat_id) -> None:
+        delay = self._reserve(chat_id)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, chat_id) -> None:
+        delay = self._reserve(chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def forget(self, chat_id) -> None:
+        with self.lock:
+            self.next_allowed.pop(chat_id, None)
+
+
+class BroadcastEngine:
+    """Run one Telegram call sequence per chat over a bounded worker pool.
+
+    ``send(api, chat_id)`` is called from a worker thread and must only use
+    ``api(method, http_method='POST', **request_kwargs)`` for network access;
+    it returns the Telegram JSON dict that decides success for the chat.
+    Results are yielded back on the calling thread so that database writes
+    never happen inside the pool.
+    """
+
+    def __init__(self, bot, workers: int | None = None, rate: float | None = None,
+                 chat_interval: float | None = None, max_retries: int | None = None):
+        conf = broadcast_settings()
+        self.bot = bot
+        self.workers = max(1, int(workers or conf['WORKERS']))
+        self.max_retries = int(conf['MAX_RETRIES'] if max_retries is None else max_retries)
+        self.bucket = TokenBucket(rate or conf['MESSAGES_PER_SECOND'])
+        self.gate = ChatGate(conf['PER_CHAT_INTERVAL'] if chat_interval is None else chat_interval)
+        self.client = get_client(bot.token)
+
+    def api(self, method: str, http_method: str = 'POST', chat_id=None, timeout: float = 15, **kwargs) -> dict:
+        """Rate-limited Telegram call with 429 ``retry_after`` handling."""
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            if chat_id is not None:
+                self.gate.wait(chat_id)
+            try:
+                js = self.client.request(method, http_method=http_method, timeout=timeout, **kwargs)
+            except TelegramNetworkError as ex:
+                if attempt >= self.max_retries:
+                    return {'ok': False, 'description': f'Network error: {ex}'}
+                attempt += 1
+                time.sleep(min(2 ** attempt, 10))
+                continue
+
+            if js.get('error_code') == 429 and attempt < self.max_retries:
+                retry_after = (js.get('parameters') or {}).get('retry_after') or 1
+                logger.warning("Bot %s throttled by Telegram, retrying after %ss", self.bot.id, retry_after)
+                self.bucket.pause(float(retry_after))
+                if chat_id is not None:
+                    self.gate.forget(chat_id)
+                attempt += 1
+                continue
+            return js
+
+    def _run_one(self, send: Callable, chat_id):
+        try:
+            js = send(self.api, chat_id)
+        except Exception as ex:
+            logger.exception("Broadcast send to %s failed", chat_id)
+            js = {'ok': False, 'description': f'Unhandled exception: {ex}'}
+        return chat_id, js or {'ok': False, 'description': 'Empty response'}
+
+    def run(self, chat_ids: Iterable, send: Callable, heartbeat: Callable | None = None):
+        """Yield ``(chat_id, telegram_json)`` as sends complete.
+
+        At most ``workers * 4`` sends are in flight so that huge audiences do
+        not materialise one future per recipient up front. ``heartbeat()`` is
+        called on the calling thread at least every ``HEARTBEAT_EVERY``
+        seconds, also while sends are stalled on 429 pauses or uploads; if it
+        raises, sends that have not started are cancelled.
+        """
+        window = self.workers * 4
+        beat_every = float(broadcast_settings()['HEARTBEAT_EVERY'])
+        last_beat = time.monotonic()
+        pending = iter(chat_ids)
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'broadcast-{self.bot.id}') as pool:
+            try:
+                while True:
+                    for chat_id in pending:
+                        in_flight.add(pool.submit(self._run_one, send, chat_id))
+                        if len(in_flight) >= window:
+                            break
+                    if not in_flight:
+                        return
+                    done, in_flight = wait(in_flight, timeout=beat_every, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                    if heartbeat is not None and time.monotonic() - last_beat >= beat_every:
+                        heartbeat()
+                        last_beat = time.monotonic()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+
+class UploadedMedia:
+    """Upload a stored file once, then reuse Telegram's file_id for everyone else."""
+
+    def __init__(self, field: str, method: str, path: str):
+        self.field = field
+        self.method = method
+        self.path = path
+        self.filename = path.split('/')[-1]
+        mime, _ = mimetypes.guess_type(self.filename)
+        self.mime = mime or 'application/octet-stream'
+        self.file_id = None
+        self.lock = threading.Lock()
+
+    def _extract_file_id(self, js: dict):
+        result = js.get('result') or {}
+        media = result.get(self.field)
+        if isinstance(media, list):
+            media = media[-1] if media else None
+        return (media or {}).get('file_id')
+
+    def send(self, api, chat_id, caption=None) -> dict:
+        if self.file_id is None:
+            with self.lock:
+                if self.file_id is None:
+                    with default_storage.open(self.path, 'rb') as fh:
+                        content = fh.read()
+                    data_fields = {'chat_id': str(chat_id)}
+                    if caption:
+                        data_fields['caption'] = caption
+                    js = api(
+                        self.method,
+                        chat_id=chat_id,
+                        data=data_fields,
+                        files={self.field: (self.filename, content, self.mime)},
+                        timeout=60,
+                    )
+                    if js.get('ok'):
+                        self.file_id = self._extract_file_id(js)
+                    return js
+        payload = {'chat_id': chat_id, self.field: self.file_id}
+        if caption:
+            payload['caption'] = caption
+        return api(self.method, chat_id=chat_id, json=payload, timeout=30)
+
+
+def parse_action_payload(action: str, data: dict):
+    """Validate a broadcast payload and return ``(spec, error)``.
+
+    ``spec`` holds the normalised parameters for ``action`` and is shared by
+    the threaded and the asyncio senders.
+    """
+    if action in ('text', 'pin'):
+        text = (data.get('text') or '').strip()
+        if not text:
+            return None, f'text required for action={action}'
+        return {'text': text}, None
+
+    if action in ('photo', 'video', 'document'):
+        method = {'photo': 'sendPhoto', 'video': 'sendVideo', 'document': 'sendDocument'}[action]
+        url = (data.get(action) or '').strip()
+        path = (data.get(f'{action}_path') or '').strip()
+        if path and not default_storage.exists(path):
+            # Fallback to URL if path invalid
+            path = ''
+        if not url and not path:
+            return None, f'{action} or {action}_path required for action={action}'
+        return {
+            'method': method,
+            'url': url,
+            'path': path,
+            'caption': data.get('caption'),
+            'timeout': 30 if action == 'video' else 20,
+        }, None
+
+    if action == 'poll':
+        question = (data.get('question') or '').strip()
+        raw_options = data.get('options')
+        options: list[str] = []
+        if isinstance(raw_options, list):
+            options = [str(o).strip() for o in raw_options if str(o).strip()]
+        elif isinstance(raw_options, str):
+            # Split by newline or comma
+            splitted = [s for chunk in raw_options.split('\n') for s in chunk.split(',')]
+            options = [s.strip() for s in splitted if s.strip()]
+        # Telegram constraints: 2..10 options, each 1..100 chars
+        if not question:
+            return None, 'poll requires non-empty question'
+        if len(options) < 2:
+            return None, 'poll requires at least 2 options'
+        extra = {}
+        if 'is_anonymous' in data:
+            extra['is_anonymous'] = bool(data['is_anonymous'])
+        if 'allows_multiple_answers' in data:
+            extra['allows_multiple_answers'] = bool(data['allows_multiple_answers'])
+        return {'question': question, 'options': [o[:100] for o in options[:10]], 'extra': extra}, None
+
+    return None, f'unsupported action {action}'
+
+
+def build_action_sender(action: str, data: dict):
+    """Validate a broadcast payload and return ``(send, error)``.
+
+    ``send(api, chat_id)`` performs the Telegram calls for one recipient and
+    is safe to run concurrently from the broadcast engine's worker threads.
+    """
+    spec, error = parse_action_payload(action, data)
+    if error:
+        return None, error
+
+    if action == 'text':
+        def send(api, chat_id):
+            return api(
+                'sendMessage',
+                chat_id=chat_id,
+                json={'chat_id': chat_id, 'text': spec['text'], 'disable_web_page_preview': True},
+                timeout=15,
+            )
+    elif action == 'pin':
+        def send(api, chat_id):
+            # Send a message then pin it
+            send_js = api('sendMessage', chat_id=chat_id, json={'chat_id': chat_id, 'text': spec['text']}, timeout=15)
+            if not send_js.get('ok'):
+                return send_js
+            mid = (send_js.get('result') or {}).get('message_id')
+            return api(
+                'pinChatMessage',
+                json={'chat_id': chat_id, 'message_id': mid, 'disable_notification': True},
+                timeout=15,
+            )
+    elif action == 'poll':
+        def send(api, chat_id):
+            payload = {'chat_id': chat_id, 'question': spec['question'], 'options': spec['options'], **spec['extra']}
+            return api('sendPoll', chat_id=chat_id, json=payload, timeout=20)
+    elif spec['path']:
+        media = UploadedMedia(action, spec['method'], spec['path'])
+
+        def send(api, chat_id):
+            return media.send(api, chat_id, caption=spec['caption'])
+    else:
+        def send(api, chat_id):
+            payload = {'chat_id': chat_id, action: spec['url']}
+            if spec['caption']:
+                payload['caption'] = spec['caption']
+            return api(spec['method'], chat_id=chat_id, json=payload, timeout=spec['timeout'])
+    return send, None
+
+
+def classify_send_error(js: dict):
+    """Return why a recipient is unreachable, or None for transient/other errors.
+
+    Telegram answers 403 when the user blocked the bot or deleted their
+    account, and 400 "chat not found" when the chat no longer exists. Any
+    other failure (bad payload, flood control, network) says nothing about
+    the recipient and must not mark them blocked.
+    """
+    if js.get('ok'):
+        return None
+    code = js.get('error_code')
+    description = (js.get('description') or '').lower()
+    if 'deactivated' in description:
+        return 'deactivated'
+    if code == 403 or 'blocked' in description:
+        return 'blocked'
+    if 'chat not found' in description:
+        return 'chat_not_found'
+    return None
+
+
+def job_audience(job: BroadcastJob):
+    """Recipients of a job: users who had started the bot when it was queued."""
+    return BotUser.objects.filter(
+        bot_id=job.bot_id,
+        is_blocked=False,
+        started_at__isnull=False,
+        started_at__lte=job.created_at,
+    )
+
+
+def enqueue_broadcast(bot, action: str, payload: dict, user=None) -> BroadcastJob:
+    job = BroadcastJob.objects.create(
+        bot=bot,
+        action=action,
+        payload=payload,
+        created_by=user if getattr(user, 'is_authenticated', False) else None,
+    )
+    job.total_recipients = job_audience(job).count()
+    job.save(update_fields=['total_recipients'])
+    return job
+
+
+def claim_broadcast_job(worker: str, stale_after: int | None = None):
+    """Atomically take the oldest pending job, or a running one whose worker died."""
+    stale_after = broadcast_settings()['STALE_AFTER'] if stale_after is None else stale_after
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            BroadcastJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=BroadcastJob.STATUS_PENDING)
+                | Q(status=BroadcastJob.STATUS_RUNNING, heartbeat_at__lt=now - timedelta(seconds=stale_after))
+            )
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = BroadcastJob.STATUS_RUNNING
+        job.worker = worker
+        job.heartbeat_at = now
+        job.started_at = job.started_at or now
+        job.save(update_fields=['status', 'worker', 'heartbeat_at', 'started_at'])
+    return job
+
+
+class BroadcastJobLost(Exception):
+    """The job was reclaimed by another worker while this one was sending it."""
+
+
+def _owned(job: BroadcastJob):
+    # A cancelled job keeps its worker until that worker notices and stops
+    return BroadcastJob.objects.filter(
+        pk=job.pk, worker=job.worker, status__in=(BroadcastJob.STATUS_RUNNING, BroadcastJob.STATUS_CANCELLED),
+    )
+
+
+def heartbeat_broadcast_job(job: BroadcastJob) -> None:
+    """Record that ``job``'s worker is alive; raises BroadcastJobLost if it was reclaimed."""
+    job.heartbeat_at = timezone.now()
+    if not _owned(job).update(heartbeat_at=job.heartbeat_at):
+        raise BroadcastJobLost(f"broadcast job {job.pk} is no longer held by {job.worker}")
+
+
+def checkpoint_broadcast_job(job: BroadcastJob, user_ids: dict, results: list) -> None:
+    """Persist one chunk's outcome and advance the job cursor in one transaction.
+
+    Send logs are written with ``bulk_create`` and blocked recipients are
+    flagged with a single UPDATE, so a chunk costs a handful of queries
+    instead of one INSERT per recipient. Raises BroadcastJobLost, writing
+    nothing, if another worker has reclaimed the job.
+    """
+    now = timezone.now()
+    sent = failed = 0
+    logs = []
+    blocked = []
+    for chat_id, js in results:
+        is_success = bool(js.get('ok'))
+        error_desc = js.get('description') or 'Unknown error'
+        if is_success:
+            sent += 1
+        else:
+            failed += 1
+            if classify_send_error(js):
+                blocked.append(chat_id)
+        logs.append(SendLog(
+            campaign=None,
+            bot_user_id=user_ids[chat_id],
+            status=SendLog.STATUS_SENT if is_success else SendLog.STATUS_FAILED,
+            message_id=str((js.get('result') or {}).get('message_id')) if is_success else None,
+            error=None if is_success else error_desc,
+            sent_at=now if is_success else None,
+        ))
+
+    with transaction.atomic():
+        advanced = _owned(job).update(
+            cursor=max(user_ids),
+            sent_count=F('sent_count') + sent,
+            failed_count=F('failed_count') + failed,
+            heartbeat_at=now,
+        )
+        if not advanced:
+            raise BroadcastJobLost(f"broadcast job {job.pk} is no longer held by {job.worker}")
+        SendLog.objects.bulk_create(logs, batch_size=int(broadcast_settings()['LOG_BATCH_SIZE']))
+        if blocked:
+            BotUser.objects.filter(bot_id=job.bot_id, telegram_id__in=blocked).update(is_blocked=True)
+            transaction.on_commit(lambda: user_cache.forget_many(job.bot_id, blocked))
+    job.cursor = max(user_ids)
+    job.sent_count += sent
+    job.failed_count += failed
+    job.heartbeat_at = now
+
+
+def next_recipients(job: BroadcastJob) -> dict:
+    """Return the next chunk of ``{telegram_id: bot_user_id}`` after ``job.cursor``."""
+    chunk_size = int(broadcast_settings()['CHECKPOINT_EVERY'])
+    qs = job_audience(job).order_by('telegram_id')
+    if job.cursor is not None:
+        qs = qs.filter(telegram_id__gt=job.cursor)
+    return dict(qs.values_list('telegram_id', 'id')[:chunk_size])
+
+
+def is_cancelled(job: BroadcastJob) -> bool:
+    return BroadcastJob.objects.filter(pk=job.pk, status=BroadcastJob.STATUS_CANCELLED).exists()
+
+
+def finish_broadcast_job(job: BroadcastJob, status: str, error: str | None = None) -> BroadcastJob:
+    """Close a running job with ``status``; a cancel that landed meanwhile is kept."""
+    now = timezone.now()
+    values = {'status': status, 'finished_at': now}
+    if error is not None:
+        values['error'] = error
+    owned = BroadcastJob.objects.filter(pk=job.pk, worker=job.worker)
+    if not owned.filter(status=BroadcastJob.STATUS_RUNNING).update(**values):
+        # No longer running (cancelled): only record when the worker stopped
+        owned.filter(finished_at__isnull=True).update(finished_at=now)
+    job.refresh_from_db(fields=['status', 'finished_at', 'error'])
+    return job
+
+
+def run_broadcast_job(job: BroadcastJob) -> BroadcastJob:
+    """Send a claimed job to every remaining recipient after ``job.cursor``."""
+    send, error = build_action_sender(job.action, job.payload or {})
+    if error:
+        return finish_broadcast_job(job, BroadcastJob.STATUS_FAILED, error)
+
+    engine = BroadcastEngine(job.bot)
+    try:
+        while True:
+            if is_cancelled(job):
+                return finish_broadcast_job(job, BroadcastJob.STATUS_CANCELLED)
+            user_ids = next_recipients(job)
+            if not user_ids:
+                break
+            results = list(engine.run(sorted(user_ids), send, heartbeat=lambda: heartbeat_broadcast_job(job)))
+            checkpoint_broadcast_job(job, user_ids, results)
+    except BroadcastJobLost:
+        # The other worker owns the job now; leave its row alone
+        logger.warning("Broadcast job %s was reclaimed by another worker", job.pk)
+        job.refresh_from_db()
+        return job
+    except Exception as ex:
+        logger.exception("Broadcast job %s crashed", job.pk)
+        return finish_broadcast_job(job, BroadcastJob.STATUS_FAILED, str(ex))
+
+    return finish_broadcast_job(job, BroadcastJob.STATUS_COMPLETED)
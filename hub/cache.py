@@ -0,0 +1,223 @@
+"""
+Identity caches for the update hot path.
+
+``user_cache`` maps ``(bot_id, telegram_id)`` to a snapshot of the BotUser
+columns the update pipeline reads (id, state, flags, profile,
+``last_seen_at``), so a chatty user's row is not loaded again for every
+batch. By default it is a bounded per-process LRU; set
+``HUB_CACHE['USER_CACHE_ALIAS']`` to a Django cache alias (e.g. one backed
+by django-redis) to share it between processes so invalidations are seen
+everywhere.
+
+The pipeline writes snapshots through after its transaction commits, but
+only for rows it loaded from the database or changed; a snapshot keeps the
+expiry it was first stored with, so ``USER_CACHE_TTL`` bounds how long any
+missed invalidation can linger. Other writers invalidate: ``save()``/
+``delete()`` via signals (hub/signals.py) and queryset ``update()`` calls
+explicitly with ``user_cache.forget_many``. Because those invalidations do
+not reach other processes with the per-process default, the pipeline
+re-reads the columns other writers change (``is_blocked``, ``state``) for
+cached users once per batch.
+
+``bot_cache`` keeps Bot rows per process, keyed by id and by token, for
+``BOT_CACHE_TTL`` seconds so request paths such as the webhook resolve their
+bot without a query. ``Bot`` save/delete signals evict the entry.
+"""
+import copy
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+from .models import Bot, BotUser
+
+DEFAULT_CACHE_SETTINGS = {
+    'USER_CACHE_SIZE': 50000,
+    'USER_CACHE_TTL': 300,
+    'USER_CACHE_ALIAS': None,
+    'LAST_SEEN_INTERVAL': 60,
+    'BOT_CACHE_TTL': 60,
+    'LANDING_CACHE_ALIAS': 'default',
+    'LANDING_CACHE_TTL': 600,
+    'LANDING_COUNTS_TTL': 30,
+    'PAGE_CACHE_TTL': 30,
+    'PAGE_CACHE_MAX_AGE': 30,
+}
+
+
+def cache_settings() -> dict:
+    """Return HUB_CACHE settings merged over the defaults."""
+    merged = dict(DEFAULT_CACHE_SETTINGS)
+    merged.update(getattr(settings, 'HUB_CACHE', {}) or {})
+    return merged
+
+
+class LocalLRUCache:
+    """Thread-safe bounded LRU with per-entry expiry.
+
+    Implements the ``get_many``/``set_many``/``delete_many`` subset of the
+    Django cache API so it can stand in for a shared cache backend.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, int(max_entries))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys) -> dict:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, data: dict, timeout: float) -> None:
+        expires = time.monotonic() + timeout
+        with self._lock:
+            for key, value in data.items():
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class BotUserCache:
+    """``(bot_id, telegram_id) -> BotUser`` snapshots for the update pipeline."""
+
+    FIELDS = (
+        'id', 'state', 'started_at', 'is_blocked', 'phone_number', 'last_seen_at',
+        'username', 'first_name', 'last_name', 'language_code',
+    )
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            conf = cache_settings()
+            if conf['USER_CACHE_ALIAS']:
+                from django.core.cache import caches
+                self._backend = caches[conf['USER_CACHE_ALIAS']]
+            else:
+                self._backend = LocalLRUCache(conf['USER_CACHE_SIZE'])
+        return self._backend
+
+    @staticmethod
+    def key(bot_id: int, telegram_id: int) -> str:
+        return f"hub:botuser:{bot_id}:{telegram_id}"
+
+    def get_many(self, bot, telegram_ids) -> dict:
+        """Return ``{telegram_id: BotUser}`` for the cached ids of ``bot``."""
+        keys = {self.key(bot.id, tid): tid for tid in telegram_ids}
+        users = {}
+        for key, snapshot in self.backend.get_many(list(keys)).items():
+            snapshot = dict(snapshot)
+            expires = snapshot.pop('expires', None)
+            user = BotUser(bot=bot, telegram_id=keys[key], **snapshot)
+            user._state.adding = False
+            user._cache_expires = expires
+            users[user.telegram_id] = user
+        return users
+
+    def store(self, users) -> None:
+        """Write snapshots of ``users``.
+
+        Users that came from :meth:`get_many` keep their entry's original
+        expiry (and are skipped once it has passed); others get a full
+        ``USER_CACHE_TTL``.
+        """
+        now = time.time()
+        ttl = cache_settings()['USER_CACHE_TTL']
+        by_timeout = defaultdict(dict)
+        for user in users:
+            expires = getattr(user, '_cache_expires', None) or now + ttl
+            if expires <= now:
+                continue
+            snapshot = {field: getattr(user, field) for field in self.FIELDS}
+            snapshot['expires'] = expires
+            by_timeout[math.ceil(expires - now)][self.key(user.bot_id, user.telegram_id)] = snapshot
+        for timeout, data in by_timeout.items():
+            self.backend.set_many(data, timeout)
+
+    def forget_many(self, bot_id: int, telegram_ids) -> None:
+        self.backend.delete_many([self.key(bot_id, tid) for tid in telegram_ids])
+
+
+user_cache = BotUserCache()
+
+
+class BotCache:
+    """Process-local Bot lookups by ``id`` or ``token``.
+
+    Callers get their own copy of the cached instance, so setting attributes
+    on it (e.g. ``last_update_id``) never leaks to other threads. Use it for
+    reads only; load the row from the database before ``save()``.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def first(self, **lookup):
+        """Like ``Bot.objects.filter(id=...|token=...).first()``."""
+        (field, value), = lookup.items()
+        if field not in ('id', 'token'):
+            raise TypeError(f"BotCache lookups are by id or token, not {field}")
+        key = (field, str(value))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is not None and entry[0] > now:
+            return copy.copy(entry[1])
+
+        bot = Bot.objects.filter(**lookup).first()
+        if bot is not None:
+            expires = now + float(cache_settings()['BOT_CACHE_TTL'])
+            with self._lock:
+                self._data[('id', str(bot.id))] = (expires, bot)
+                self._data[('token', bot.token)] = (expires, bot)
+            bot = copy.copy(bot)
+        return bot
+
+    def get(self, **lookup):
+        """Like ``Bot.objects.get(id=...|token=...)``."""
+        bot = self.first(**lookup)
+        if bot is None:
+            raise Bot.DoesNotExist(f"Bot matching {lookup} does not exist.")
+        return bot
+
+    def forget(self, bot_id: int, token: str) -> None:
+        with self._lock:
+            # Drop by id as well as by token: the token may just have changed
+            cached = self._data.pop(('id', str(bot_id)), None)
+            self._data.pop(('token', token), None)
+            if cached is not None:
+                self._data.pop(('token', cached[1].token), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+bot_cache = BotCache()
@@ -0,0 +1,171 @@
+"""
+Running per-candidate counters in CampaignAnalytics.
+
+Counting supporters with ``COUNT(*)`` on every page view turns into a scan
+once a campaign has millions of them, and recounting every total on each
+analytics request made reading a dashboard a write. Instead each
+:class:`Counter` names a CampaignAnalytics column and the rows it counts (a model with a
+``candidate`` foreign key, plus optional exact-match conditions). The
+save/delete signals in hub/signals.py call :func:`track_change`,
+:func:`apply_save` and :func:`apply_delete`, which adjust the column with
+an ``F()`` expression in the writer's transaction.
+
+Site-wide totals are the sum of the per-candidate columns
+(:func:`global_counts`), one small aggregate over CampaignAnalytics, so
+there is no single hot row every signup has to lock.
+
+Writes that bypass signals (``QuerySet.update()``, ``bulk_create``, raw
+SQL) leave the counters off. ``manage.py update_analytics`` is the
+periodic consistency check: it recounts (:func:`rebuild_counters`),
+reports any drift and records the day's CampaignAnalyticsSnapshot
+(:func:`record_snapshots`), which is what trend charts read.
+"""
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import (
+    CampaignAnalytics, CampaignAnalyticsSnapshot, Event, FakeNewsAlert, Poll, Speech, Supporter, Volunteer,
+)
+
+
+class Counter:
+    """``field`` counts the ``model`` rows of a candidate matching ``conditions``."""
+
+    def __init__(self, field: str, model, **conditions):
+        self.field = field
+        self.model = model
+        self.conditions = conditions
+
+    def matches(self, values: dict) -> bool:
+        return all(values.get(name) == value for name, value in self.conditions.items())
+
+    def queryset(self, candidate_id):
+        return self.model._default_manager.filter(candidate_id=candidate_id, **self.conditions)
+
+
+COUNTERS = (
+    Counter('total_supporters', Supporter),
+    Counter('total_volunteers', Volunteer, is_active=True),
+    Counter('total_events', Event),
+    Counter('total_public_events', Event, is_public=True),
+    Counter('total_polls', Poll),
+    Counter('total_speeches', Speech),
+    Counter('total_fake_news_alerts', FakeNewsAlert),
+)
+COUNTED_MODELS = tuple(dict.fromkeys(counter.model for counter in COUNTERS))
+
+
+def counters_for(model) -> list:
+    return [counter for counter in COUNTERS if counter.model is model]
+
+
+def _tracked_values(instance) -> dict:
+    names = {'candidate_id'}
+    for counter in counters_for(type(instance)):
+        names.update(counter.conditions)
+    return {name: getattr(instance, name) for name in names}
+
+
+def bump(candidate_id, deltas: dict) -> None:
+    """Add ``{field: delta}`` to ``candidate_id``'s counters; call inside the write's transaction."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas or candidate_id is None:
+        return
+    if any(delta > 0 for delta in deltas.values()):
+        # Decrements never create the row: during a cascading candidate
+        # delete it may already be gone
+        CampaignAnalytics.objects.bulk_create([CampaignAnalytics(candidate_id=candidate_id)], ignore_conflicts=True)
+    # Clamped at zero: a counter that drifted low must not fail the write
+    CampaignAnalytics.objects.filter(candidate_id=candidate_id).update(
+        last_updated=timezone.now(),
+        **{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()},
+    )
+
+
+def track_change(instance, update_fields=None) -> None:
+    """Remember the counted values an existing row had before it is saved (pre_save)."""
+    if instance._state.adding or instance.pk is None:
+        instance._counter_values = None
+        return
+    tracked = _tracked_values(instance)
+    if update_fields is not None and not tracked.keys() & set(update_fields):
+        # None of the counted columns is written, so nothing can move
+        instance._counter_values = tracked
+        return
+    instance._counter_values = type(instance)._default_manager.filter(pk=instance.pk).values(*tracked).first()
+
+
+def apply_save(instance, created: bool) -> None:
+    """Move the counters for a saved row (post_save)."""
+    new = _tracked_values(instance)
+    old = None if created else getattr(instance, '_counter_values', None)
+    deltas = {}
+    for counter in counters_for(type(instance)):
+        if old is not None and counter.matches(old):
+            deltas.setdefault(old['candidate_id'], {})[counter.field] = -1
+        if counter.matches(new):
+            per_candidate = deltas.setdefault(new['candidate_id'], {})
+            per_candidate[counter.field] = per_candidate.get(counter.field, 0) + 1
+    for candidate_id, changes in deltas.items():
+        bump(candidate_id, changes)
+
+
+def apply_delete(instance) -> None:
+    """Move the counters for a deleted row (post_delete)."""
+    values = _tracked_values(instance)
+    bump(values['candidate_id'], {
+        counter.field: -1 for counter in counters_for(type(instance)) if counter.matches(values)
+    })
+
+
+def candidate_counts(candidate_id) -> dict:
+    """``{field: value}`` of every counter for one candidate (zeros if none recorded)."""
+    fields = [counter.field for counter in COUNTERS]
+    row = CampaignAnalytics.objects.filter(candidate_id=candidate_id).values(*fields).first()
+    return row or dict.fromkeys(fields, 0)
+
+
+def global_counts() -> dict:
+    """``{field: total}`` of every counter across all candidates."""
+    totals = CampaignAnalytics.objects.aggregate(**{counter.field: Sum(counter.field) for counter in COUNTERS})
+    return {field: total or 0 for field, total in totals.items()}
+
+
+def recount(candidate_id) -> dict:
+    """Count every counter's rows for ``candidate_id`` from the tables."""
+    return {counter.field: counter.queryset(candidate_id).count() for counter in COUNTERS}
+
+
+def rebuild_counters(candidate_id) -> tuple:
+    """Replace ``candidate_id``'s counters with a recount; returns ``(before, after)``."""
+    with transaction.atomic():
+        CampaignAnalytics.objects.get_or_create(candidate_id=candidate_id)
+        analytics = CampaignAnalytics.objects.select_for_update().get(candidate_id=candidate_id)
+        before = {counter.field: getattr(analytics, counter.field) for counter in COUNTERS}
+        after = recount(candidate_id)
+        if after != before:
+            CampaignAnalytics.objects.filter(pk=analytics.pk).update(last_updated=timezone.now(), **after)
+    return before, after
+
+
+def record_snapshots(day=None, candidate_ids=None) -> int:
+    """Copy the current counters into CampaignAnalyticsSnapshot rows for ``day``.
+
+    Defaults to today (local date); running it again the same day updates
+    that day's rows. Returns the number of rows written.
+    """
+    day = day or timezone.localdate()
+    fields = [counter.field for counter in COUNTERS]
+    rows = CampaignAnalytics.objects.all()
+    if candidate_ids is not None:
+        rows = rows.filter(candidate_id__in=candidate_ids)
+    snapshots = [
+        CampaignAnalyticsSnapshot(candidate_id=row['candidate_id'], date=day, **{field: row[field] for field in fields})
+        for row in rows.values('candidate_id', *fields)
+    ]
+    CampaignAnalyticsSnapshot.objects.bulk_create(
+        snapshots, update_conflicts=True, unique_fields=['candidate', 'date'], update_fields=fields + ['recorded_at'],
+    )
+    return len(snapshots)
@@ -40,4 +40,6 @@ urlpatterns = [
     # Analytics & Reports
     path('candidates/<uuid:candidate_id>/analytics/', election_views.campaign_analytics, name='campaign_analytics'),
     path('candidates/<uuid:candidate_id>/export/supporters/', election_views.export_supporters_report, name='export_supporters_report'),
+    path('candidates/<uuid:candidate_id>/export/supporters/csv/', election_views.export_supporters_csv, name='export_supporters_csv'),
+    path('candidates/<uuid:candidate_id>/export/supporters/xlsx/', election_views.export_supporters_xlsx, name='export_supporters_xlsx'),
 ]
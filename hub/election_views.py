@@ -3,11 +3,14 @@ Election 360 SaaS API Views
 """
 import json
 import requests
-from django.http import JsonResponse, HttpResponse
+import tempfile
+from django.http import FileResponse, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.exceptions import ImproperlyConfigured
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Count, Q
 from django.core.paginator import Paginator
 from django.conf import settings
@@ -20,6 +23,11 @@ from .models import (
     Supporter, Volunteer, VolunteerActivity, FakeNewsAlert, DailyQuestion,
     CampaignAnalytics, BotUser
 )
+from .counters import COUNTERS
+from .polls import record_vote
+from .supporter_exports import (
+    InvalidSupporterQuery, filter_supporters, supporter_csv_chunks, supporter_json_chunks, write_supporters_xlsx,
+)
 
 
 # ===== CANDIDATE MANAGEMENT =====
@@ -325,15 +333,19 @@ def submit_poll_response(request, poll_id):
     except BotUser.DoesNotExist:
         return JsonResponse({'error': 'User not found'}, status=404)
     
-    response, created = PollResponse.objects.get_or_create(
-        poll=poll,
-        bot_user=bot_user,
-        defaults={'selected_options': selected_options}
-    )
-    
-    if not created:
-        response.selected_options = selected_options
-        response.save()
+    with transaction.atomic():
+        response, created = PollResponse.objects.select_for_update().get_or_create(
+            poll=poll,
+            bot_user=bot_user,
+            defaults={'selected_options': selected_options}
+        )
+
+        if created:
+            record_vote(poll.pk, selected_options)
+        else:
+            record_vote(poll.pk, selected_options, previous=response.selected_options)
+            response.selected_options = selected_options
+            response.save()
     
     return JsonResponse({
         'responded': True,
@@ -667,24 +679,29 @@ def daily_questions(request, candidate_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def campaign_analytics(request, candidate_id):
-    """Get comprehensive campaign analytics"""
+    """Get comprehensive campaign analytics
+
+    Read-only: the totals are the running counters of CampaignAnalytics
+    (hub/counters.py). Pass ``?days=N`` (up to 366) to include the daily
+    snapshots of the last N days as ``history``, oldest first.
+    """
     try:
         candidate = Candidate.objects.get(id=candidate_id)
     except Candidate.DoesNotExist:
         return Response({'error': 'Candidate not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    # Get or create analytics
-    analytics, created = CampaignAnalytics.objects.get_or_create(candidate=candidate)
-    
-    # Update analytics
-    analytics.total_supporters = candidate.supporters.count()
-    analytics.total_volunteers = candidate.volunteers.filter(is_active=True).count()
-    analytics.total_events = candidate.events.count()
-    analytics.total_polls = candidate.polls.count()
-    analytics.total_speeches = candidate.speeches.count()
-    analytics.total_fake_news_alerts = candidate.fake_news_alerts.count()
-    analytics.save()
-    
+
+    days = request.query_params.get('days')
+    if days is not None:
+        try:
+            days = int(days)
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= 366:
+            return Response({'error': 'days must be between 1 and 366'}, status=status.HTTP_400_BAD_REQUEST)
+
+    analytics = CampaignAnalytics.objects.filter(candidate=candidate).first()
+    totals = {counter.field: getattr(analytics, counter.field, 0) for counter in COUNTERS}
+
     # Additional metrics
     recent_events = candidate.events.filter(
         start_datetime__gte=timezone.now() - timezone.timedelta(days=30)
@@ -696,47 +713,70 @@ def campaign_analytics(request, candidate_id):
         count=Count('id')
     ).order_by('-count')[:10]
     
-    return Response({
+    data = {
         'candidate_name': candidate.name,
-        'total_supporters': analytics.total_supporters,
-        'total_volunteers': analytics.total_volunteers,
-        'total_events': analytics.total_events,
-        'total_polls': analytics.total_polls,
-        'total_speeches': analytics.total_speeches,
-        'total_fake_news_alerts': analytics.total_fake_news_alerts,
+        **totals,
         'recent_events_30_days': recent_events,
         'active_polls': active_polls,
         'supporters_by_city': list(supporters_by_city),
-        'last_updated': analytics.last_updated,
-    })
+        'last_updated': analytics.last_updated if analytics else None,
+    }
+    if days is not None:
+        since = timezone.localdate() - timezone.timedelta(days=days - 1)
+        snapshots = candidate.analytics_snapshots.filter(date__gte=since).order_by('date')
+        data['history'] = list(snapshots.values('date', *totals))
+    return Response(data)
+
+
+def _export_supporters(candidate_id, params):
+    """Return ``(candidate, queryset, None)`` or ``(None, None, error_response)``."""
+    try:
+        candidate = Candidate.objects.get(id=candidate_id)
+    except Candidate.DoesNotExist:
+        return None, None, Response({'error': 'Candidate not found'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        return candidate, filter_supporters(candidate, params), None
+    except InvalidSupporterQuery as ex:
+        return None, None, Response({'error': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def export_supporters_report(request, candidate_id):
-    """Export supporters report as JSON"""
+    """Export supporters report as JSON (streamed; filters as in filter_supporters)"""
+    candidate, supporters, error = _export_supporters(candidate_id, request.GET)
+    if error:
+        return error
+    return StreamingHttpResponse(supporter_json_chunks(candidate, supporters), content_type='application/json')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_supporters_csv(request, candidate_id):
+    """Export supporters as CSV, streamed row by row"""
+    candidate, supporters, error = _export_supporters(candidate_id, request.GET)
+    if error:
+        return error
+    response = StreamingHttpResponse(supporter_csv_chunks(supporters), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="supporters_{candidate.id}.csv"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_supporters_xlsx(request, candidate_id):
+    """Export supporters as XLSX via a write-only workbook"""
+    candidate, supporters, error = _export_supporters(candidate_id, request.GET)
+    if error:
+        return error
+    fh = tempfile.TemporaryFile()
     try:
-        candidate = Candidate.objects.get(id=candidate_id)
-    except Candidate.DoesNotExist:
-        return Response({'error': 'Candidate not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    supporters = candidate.supporters.select_related('bot_user').order_by('-registered_at')
-    data = []
-    
-    for supporter in supporters:
-        data.append({
-            'name': f"{supporter.bot_user.first_name} {supporter.bot_user.last_name}".strip(),
-            'phone': supporter.bot_user.phone_number,
-            'city': supporter.city,
-            'district': supporter.district,
-            'support_level': supporter.support_level,
-            'registered_at': supporter.registered_at,
-            'notes': supporter.notes,
-        })
-    
-    return Response({
-        'candidate_name': candidate.name,
-        'export_date': timezone.now(),
-        'total_supporters': len(data),
-        'supporters': data,
-    })
+        write_supporters_xlsx(supporters, fh)
+    except ImproperlyConfigured as ex:
+        fh.close()
+        return Response({'error': str(ex)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    fh.seek(0)
+    return FileResponse(
+        fh, as_attachment=True, filename=f"supporters_{candidate.id}.xlsx",
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
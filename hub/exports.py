@@ -0,0 +1,336 @@
+"""
+Streaming PDF export of bot message logs.
+
+ReportLab's canvas keeps every finished page in memory until ``save()``, so
+exporting a long history meant holding the whole document at once. This
+module writes the PDF itself, one object at a time: each page's content
+stream is compressed and emitted as soon as the page is full, and only the
+byte offsets needed for the cross-reference table are remembered. Rows come
+from ``QuerySet.iterator(chunk_size=...)``, so memory stays bounded no matter
+how many messages are exported.
+
+Text WinAnsiEncoding can represent is set in Helvetica. Anything else
+(Arabic names, emoji, ...) is set in the TrueType font from
+``HUB_EXPORTS['PDF_UNICODE_FONT']`` (or the first common system font
+found), embedded as 256-glyph subsets with ToUnicode maps so the text can
+still be searched and copied. Right-to-left text is shaped and reordered
+when ``arabic-reshaper`` and ``python-bidi`` are installed. Without any
+Unicode font such characters are drawn as ``?`` and a warning is logged.
+
+ReportLab is still used, for glyph metrics and font subsetting; measured
+word widths are cached.
+"""
+import logging
+import os
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.2756, 841.8898  # A4 in points
+MARGIN = 15 * 72 / 25.4  # 15mm
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+FONT_SIZE = 9
+TITLE_SIZE = 14
+LINE_GAP = 12       # between wrapped lines of one message
+MESSAGE_GAP = 14    # after the last line of a message
+CHUNK_SIZE = 2000   # rows fetched per database round trip
+
+LOG_FIELDS = ('received_at', 'chat_id', 'message_id', 'text', 'bot_user__phone_number')
+
+# Tried in order when HUB_EXPORTS['PDF_UNICODE_FONT'] is not set; all cover Arabic
+UNICODE_FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/freefont/FreeSans.ttf',
+    '/usr/share/fonts/gnu-free/FreeSans.ttf',
+)
+
+DEFAULT_EXPORT_SETTINGS = {
+    'PDF_UNICODE_FONT': None,
+}
+
+
+def export_settings() -> dict:
+    """Return HUB_EXPORTS settings merged over the defaults."""
+    merged = dict(DEFAULT_EXPORT_SETTINGS)
+    merged.update(getattr(settings, 'HUB_EXPORTS', {}) or {})
+    return merged
+
+
+def require_reportlab():
+    try:
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+    except ImportError:
+        raise ImproperlyConfigured('PDF export requires reportlab. Install with: pip install reportlab')
+    return stringWidth
+
+
+@lru_cache(maxsize=8)
+def _load_unicode_font(path):
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if path is None:
+        path = next((candidate for candidate in UNICODE_FONT_CANDIDATES if os.path.exists(candidate)), None)
+        if path is None:
+            logger.warning(
+                "No Unicode font for PDF exports; non-Latin text is drawn as '?'. "
+                "Set HUB_EXPORTS['PDF_UNICODE_FONT'] to a TrueType font such as DejaVuSans.ttf"
+            )
+            return None
+    try:
+        return TTFont('HubExportUnicode', path)
+    except Exception as ex:
+        raise ImproperlyConfigured(f"HUB_EXPORTS['PDF_UNICODE_FONT'] {path!r} is not a usable TrueType font: {ex}")
+
+
+def unicode_font():
+    """The TTFont used for text outside WinAnsiEncoding, or None if there is none."""
+    require_reportlab()
+    return _load_unicode_font(export_settings()['PDF_UNICODE_FONT'])
+
+
+def _is_latin(char: str) -> bool:
+    try:
+        char.encode('cp1252')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def font_runs(text: str) -> list:
+    """Split ``text`` into ``(is_latin, run)`` pieces for the two fonts."""
+    runs = []
+    for char in text:
+        latin = _is_latin(char)
+        if runs and runs[-1][0] == latin:
+            runs[-1][1] += char
+        else:
+            runs.append([latin, char])
+    return [(latin, run) for latin, run in runs]
+
+
+@lru_cache(maxsize=65536)
+def word_width(word: str, font: str = FONT, size: float = FONT_SIZE) -> float:
+    string_width = require_reportlab()
+    fallback = unicode_font()
+    width = 0.0
+    for latin, run in font_runs(word):
+        if latin or fallback is None:
+            width += string_width(run, font, size)
+        else:
+            width += fallback.stringWidth(run, size)
+    return width
+
+
+def wrap_words(text: str, max_width: float, font: str = FONT, size: float = FONT_SIZE) -> list:
+    """Greedy word wrap using cached per-word widths; over-long words are split."""
+    space = word_width(' ', font, size)
+    lines, current, current_width = [], '', 0.0
+    for word in text.split(' '):
+        width = word_width(word, font, size)
+        while width > max_width and len(word) > 1:
+            # Hard-split a word that cannot fit on any line
+            cut = len(word) - 1
+            while cut > 1 and word_width(word[:cut], font, size) > max_width:
+                cut -= 1
+            if current:
+                lines.append(current)
+                current, current_width = '', 0.0
+            lines.append(word[:cut])
+            word = word[cut:]
+            width = word_width(word, font, size)
+        if current and current_width + space + width <= max_width:
+            current += ' ' + word
+            current_width += space + width
+        elif not current:
+            current, current_width = word, width
+        else:
+            lines.append(current)
+            current, current_width = word, width
+    if current:
+        lines.append(current)
+    return lines
+
+
+def _pdf_string(text: str) -> bytes:
+    raw = text.encode('cp1252', errors='replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'') + b')'
+
+
+def visual_order(text: str) -> str:
+    """Shape and reorder right-to-left text for drawing, when the libraries are installed."""
+    if all(_is_latin(char) for char in text):
+        return text
+    try:
+        from arabic_reshaper import reshape
+        from bidi.algorithm import get_display
+    except ImportError:
+        return text
+    return get_display(reshape(text))
+
+
+class StreamingPdfWriter:
+    """Minimal text-only PDF writer that emits bytes page by page.
+
+    Write lines with :meth:`text` and :meth:`new_page`; after each call,
+    :meth:`drain` returns the bytes produced so far. :meth:`close` writes the
+    page tree, the shared font resources, the catalog and the
+    cross-reference table.
+    """
+
+    CATALOG, PAGES, FONT_REGULAR, FONT_HEADING, RESOURCES = 1, 2, 3, 4, 5
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self._offsets = {}
+        self._next_object = 6
+        self._page_ids = []
+        self._ops = []
+        self._unicode_font = unicode_font()
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._object(self.FONT_REGULAR,
+                     f'<< /Type /Font /Subtype /Type1 /BaseFont /{FONT} /Encoding /WinAnsiEncoding >>'.encode())
+        self._object(self.FONT_HEADING,
+                     f'<< /Type /Font /Subtype /Type1 /BaseFont /{FONT_BOLD} /Encoding /WinAnsiEncoding >>'.encode())
+
+    def _write(self, data: bytes) -> None:
+        self._buffer += data
+        self._position += len(data)
+
+    def _object(self, number: int, body: bytes) -> None:
+        self._offsets[number] = self._position
+        self._write(f'{number} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    def _stream(self, number: int, data: bytes, extra: str = '') -> None:
+        stream = zlib.compress(data)
+        self._object(number, f'<< /Length {len(stream)} /Filter /FlateDecode{extra} >>\nstream\n'.encode()
+                     + stream + b'\nendstream')
+
+    def _allocate(self) -> int:
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def text(self, x: float, y: float, text: str, bold: bool = False, size: float = FONT_SIZE) -> None:
+        latin_font = 'F2' if bold else 'F1'
+        ops = [f'BT {x:.2f} {y:.2f} Td'.encode()]
+        for latin, run in font_runs(visual_order(text)):
+            if latin or self._unicode_font is None:
+                ops.append(f'/{latin_font} {size:g} Tf '.encode() + _pdf_string(run) + b' Tj')
+                continue
+            # Each subset is a separate simple font with one-byte codes
+            for subset, codes in self._unicode_font.splitString(run, self):
+                ops.append(f'/U{subset} {size:g} Tf <{codes.hex()}> Tj'.encode())
+        ops.append(b'ET')
+        self._ops.append(b' '.join(ops))
+
+    def new_page(self) -> None:
+        """Finish the current page (even if empty) and start another."""
+        content_id, page_id = self._allocate(), self._allocate()
+        self._stream(content_id, b'\n'.join(self._ops))
+        self._ops = []
+        # The shared resources object is only written by close(), once every
+        # Unicode subset the document uses is known
+        self._object(page_id, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH:.4f} {PAGE_HEIGHT:.4f}] '
+            f'/Resources {self.RESOURCES} 0 R /Contents {content_id} 0 R >>'
+        ).encode())
+        self._page_ids.append(page_id)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def _unicode_subsets(self) -> list:
+        """Write the embedded subsets of the Unicode font; returns their font object ids."""
+        font = self._unicode_font
+        state = font.state.pop(self, None) if font is not None else None
+        if state is None:
+            return []
+        from reportlab.pdfbase.ttfonts import SUBSETN, makeToUnicodeCMap
+
+        face = font.face
+        font_ids = []
+        for index, subset in enumerate(state.subsets):
+            name = b''.join((SUBSETN(index), b'+', face.name, face.subfontNameX)).decode('latin-1')
+            file_id, descriptor_id, cmap_id, font_id = (self._allocate() for _ in range(4))
+            data = face.makeSubset(subset)
+            self._stream(file_id, data, f' /Length1 {len(data)}')
+            self._object(descriptor_id, (
+                f'<< /Type /FontDescriptor /FontName /{name} /Flags {face.flags} '
+                f'/FontBBox [{" ".join(str(value) for value in face.bbox)}] /ItalicAngle {face.italicAngle} '
+                f'/Ascent {face.ascent} /Descent {face.descent} /CapHeight {face.capHeight} '
+                f'/StemV {face.stemV} /MissingWidth {face.defaultWidth} /FontFile2 {file_id} 0 R >>'
+            ).encode())
+            self._stream(cmap_id, makeToUnicodeCMap(name, subset).encode('ascii'))
+            widths = ' '.join(str(face.getCharWidth(code)) for code in subset)
+            self._object(font_id, (
+                f'<< /Type /Font /Subtype /TrueType /BaseFont /{name} /FirstChar 0 /LastChar {len(subset) - 1} '
+                f'/Widths [{widths}] /FontDescriptor {descriptor_id} 0 R /ToUnicode {cmap_id} 0 R >>'
+            ).encode())
+            font_ids.append(font_id)
+        return font_ids
+
+    def close(self) -> bytes:
+        if self._ops or not self._page_ids:
+            self.new_page()
+        fonts = f'/F1 {self.FONT_REGULAR} 0 R /F2 {self.FONT_HEADING} 0 R'
+        for index, font_id in enumerate(self._unicode_subsets()):
+            fonts += f' /U{index} {font_id} 0 R'
+        self._object(self.RESOURCES, f'<< /Font << {fonts} >> >>'.encode())
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._page_ids)
+        self._object(self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>'.encode())
+        self._object(self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode())
+        xref_at = self._position
+        size = self._next_object
+        rows = [b'0000000000 65535 f \n']
+        for number in range(1, size):
+            rows.append(f'{self._offsets[number]:010d} 00000 n \n'.encode())
+        self._write(f'xref\n0 {size}\n'.encode() + b''.join(rows))
+        self._write(f'trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_at}\n%%EOF\n'.encode())
+        return self.drain()
+
+
+def message_log_pdf_chunks(bot, queryset, chunk_size: int = CHUNK_SIZE):
+    """Yield the PDF for ``queryset`` (MessageLogs of ``bot``) a page at a time.
+
+    Rows are exported newest first; the caller applies any filters.
+    """
+    require_reportlab()  # fail before the first byte if reportlab is missing
+    pdf = StreamingPdfWriter()
+    max_width = PAGE_WIDTH - 2 * MARGIN
+    top, bottom = PAGE_HEIGHT - MARGIN, MARGIN + 20
+
+    pdf.text(MARGIN, top, f"Message Logs for {bot.name}", bold=True, size=TITLE_SIZE)
+    y = top - 12 * 72 / 25.4
+
+    rows = queryset.order_by('-received_at', '-id').values_list(*LOG_FIELDS).iterator(chunk_size=chunk_size)
+    for received_at, chat_id, message_id, text, phone in rows:
+        line = (
+            f"{timezone.localtime(received_at):%Y-%m-%d %H:%M:%S} | chat={chat_id} | phone={phone or '-'} "
+            f"| msg={message_id or '-'} | {(text or '')[:1000]}"
+        )
+        wrapped = wrap_words(line.replace('\n', ' '), max_width)
+        for index, part in enumerate(wrapped):
+            if y < bottom:
+                pdf.new_page()
+                yield pdf.drain()
+                y = top
+            pdf.text(MARGIN, y, part)
+            y -= MESSAGE_GAP if index == len(wrapped) - 1 else LINE_GAP
+    yield pdf.close()
+
+
+def write_message_log_pdf(bot, queryset, fh, chunk_size: int = CHUNK_SIZE) -> None:
+    """Write the export to the binary file object ``fh``."""
+    for chunk in message_log_pdf_chunks(bot, queryset, chunk_size=chunk_size):
+        fh.write(chunk)
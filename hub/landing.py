@@ -0,0 +1,216 @@
+"""
+Cached data for the public candidate landing pages.
+
+The landing pages are what gets shared on social media, so a GET should not
+cost a query per section. Three kinds of entries live in the
+``HUB_CACHE['LANDING_CACHE_ALIAS']`` cache:
+
+* the Candidate row (with its bot), by id, plus a name -> id mapping for
+  the friendly URLs;
+* the page *sections* (events, speeches, polls, gallery, testimonials,
+  benefits) as evaluated lists, keyed by a per-candidate version token.
+  Saving or deleting one of those rows bumps the token after commit
+  (hub/signals.py), so the next request rebuilds the sections; older
+  versions simply expire;
+* the *counts* (supporters, questions, poll results), which change with
+  every signup or vote and are therefore refreshed every
+  ``LANDING_COUNTS_TTL`` seconds (and whenever the version moves).
+
+The version tokens also key the rendered pages of hub/page_cache.py;
+:func:`public_version` plays the same role for the site-wide public page.
+
+Sections are cached as data rather than rendered HTML because they contain
+forms whose CSRF tokens must not be shared between visitors (whole pages are
+only stored for anonymous GETs, see hub/page_cache.py). With a warm
+cache an anonymous GET issues no queries. The default cache is per process;
+point the alias at a shared backend so invalidations reach every worker.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+from .cache import cache_settings
+from .counters import candidate_counts
+from .models import (
+    CampaignBenefit, Candidate, Event, Gallery, Poll, Question, Speech, Testimonial,
+)
+from .polls import attach_poll_counts, poll_results
+
+DESKTOP = 'desktop'
+MOBILE = 'mobile'
+
+
+def landing_cache():
+    return caches[cache_settings()['LANDING_CACHE_ALIAS']]
+
+
+def _candidate_key(candidate_id) -> str:
+    return f"hub:landing:candidate:{candidate_id}"
+
+
+def _name_key(name: str) -> str:
+    # Names are free text (Arabic, spaces); hash them into a safe cache key
+    return f"hub:landing:name:{hashlib.sha1(name.encode('utf-8')).hexdigest()}"
+
+
+def _version_key(candidate_id) -> str:
+    return f"hub:landing:version:{candidate_id}"
+
+
+PUBLIC_VERSION_KEY = 'hub:landing:version:public'
+
+
+def _counts_key(candidate_id, variant: str) -> str:
+    return f"hub:landing:counts:{candidate_id}:{variant}"
+
+
+def _sections_key(candidate_id, variant: str, version: str) -> str:
+    return f"hub:landing:sections:{candidate_id}:{variant}:{version}"
+
+
+def get_landing_candidate(candidate_id):
+    """Active Candidate by id (with ``bot`` loaded), or None."""
+    cache = landing_cache()
+    key = _candidate_key(candidate_id)
+    candidate = cache.get(key)
+    if candidate is None:
+        try:
+            candidate = Candidate.objects.select_related('bot').filter(id=candidate_id).first()
+        except ValidationError:
+            return None
+        if candidate is None:
+            return None
+        cache.set(key, candidate, cache_settings()['LANDING_CACHE_TTL'])
+    return candidate if candidate.is_active else None
+
+
+def get_landing_candidate_by_name(name: str):
+    """Active Candidate by ``public_url_name``, falling back to exact ``name``."""
+    cache = landing_cache()
+    key = _name_key(name)
+    candidate_id = cache.get(key)
+    if candidate_id is not None:
+        candidate = get_landing_candidate(candidate_id)
+        # The mapping may predate a rename; only trust it if it still matches
+        if candidate is not None and name in (candidate.public_url_name, candidate.name):
+            return candidate
+    candidate = Candidate.objects.filter(is_active=True, public_url_name=name).first()
+    if not candidate:
+        candidate = Candidate.objects.filter(is_active=True, name=name).first()
+    if not candidate:
+        return None
+    cache.set(key, candidate.pk, cache_settings()['LANDING_CACHE_TTL'])
+    return get_landing_candidate(candidate.pk)
+
+
+def _desktop_sections(candidate) -> dict:
+    return {
+        'events': list(Event.objects.filter(candidate=candidate, is_public=True).order_by('-start_datetime')[:5]),
+        'speeches': list(Speech.objects.filter(candidate=candidate).order_by('-created_at')[:3]),
+        'polls': list(Poll.objects.filter(candidate=candidate).order_by('-created_at')[:5]),
+        'gallery_items': list(
+            Gallery.objects.filter(candidate=candidate, is_public=True).order_by('-is_featured', '-created_at')[:12]
+        ),
+        'testimonials': list(
+            Testimonial.objects.filter(candidate=candidate, is_public=True).order_by('display_order', '-created_at')[:6]
+        ),
+        'benefits': list(
+            CampaignBenefit.objects.filter(candidate=candidate, is_public=True)
+            .order_by('display_order', '-created_at')[:8]
+        ),
+    }
+
+
+def _mobile_sections(candidate) -> dict:
+    events = list(Event.objects.filter(candidate=candidate, is_public=True).order_by('-start_datetime')[:5])
+    return {
+        'events': events,
+        'events_count': len(events),
+        'polls': list(Poll.objects.filter(candidate=candidate, is_active=True).order_by('-created_at')[:3]),
+        'gallery_items': list(Gallery.objects.filter(candidate=candidate, is_public=True).order_by('-created_at')[:12]),
+        'testimonials': list(Testimonial.objects.filter(candidate=candidate, is_public=True).order_by('-created_at')[:5]),
+    }
+
+
+SECTIONS = {
+    DESKTOP: _desktop_sections,
+    MOBILE: _mobile_sections,
+}
+
+
+def _counts(candidate, variant: str, poll_ids: list) -> dict:
+    counts = {
+        'supporters_count': candidate_counts(candidate.pk)['total_supporters'],
+        'poll_results': poll_results(poll_ids),
+    }
+    if variant == MOBILE:
+        counts['questions_count'] = Question.objects.filter(candidate=candidate).count()
+    return counts
+
+
+def _current_version(cache, key: str, version=None) -> str:
+    """The version token under ``key``, created if missing (``version`` is a prefetched value)."""
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key) or version
+    return version
+
+
+def landing_version(candidate_id) -> str:
+    """Token that changes whenever ``candidate_id``'s sections are invalidated."""
+    cache = landing_cache()
+    key = _version_key(candidate_id)
+    return _current_version(cache, key, cache.get(key))
+
+
+def public_version() -> str:
+    """Token that changes whenever the candidate list or public events change."""
+    cache = landing_cache()
+    return _current_version(cache, PUBLIC_VERSION_KEY, cache.get(PUBLIC_VERSION_KEY))
+
+
+def landing_context(candidate, variant: str = DESKTOP) -> dict:
+    """Template context for the landing page sections of ``candidate``."""
+    conf = cache_settings()
+    cache = landing_cache()
+    version_key, counts_key = _version_key(candidate.pk), _counts_key(candidate.pk, variant)
+    cached = cache.get_many([version_key, counts_key])
+    version = _current_version(cache, version_key, cached.get(version_key))
+
+    sections_key = _sections_key(candidate.pk, variant, version)
+    sections = cache.get(sections_key)
+    if sections is None:
+        sections = SECTIONS[variant](candidate)
+        cache.set(sections_key, sections, conf['LANDING_CACHE_TTL'])
+
+    counts = cached.get(counts_key)
+    # Counts cover the polls of one sections version; recount when that moves
+    if counts is None or counts['version'] != version:
+        counts = _counts(candidate, variant, [poll.pk for poll in sections['polls']])
+        counts['version'] = version
+        cache.set(counts_key, counts, conf['LANDING_COUNTS_TTL'])
+
+    context = dict(sections)
+    context['polls'] = attach_poll_counts(sections['polls'], counts['poll_results'])
+    context.update({key: value for key, value in counts.items() if key not in ('poll_results', 'version')})
+    return context
+
+
+def invalidate_landing(candidate_id) -> None:
+    """Make the next request rebuild ``candidate_id``'s sections."""
+    landing_cache().set(_version_key(candidate_id), uuid.uuid4().hex, None)
+
+
+def invalidate_public_landing() -> None:
+    """Move :func:`public_version` on, e.g. after a candidate or event changed."""
+    landing_cache().set(PUBLIC_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def forget_landing_candidate(candidate_id, names=()) -> None:
+    """Drop the cached Candidate row and name mappings, and its sections."""
+    cache = landing_cache()
+    cache.delete_many([_candidate_key(candidate_id)] + [_name_key(name) for name in names if name])
+    invalidate_landing(candidate_id)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from hub.broadcast import BroadcastEngine, classify_send_error
+from hub.cache import user_cache
+from hub.models import Bot, BotUser
+
+
+class Command(BaseCommand):
+    help = "Off-peak check of stale chats with getChat; marks unreachable users as blocked"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bot-id', type=int, required=False, help='Only check this bot (default: all active bots)')
+        parser.add_argument('--stale-days', type=int, default=30, help='Check users not seen for this many days')
+        parser.add_argument('--rate', type=float, default=2.0, help='getChat requests per second per bot')
+        parser.add_argument('--limit', type=int, default=1000, help='Maximum users to check per bot; the next run continues after them')
+
+    def handle(self, *args, **options):
+        bot_id = options.get('bot_id')
+        if bot_id:
+            bots = Bot.objects.filter(id=bot_id)
+            if not bots.exists():
+                raise CommandError('Bot not found for --bot-id')
+        else:
+            bots = Bot.objects.filter(is_active=True)
+
+        cutoff = timezone.now() - timedelta(days=options['stale_days'])
+        limit = options['limit']
+        for bot in bots:
+            stale = (
+                BotUser.objects.filter(bot=bot, is_blocked=False)
+                .filter(Q(last_seen_at__lt=cutoff) | Q(last_seen_at__isnull=True))
+                .order_by('telegram_id')
+                .values_list('telegram_id', flat=True)
+            )
+            # Continue after the last chat checked, wrapping round, so reachable
+            # users (which stay stale) don't take every run's --limit
+            cursor = bot.hygiene_cursor
+            if cursor is None:
+                chat_ids = list(stale[:limit])
+            else:
+                chat_ids = list(stale.filter(telegram_id__gt=cursor)[:limit])
+                chat_ids += list(stale.filter(telegram_id__lte=cursor)[:limit - len(chat_ids)])
+            next_cursor = chat_ids[-1] if len(chat_ids) >= limit else None
+            if not chat_ids:
+                Bot.objects.filter(pk=bot.pk).update(hygiene_cursor=None)
+                continue
+
+            engine = BroadcastEngine(bot, workers=1, rate=options['rate'])
+            unreachable = []
+
+            def check(api, chat_id):
+                return api('getChat', http_method='GET', chat_id=chat_id, params={'chat_id': chat_id}, timeout=10)
+
+            for chat_id, js in engine.run(chat_ids, check):
+                if classify_send_error(js):
+                    unreachable.append(chat_id)
+
+            if unreachable:
+                BotUser.objects.filter(bot=bot, telegram_id__in=unreachable).update(is_blocked=True)
+                user_cache.forget_many(bot.id, unreachable)
+            Bot.objects.filter(pk=bot.pk).update(hygiene_cursor=next_cursor)
+            self.stdout.write(self.style.SUCCESS(
+                f"{bot.name}: checked {len(chat_ids)} stale chats, marked {len(unreachable)} blocked"
+            ))
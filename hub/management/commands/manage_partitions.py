@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from hub.partitions import (
+    PARTITIONED_TABLES, convert_to_partitioned, ensure_partitions, expire_partitions, is_partitioned,
+    partition_settings, supported,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly partitions of the MessageLog/SendLog tables and drop "
+        "(or detach with --archive) partitions past retention. PostgreSQL only; run daily. "
+        "Use --convert once, in a maintenance window, to turn the plain tables into partitioned ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, required=False,
+                            help="Months of future partitions to keep ready (default: LOG_PARTITIONS['MONTHS_AHEAD'])")
+        parser.add_argument('--retention-months', type=int, required=False,
+                            help="Override LOG_PARTITIONS['RETENTION_MONTHS'] for every table")
+        parser.add_argument('--archive', action='store_true',
+                            help='Detach expired partitions and keep them as standalone tables instead of dropping them')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the partitions that would expire')
+        parser.add_argument('--convert', action='store_true',
+                            help='Rebuild plain log tables as partitioned tables. Copies every row while holding '
+                                 'an exclusive lock on the table; stop the poller and workers first')
+
+    def handle(self, *args, **options):
+        if not supported(connection):
+            self.stdout.write(self.style.WARNING(
+                f"Database is {connection.vendor}; log tables are not partitioned, nothing to do."
+            ))
+            return
+
+        conf = partition_settings()
+        missing = [table for table in PARTITIONED_TABLES if not is_partitioned(connection, table)]
+        if missing and options.get('convert') and not options.get('dry_run'):
+            for table in missing:
+                self.stdout.write(f"Converting {table} (table is locked until this finishes)...")
+                with transaction.atomic():
+                    convert_to_partitioned(connection, table)
+                self.stdout.write(f"Converted {table}")
+        elif missing:
+            self.stdout.write(self.style.WARNING(
+                f"Not partitioned: {', '.join(missing)}. Run manage_partitions --convert in a maintenance window."
+            ))
+            return
+
+        if not options.get('dry_run'):
+            with transaction.atomic():
+                created = ensure_partitions(connection, options.get('months_ahead'))
+            for name in created:
+                self.stdout.write(f"Created partition {name}")
+
+        for table in PARTITIONED_TABLES:
+            retention = options.get('retention_months')
+            if retention is None:
+                retention = conf['RETENTION_MONTHS'].get(table)
+            if retention is None:
+                continue
+            with transaction.atomic():
+                expired = expire_partitions(
+                    connection, table, retention, archive=options.get('archive'), dry_run=options.get('dry_run'),
+                )
+            verb = 'Would expire' if options.get('dry_run') else ('Detached' if options.get('archive') else 'Dropped')
+            for name in expired:
+                self.stdout.write(f"{verb} partition {name}")
+
+        self.stdout.write(self.style.SUCCESS('Partition maintenance complete.'))
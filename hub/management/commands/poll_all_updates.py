@@ -1,67 +1,124 @@
-import sys
-import time
-import signal
-import subprocess
-from typing import List
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
+from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
 from hub.models import Bot
+from hub.telegram import AsyncTelegramClient, TelegramNetworkError
+from hub.updates import process_updates
 
+logger = logging.getLogger(__name__)
 
-class Command(BaseCommand):
-    help = "Run poll_updates for all active bots in parallel (one command)."
 
-    def add_arguments(self, parser):
-        parser.add_argument('--timeout', type=int, default=50, help='Long poll timeout seconds passed to poll_updates')
-        parser.add_argument('--sleep', type=int, default=1, help='Sleep between polls when no updates, passed to poll_updates')
+def _active_bots() -> dict:
+    return dict(Bot.objects.filter(is_active=True).values_list('id', 'token'))
+
+
+def _resume_offset(bot_id: int):
+    last_update_id = Bot.objects.filter(id=bot_id).values_list('last_update_id', flat=True).first()
+    return last_update_id + 1 if last_update_id is not None else None
 
-    def handle(self, *args, **options):
-        timeout = int(options.get('timeout') or 50)
-        sleep_sec = int(options.get('sleep') or 1)
 
-        bots: List[Bot] = list(Bot.objects.filter(is_active=True))
-        if not bots:
-            raise CommandError('No active bots found.')
+def _process_batch(bot_id: int, updates: list) -> bool:
+    """Apply a batch; False means it rolled back and should be fetched again."""
+    close_old_connections()
+    bot = Bot.objects.filter(id=bot_id).first()
+    if bot is None:
+        return True
+    try:
+        process_updates(bot, updates)
+    except Exception:
+        logger.exception("Error processing updates for bot %s", bot_id)
+        return False
+    return True
 
-        self.stdout.write(self.style.SUCCESS(f"Launching pollers for {len(bots)} active bot(s)..."))
 
-        processes: List[subprocess.Popen] = []
+class Command(BaseCommand):
+    help = (
+        "Long-poll getUpdates for all active bots from one process. Pollers are started "
+        "and stopped as Bot.is_active (or a bot token) changes, without a restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=int, default=50, help='Long poll timeout seconds')
+        parser.add_argument('--sleep', type=int, default=1, help='Sleep between polls when no updates')
+        parser.add_argument('--refresh', type=int, default=30, help='Seconds between checks for activated/deactivated bots')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads (and so DB connections) used to process updates for all bots')
 
+    def handle(self, *args, **options):
         try:
-            for b in bots:
-                cmd = [
-                    sys.executable,
-                    'manage.py',
-                    'poll_updates',
-                    '--bot-id', str(b.id),
-                    '--timeout', str(timeout),
-                    '--sleep', str(sleep_sec),
-                ]
-                proc = subprocess.Popen(cmd)
-                processes.append(proc)
-                self.stdout.write(self.style.SUCCESS(f" → Started poll_updates for bot '{b.name}' (id={b.id}) pid={proc.pid}"))
-
-            # Wait indefinitely until Ctrl+C
-            while True:
-                time.sleep(5)
+            import httpx  # noqa: F401
+        except ImportError:
+            raise CommandError('poll_all_updates requires httpx. Install with: pip install httpx')
 
+        try:
+            asyncio.run(self.supervise(
+                timeout=int(options.get('timeout') or 50),
+                sleep_sec=int(options.get('sleep') or 1),
+                refresh=max(1, int(options.get('refresh') or 30)),
+                workers=max(1, int(options.get('workers') or 4)),
+            ))
         except KeyboardInterrupt:
             self.stdout.write(self.style.WARNING('Stopping all pollers (KeyboardInterrupt)...'))
+        self.stdout.write(self.style.SUCCESS('All pollers stopped.'))
+
+    async def supervise(self, timeout, sleep_sec, refresh, workers):
+        # Update processing is synchronous Django code; it runs on a fixed pool
+        # so DB connections stay flat no matter how many bots are polled.
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='updates')
+        )
+        pollers = {}  # bot_id -> (token, task)
+        try:
+            while True:
+                wanted = await sync_to_async(_active_bots)()
+                for bot_id, (token, task) in list(pollers.items()):
+                    if wanted.get(bot_id) != token or task.done():
+                        task.cancel()
+                        del pollers[bot_id]
+                        self.stdout.write(self.style.WARNING(f" ← Stopped poller for bot id={bot_id}"))
+                for bot_id, token in wanted.items():
+                    if bot_id not in pollers:
+                        task = asyncio.create_task(self.poll_bot(bot_id, token, timeout, sleep_sec))
+                        pollers[bot_id] = (token, task)
+                        self.stdout.write(self.style.SUCCESS(f" → Started poller for bot id={bot_id}"))
+                await asyncio.sleep(refresh)
         finally:
-            # Terminate all subprocesses
-            for p in processes:
-                try:
-                    p.send_signal(signal.SIGINT)
-                except Exception:
-                    pass
-            for p in processes:
+            for _, task in pollers.values():
+                task.cancel()
+            await asyncio.gather(*(task for _, task in pollers.values()), return_exceptions=True)
+
+    async def poll_bot(self, bot_id, token, timeout, sleep_sec):
+        client = AsyncTelegramClient(token, max_connections=2)
+        try:
+            offset = await sync_to_async(_resume_offset)(bot_id)
+            while True:
+                params = {'timeout': timeout}
+                if offset:
+                    params['offset'] = offset
                 try:
-                    p.wait(timeout=5)
-                except Exception:
-                    try:
-                        p.kill()
-                    except Exception:
-                        pass
-            self.stdout.write(self.style.SUCCESS('All pollers stopped.'))
+                    js = await client.request('getUpdates', http_method='GET', params=params, timeout=timeout + 5)
+                except TelegramNetworkError as ex:
+                    self.stderr.write(f"[bot {bot_id}] Error fetching updates: {ex}")
+                    await asyncio.sleep(sleep_sec)
+                    continue
 
+                if not js.get('ok'):
+                    self.stderr.write(f"[bot {bot_id}] Telegram returned error: {js}")
+                    await asyncio.sleep(max(sleep_sec, 5))
+                    continue
 
+                updates = js.get('result') or []
+                if updates:
+                    # Only confirm the batch to Telegram (via offset) once it is committed
+                    if await sync_to_async(_process_batch, thread_sensitive=False)(bot_id, updates):
+                        offset = updates[-1]['update_id'] + 1
+                    else:
+                        await asyncio.sleep(max(sleep_sec, 5))
+                else:
+                    await asyncio.sleep(sleep_sec)
+        finally:
+            await client.aclose()
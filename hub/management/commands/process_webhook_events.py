@@ -0,0 +1,51 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from hub.updates import process_webhook_events
+
+
+class Command(BaseCommand):
+    help = "Apply queued webhook updates (WebhookEvent rows) with a pool of worker threads, one bot per worker at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads (each uses one DB connection)')
+        parser.add_argument('--batch', type=int, default=100, help='Events of one bot claimed per transaction')
+        parser.add_argument('--sleep', type=float, default=0.5, help='Sleep between polls when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.work, args=(options, stop), name=f'webhook-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        self.stdout.write(self.style.SUCCESS(f"Processing webhook events with {workers} worker(s)"))
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping webhook workers (KeyboardInterrupt)...'))
+            stop.set()
+            for t in threads:
+                t.join(timeout=10)
+
+    def work(self, options, stop):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                try:
+                    taken = process_webhook_events(options['batch'])
+                except Exception as ex:
+                    self.stderr.write(f"Error processing webhook events: {ex}")
+                    taken = 0
+                if not taken:
+                    if options['once']:
+                        return
+                    time.sleep(options['sleep'])
+        finally:
+            connection.close()
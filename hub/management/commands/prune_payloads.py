@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from hub.models import MessageLog, WebhookEvent
+from hub.payloads import get_segment_store, payload_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Enforce raw payload retention: clear MessageLog.raw, delete old processed "
+        "webhook events and remove expired payload segments"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, required=False,
+                            help="Raw payload retention in days (default: TELEGRAM_PAYLOADS['RETENTION_DAYS'])")
+        parser.add_argument('--event-days', type=int, required=False,
+                            help="Processed webhook event retention in days "
+                                 "(default: TELEGRAM_PAYLOADS['WEBHOOK_EVENT_RETENTION_DAYS'])")
+        parser.add_argument('--batch', type=int, default=5000, help='Rows per UPDATE/DELETE statement')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        conf = payload_settings()
+        now = timezone.now()
+        days = conf['RETENTION_DAYS'] if options.get('days') is None else options['days']
+        event_days = conf['WEBHOOK_EVENT_RETENTION_DAYS'] if options.get('event_days') is None else options['event_days']
+        batch = max(1, options['batch'])
+        pause = options['pause']
+
+        cutoff = now - timedelta(days=days)
+        cleared = self.in_batches(
+            MessageLog.objects.filter(received_at__lt=cutoff, raw__isnull=False),
+            lambda qs: qs.update(raw=None), batch, pause,
+        )
+        self.stdout.write(f"MessageLog: cleared raw payload on {cleared} rows older than {days} days")
+
+        # Failed events are kept for inspection until they are resolved by hand
+        event_cutoff = now - timedelta(days=event_days)
+        deleted = self.in_batches(
+            WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PROCESSED, created_at__lt=event_cutoff),
+            lambda qs: qs.delete()[0], batch, pause,
+        )
+        self.stdout.write(f"WebhookEvent: deleted {deleted} processed events older than {event_days} days")
+
+        removed = get_segment_store().prune(cutoff.date())
+        self.stdout.write(self.style.SUCCESS(f"Payload segments: removed {removed} day(s) older than {days} days"))
+
+    def in_batches(self, queryset, apply, batch, pause) -> int:
+        """Apply ``apply`` to ``queryset`` ``batch`` primary keys at a time; returns rows affected."""
+        model = queryset.model
+        total = 0
+        while True:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch])
+            if not ids:
+                return total
+            total += apply(model.objects.filter(pk__in=ids))
+            if pause:
+                time.sleep(pause)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from hub.models import Poll, PollTally
+from hub.polls import count_poll_votes, rebuild_poll_tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild PollTally counters and Poll.response_count from PollResponse and PollVote rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', action='append', help='Poll id (repeatable; default: all polls)')
+        parser.add_argument('--candidate', required=False, help='Only polls of this candidate id')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        polls = Poll.objects.order_by('created_at')
+        if options.get('poll'):
+            polls = polls.filter(pk__in=options['poll'])
+        if options.get('candidate'):
+            polls = polls.filter(candidate_id=options['candidate'])
+        try:
+            rows = list(polls.values_list('pk', 'title', 'response_count'))
+        except Exception as ex:
+            raise CommandError(f"Invalid poll or candidate id: {ex}")
+
+        drifted = 0
+        for poll_id, title, response_count in rows:
+            current = dict(PollTally.objects.filter(poll_id=poll_id, votes__gt=0).values_list('option_index', 'votes'))
+            if options.get('dry_run'):
+                counts, respondents = count_poll_votes(poll_id)
+            else:
+                counts, respondents = rebuild_poll_tallies(poll_id)
+            if current != counts or response_count != respondents:
+                drifted += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{title} ({poll_id}): respondents {response_count} -> {respondents}, "
+                    f"options {dict(sorted(current.items()))} -> {dict(sorted(counts.items()))}"
+                ))
+
+        verb = 'would be rebuilt' if options.get('dry_run') else 'rebuilt'
+        self.stdout.write(self.style.SUCCESS(f"{len(rows)} polls checked, {drifted} {verb}"))
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import socket
+import time
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from hub.broadcast import claim_broadcast_job, run_broadcast_job
+
+
+class Command(BaseCommand):
+    help = "Process queued broadcast jobs, resuming any whose worker stopped heartbeating"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--sleep', type=int, default=2, help='Sleep between polls when the queue is empty')
+        parser.add_argument('--worker', required=False, help='Worker name (default: host:pid)')
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help='Send with the asyncio/httpx engine instead of threads')
+        parser.add_argument('--jobs', type=int, default=4,
+                            help='With --async: number of jobs (bots) to run concurrently on one event loop')
+
+    def handle(self, *args, **options):
+        worker = options.get('worker') or f"{socket.gethostname()}:{os.getpid()}"
+        sleep_sec = options.get('sleep')
+
+        self.stdout.write(self.style.SUCCESS(f"Broadcast worker {worker} started"))
+        if options.get('use_async'):
+            try:
+                import httpx  # noqa: F401
+            except ImportError:
+                raise CommandError('--async requires httpx. Install with: pip install httpx')
+            try:
+                asyncio.run(self.serve_async(worker, max(1, options['jobs']), sleep_sec, options.get('once')))
+            except ImproperlyConfigured as ex:
+                raise CommandError(str(ex))
+            return
+
+        while True:
+            job = claim_broadcast_job(worker)
+            if job is None:
+                if options.get('once'):
+                    break
+                time.sleep(sleep_sec)
+                continue
+
+            self.stdout.write(f"Job {job.id}: {job.action} via {job.bot.name} (cursor={job.cursor})")
+            job = run_broadcast_job(job)
+            self.report(job)
+
+    async def serve_async(self, worker, max_jobs, sleep_sec, once):
+        from hub.async_broadcast import run_broadcast_job_async
+
+        running = set()
+        while True:
+            while len(running) < max_jobs:
+                job = await sync_to_async(claim_broadcast_job)(worker)
+                if job is None:
+                    break
+                self.stdout.write(f"Job {job.id}: {job.action} (cursor={job.cursor})")
+                running.add(asyncio.create_task(run_broadcast_job_async(job)))
+
+            if not running:
+                if once:
+                    return
+                await asyncio.sleep(sleep_sec)
+                continue
+
+            done, running = await asyncio.wait(running, timeout=sleep_sec, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                self.report(task.result())
+
+    def report(self, job):
+        self.stdout.write(self.style.SUCCESS(
+            f"Job {job.id} {job.status}: sent={job.sent_count} failed={job.failed_count}"
+        ))
@@ -0,0 +1,32 @@
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand
+from hub.reports import claim_report_job, run_report_job
+
+
+class Command(BaseCommand):
+    help = "Generate queued report exports into MEDIA_ROOT/reports/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--sleep', type=int, default=2, help='Sleep between polls when the queue is empty')
+        parser.add_argument('--worker', required=False, help='Worker name (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker = options.get('worker') or f"{socket.gethostname()}:{os.getpid()}"
+        sleep_sec = options.get('sleep')
+
+        self.stdout.write(self.style.SUCCESS(f"Report worker {worker} started"))
+        while True:
+            job = claim_report_job(worker)
+            if job is None:
+                if options.get('once'):
+                    break
+                time.sleep(sleep_sec)
+                continue
+
+            self.stdout.write(f"Job {job.id}: {job.kind} {job.params}")
+            job = run_report_job(job)
+            style = self.style.SUCCESS if job.status == job.STATUS_COMPLETED else self.style.WARNING
+            self.stdout.write(style(f"Job {job.id} {job.status}: rows={job.rows}" + (f" ({job.error})" if job.error else '')))
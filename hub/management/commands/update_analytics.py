@@ -1,13 +1,18 @@
 """
-Management command to update campaign analytics
+Management command to check campaign analytics and record the daily snapshot
+
+The CampaignAnalytics counters are kept up to date by signals
+(hub/counters.py); run this periodically (e.g. nightly) to recount them
+from the tables, report and fix any drift, and store the day's snapshot.
 """
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from hub.models import Candidate, CampaignAnalytics
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from hub.counters import COUNTERS, rebuild_counters, recount, record_snapshots
+from hub.models import CampaignAnalytics, Candidate
 
 
 class Command(BaseCommand):
-    help = 'Update campaign analytics for all candidates'
+    help = 'Recount campaign analytics counters, fix drift and record the daily snapshot'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -15,46 +20,44 @@ class Command(BaseCommand):
             type=str,
             help='Update analytics only for specific candidate ID',
         )
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+        parser.add_argument('--no-snapshot', action='store_true', help='Skip recording the daily snapshot')
+        parser.add_argument('--date', type=str, help='Snapshot date as YYYY-MM-DD (default: today)')
 
     def handle(self, *args, **options):
-        self.stdout.write('Updating campaign analytics...')
-        
-        candidates = Candidate.objects.filter(is_active=True)
+        day = None
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError('--date must be YYYY-MM-DD')
+
+        candidates = Candidate.objects.order_by('created_at')
         if options['candidate_id']:
             candidates = candidates.filter(id=options['candidate_id'])
-        
-        for candidate in candidates:
-            self.update_candidate_analytics(candidate)
-        
-        self.stdout.write(
-            self.style.SUCCESS('Campaign analytics updated successfully')
-        )
+        try:
+            rows = list(candidates.values_list('pk', 'name'))
+        except Exception as ex:
+            raise CommandError(f"Invalid candidate id: {ex}")
 
-    def update_candidate_analytics(self, candidate):
-        """Update analytics for a specific candidate"""
-        self.stdout.write(f'Updating analytics for {candidate.name}...')
-        
-        # Get or create analytics record
-        analytics, created = CampaignAnalytics.objects.get_or_create(
-            candidate=candidate
-        )
-        
-        # Update counts
-        analytics.total_supporters = candidate.supporters.count()
-        analytics.total_volunteers = candidate.volunteers.filter(is_active=True).count()
-        analytics.total_events = candidate.events.count()
-        analytics.total_polls = candidate.polls.count()
-        analytics.total_speeches = candidate.speeches.count()
-        analytics.total_fake_news_alerts = candidate.fake_news_alerts.count()
-        analytics.last_updated = timezone.now()
-        
-        analytics.save()
-        
-        self.stdout.write(
-            f'  Supporters: {analytics.total_supporters}, '
-            f'Volunteers: {analytics.total_volunteers}, '
-            f'Events: {analytics.total_events}, '
-            f'Polls: {analytics.total_polls}, '
-            f'Speeches: {analytics.total_speeches}, '
-            f'Fake News Alerts: {analytics.total_fake_news_alerts}'
-        )
+        drifted = 0
+        for candidate_id, name in rows:
+            if options['dry_run']:
+                analytics = CampaignAnalytics.objects.filter(candidate_id=candidate_id).first()
+                after = recount(candidate_id)
+                before = {counter.field: getattr(analytics, counter.field, 0) for counter in COUNTERS}
+            else:
+                before, after = rebuild_counters(candidate_id)
+            if before != after:
+                drifted += 1
+                changes = ', '.join(
+                    f"{field} {before[field]} -> {after[field]}" for field in after if before[field] != after[field]
+                )
+                self.stdout.write(self.style.WARNING(f"{name} ({candidate_id}): {changes}"))
+
+        verb = 'would be corrected' if options['dry_run'] else 'corrected'
+        self.stdout.write(self.style.SUCCESS(f"{len(rows)} candidates checked, {drifted} {verb}"))
+
+        if not (options['dry_run'] or options['no_snapshot']):
+            candidate_ids = [candidate_id for candidate_id, _ in rows] if options['candidate_id'] else None
+            written = record_snapshots(day, candidate_ids)
+            self.stdout.write(self.style.SUCCESS(f"{written} analytics snapshots recorded"))
@@ -0,0 +1,107 @@
+"""
+Filtering and keyset pagination of MessageLogs for the log viewer.
+
+Pages are ordered newest first on ``(received_at, id)`` and continue from an
+opaque cursor holding the last row's key, so every page is a range scan on
+the ``(bot, received_at)`` index no matter how deep the reader has scrolled;
+no OFFSET or COUNT is ever issued.
+"""
+import base64
+import json
+from datetime import datetime, time
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import MessageLog
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+PAGE_FIELDS = ('id', 'received_at', 'chat_id', 'message_id', 'text', 'bot_user__phone_number')
+
+
+class InvalidLogQuery(ValueError):
+    """A filter or cursor parameter could not be parsed."""
+
+
+def can_view_bot(user, bot) -> bool:
+    """Superusers, the candidate owning the bot, and the legacy bot 2 fallback."""
+    if user.is_superuser:
+        return True
+    candidate_profile = getattr(user, 'candidate_profile', None)
+    if candidate_profile and candidate_profile.candidate and candidate_profile.candidate.bot_id:
+        return candidate_profile.candidate.bot_id == bot.id
+    return bot.id == 2
+
+
+def _day_bound(value: str, name: str, end: bool = False) -> datetime:
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise InvalidLogQuery(f"{name} must be YYYY-MM-DD")
+    return timezone.make_aware(datetime.combine(day, time.max if end else time.min))
+
+
+def filter_message_logs(bot, params) -> QuerySet:
+    """MessageLogs of ``bot`` narrowed by the viewer's query parameters.
+
+    Supported: ``chat_id``, ``date_from`` / ``date_to`` (inclusive days, in
+    the project time zone) and ``has_phone`` (``1`` / ``0``).
+    """
+    qs = MessageLog.objects.filter(bot=bot)
+    chat_id = (params.get('chat_id') or '').strip()
+    if chat_id:
+        try:
+            qs = qs.filter(chat_id=int(chat_id))
+        except ValueError:
+            raise InvalidLogQuery('chat_id must be an integer')
+    date_from = (params.get('date_from') or '').strip()
+    if date_from:
+        qs = qs.filter(received_at__gte=_day_bound(date_from, 'date_from'))
+    date_to = (params.get('date_to') or '').strip()
+    if date_to:
+        qs = qs.filter(received_at__lte=_day_bound(date_to, 'date_to', end=True))
+    has_phone = (params.get('has_phone') or '').strip()
+    if has_phone in ('1', 'true'):
+        qs = qs.filter(bot_user__phone_number__gt='')
+    elif has_phone in ('0', 'false'):
+        qs = qs.filter(Q(bot_user__isnull=True) | Q(bot_user__phone_number__isnull=True) | Q(bot_user__phone_number=''))
+    return qs
+
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row['received_at'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        received_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        parsed = parse_datetime(received_at)
+        if parsed is None:
+            raise ValueError(received_at)
+        return parsed, int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidLogQuery('invalid cursor')
+
+
+def message_log_page(queryset, cursor: str | None = None, limit: int = PAGE_SIZE) -> tuple:
+    """Return ``(rows, next_cursor)`` for the page after ``cursor``.
+
+    Rows are dicts with ``PAGE_FIELDS``; ``next_cursor`` is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if cursor:
+        received_at, row_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(received_at__lt=received_at) | Q(received_at=received_at, id__lt=row_id)
+        )
+    # One extra row tells whether another page exists without a COUNT
+    rows = list(queryset.order_by('-received_at', '-id').values(*PAGE_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0022_broadcastjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='last_update_id',
+            field=models.BigIntegerField(blank=True, help_text='Last getUpdates update_id processed by the poller', null=True),
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='update_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookevent',
+            name='update_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='webhookevent',
+            unique_together={('bot', 'update_id')},
+        ),
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['bot', 'update_id'], name='hub_message_bot_id_c80256_idx'),
+        ),
+    ]
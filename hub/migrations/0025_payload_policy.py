@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0024_webhookevent_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messagelog',
+            name='raw',
+            field=models.JSONField(blank=True, help_text="Only kept when TELEGRAM_PAYLOADS['POLICY'] is 'inline'", null=True),
+        ),
+        migrations.AlterField(
+            model_name='webhookevent',
+            name='payload',
+            field=models.JSONField(blank=True, help_text="Dropped once processed unless TELEGRAM_PAYLOADS['POLICY'] is 'inline'", null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Placeholder for log partitioning; the schema is unchanged.
+
+    Rebuilding hub_messagelog and hub_sendlog as partitioned tables copies
+    every row under an exclusive lock, so it is not done while migrating.
+    Run ``manage_partitions --convert`` in a maintenance window instead
+    (see hub/partitions.py).
+    """
+
+    dependencies = [
+        ('hub', '0025_payload_policy'),
+    ]
+
+    operations = []
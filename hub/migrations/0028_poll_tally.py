@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:45
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_tallies(apps, schema_editor):
+    Poll = apps.get_model('hub', 'Poll')
+    PollResponse = apps.get_model('hub', 'PollResponse')
+    PollVote = apps.get_model('hub', 'PollVote')
+    PollTally = apps.get_model('hub', 'PollTally')
+
+    votes, respondents = defaultdict(int), defaultdict(int)
+    for poll_id, selected in PollResponse.objects.values_list('poll_id', 'selected_options').iterator():
+        respondents[poll_id] += 1
+        if isinstance(selected, list):
+            for index in {i for i in selected if isinstance(i, int) and not isinstance(i, bool) and i >= 0}:
+                votes[poll_id, index] += 1
+    for poll_id, index in PollVote.objects.values_list('poll_id', 'option_index').iterator():
+        respondents[poll_id] += 1
+        votes[poll_id, index] += 1
+
+    PollTally.objects.bulk_create(
+        [PollTally(poll_id=poll_id, option_index=index, votes=count) for (poll_id, index), count in votes.items()],
+        batch_size=1000,
+    )
+    for poll_id, count in respondents.items():
+        Poll.objects.filter(pk=poll_id).update(response_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0027_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PollTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('option_index', models.PositiveIntegerField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='hub.poll')),
+            ],
+            options={
+                'unique_together': {('poll', 'option_index')},
+            },
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:53
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Candidate = apps.get_model('hub', 'Candidate')
+    CampaignAnalytics = apps.get_model('hub', 'CampaignAnalytics')
+    Event = apps.get_model('hub', 'Event')
+    Supporter = apps.get_model('hub', 'Supporter')
+
+    supporters = dict(Supporter.objects.values_list('candidate_id').annotate(n=Count('id')).order_by())
+    public_events = dict(
+        Event.objects.filter(is_public=True).values_list('candidate_id').annotate(n=Count('id')).order_by()
+    )
+    for candidate_id in Candidate.objects.values_list('id', flat=True):
+        CampaignAnalytics.objects.update_or_create(
+            candidate_id=candidate_id,
+            defaults={
+                'total_supporters': supporters.get(candidate_id, 0),
+                'total_public_events': public_events.get(candidate_id, 0),
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0028_poll_tally'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaignanalytics',
+            name='total_public_events',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+# column -> (model, conditions), as in hub/counters.py at the time of writing
+COUNTERS = {
+    'total_volunteers': ('Volunteer', {'is_active': True}),
+    'total_events': ('Event', {}),
+    'total_polls': ('Poll', {}),
+    'total_speeches': ('Speech', {}),
+    'total_fake_news_alerts': ('FakeNewsAlert', {}),
+}
+
+
+def backfill_counters(apps, schema_editor):
+    # These columns were only refreshed by update_analytics or an API read;
+    # recount them so the signal-maintained counters start out right.
+    Candidate = apps.get_model('hub', 'Candidate')
+    CampaignAnalytics = apps.get_model('hub', 'CampaignAnalytics')
+    totals = {}
+    for field, (model_name, conditions) in COUNTERS.items():
+        rows = apps.get_model('hub', model_name).objects.filter(**conditions)
+        totals[field] = dict(rows.values_list('candidate_id').annotate(n=Count('id')).order_by())
+    for candidate_id in Candidate.objects.values_list('id', flat=True):
+        CampaignAnalytics.objects.update_or_create(
+            candidate_id=candidate_id,
+            defaults={field: counts.get(candidate_id, 0) for field, counts in totals.items()},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0029_campaign_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignAnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_supporters', models.PositiveIntegerField(default=0)),
+                ('total_volunteers', models.PositiveIntegerField(default=0)),
+                ('total_events', models.PositiveIntegerField(default=0)),
+                ('total_public_events', models.PositiveIntegerField(default=0)),
+                ('total_polls', models.PositiveIntegerField(default=0)),
+                ('total_speeches', models.PositiveIntegerField(default=0)),
+                ('total_fake_news_alerts', models.PositiveIntegerField(default=0)),
+                ('recorded_at', models.DateTimeField(auto_now=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_snapshots', to='hub.candidate')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('candidate', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
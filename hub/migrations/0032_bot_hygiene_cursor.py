@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hub', '0031_reportjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bot',
+            name='hygiene_cursor',
+            field=models.BigIntegerField(blank=True, help_text='Last telegram_id checked by audience_hygiene', null=True),
+        ),
+    ]
@@ -13,6 +13,8 @@ class Bot(models.Model):
     description = models.TextField(blank=True, null=True)
     image_url = models.URLField(blank=True, null=True)
     bot_link = models.URLField(blank=True, null=True, help_text="Direct link to the Telegram bot (e.g., https://t.me/your_bot)")
+    last_update_id = models.BigIntegerField(blank=True, null=True, help_text="Last getUpdates update_id processed by the poller")
+    hygiene_cursor = models.BigIntegerField(blank=True, null=True, help_text="Last telegram_id checked by audience_hygiene")
 
     def __str__(self) -> str:
         return f"{self.name}"
@@ -129,12 +131,129 @@ class SendLog(models.Model):
         campaign_name = self.campaign.name if self.campaign else "Ad-hoc"
         return f"{campaign_name} -> {self.bot_user} [{self.status}]"
 
+
+class BroadcastJob(models.Model):
+    """A broadcast queued for a background worker (see run_broadcast_jobs).
+
+    Recipients are processed in ascending telegram_id order; ``cursor`` holds
+    the last telegram_id whose send has been acknowledged and checkpointed, so
+    a crashed job resumes after it instead of re-sending to everyone.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CANCELLED = "cancelled"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_CANCELLED, "Cancelled"),
+    )
+
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name="broadcast_jobs")
+    action = models.CharField(max_length=20, default="text")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    cursor = models.BigIntegerField(blank=True, null=True)
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_by = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["created_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.bot.name} {self.action} broadcast #{self.pk} [{self.status}]"
+
+
+class ReportJob(models.Model):
+    """An export generated by a background worker (see run_report_jobs).
+
+    ``fingerprint`` identifies the export and the state of the data it was
+    built from; a completed job with the same fingerprint is handed out
+    again instead of generating a new file.
+    """
+    KIND_MESSAGE_LOGS_PDF = "message_logs_pdf"
+    KIND_SUPPORTERS_JSON = "supporters_json"
+    KIND_CHOICES = (
+        (KIND_MESSAGE_LOGS_PDF, "Message logs (PDF)"),
+        (KIND_SUPPORTERS_JSON, "Supporters (JSON)"),
+    )
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    kind = models.CharField(max_length=40, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    file = models.FileField(upload_to="reports/", blank=True, null=True)
+    rows = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_by = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["created_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["kind", "fingerprint"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} report #{self.pk} [{self.status}]"
+
+
 class WebhookEvent(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSED = "processed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSED, "Processed"),
+        (STATUS_FAILED, "Failed"),
+    )
+
     bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name="webhook_events")
+    update_id = models.BigIntegerField(blank=True, null=True)
     event_type = models.CharField(max_length=100)
-    payload = models.JSONField()
+    payload = models.JSONField(blank=True, null=True, help_text="Dropped once processed unless TELEGRAM_PAYLOADS['POLICY'] is 'inline'")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ("bot", "update_id")
+        indexes = [
+            models.Index(fields=["status", "id"]),
+        ]
+
     def __str__(self) -> str:
         return f"{self.bot.name} {self.event_type}"
 
@@ -146,13 +265,15 @@ class MessageLog(models.Model):
     chat_id = models.BigIntegerField()
     from_user_id = models.BigIntegerField(blank=True, null=True)
     text = models.TextField(blank=True, null=True)
-    raw = models.JSONField()
+    raw = models.JSONField(blank=True, null=True, help_text="Only kept when TELEGRAM_PAYLOADS['POLICY'] is 'inline'")
+    update_id = models.BigIntegerField(blank=True, null=True)
     received_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
             models.Index(fields=["bot", "chat_id"]),
             models.Index(fields=["bot", "received_at"]),
+            models.Index(fields=["bot", "update_id"]),
         ]
 
     def __str__(self) -> str:
@@ -401,6 +522,8 @@ class Poll(models.Model):
     allows_multiple_answers = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     expires_at = models.DateTimeField(blank=True, null=True)
+    # Respondents (PollResponse + PollVote rows); maintained with PollTally, see hub/polls.py
+    response_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -444,6 +567,25 @@ class PollVote(models.Model):
     def __str__(self):
         return f"Vote for {self.poll.title} from {self.user_ip} (opt {self.option_index})"
 
+
+class PollTally(models.Model):
+    """Running vote count for one poll option.
+
+    Incremented with F() expressions whenever a vote is recorded (see
+    hub/polls.py); ``manage.py reconcile_poll_tallies`` rebuilds it from
+    PollResponse and PollVote rows.
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='tallies')
+    option_index = models.PositiveIntegerField()
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['poll', 'option_index']
+
+    def __str__(self):
+        return f"{self.poll.title} option {self.option_index}: {self.votes}"
+
+
 class Supporter(models.Model):
     """Voter supporters with location data"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -603,11 +745,16 @@ class Question(models.Model):
         return f"{self.asker_name} – {self.candidate.name}"
 
 class CampaignAnalytics(models.Model):
-    """Analytics and metrics for campaigns"""
+    """Analytics and metrics for campaigns
+
+    Every ``total_*`` column is a running counter kept by hub/counters.py,
+    so reading the row never counts the underlying tables.
+    """
     candidate = models.OneToOneField(Candidate, on_delete=models.CASCADE, related_name='analytics')
     total_supporters = models.PositiveIntegerField(default=0)
     total_volunteers = models.PositiveIntegerField(default=0)
     total_events = models.PositiveIntegerField(default=0)
+    total_public_events = models.PositiveIntegerField(default=0)
     total_polls = models.PositiveIntegerField(default=0)
     total_speeches = models.PositiveIntegerField(default=0)
     total_fake_news_alerts = models.PositiveIntegerField(default=0)
@@ -617,6 +764,27 @@ class CampaignAnalytics(models.Model):
         return f"Analytics for {self.candidate.name}"
 
 
+class CampaignAnalyticsSnapshot(models.Model):
+    """CampaignAnalytics counters as they stood on a given day, for trend charts"""
+    candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name='analytics_snapshots')
+    date = models.DateField()
+    total_supporters = models.PositiveIntegerField(default=0)
+    total_volunteers = models.PositiveIntegerField(default=0)
+    total_events = models.PositiveIntegerField(default=0)
+    total_public_events = models.PositiveIntegerField(default=0)
+    total_polls = models.PositiveIntegerField(default=0)
+    total_speeches = models.PositiveIntegerField(default=0)
+    total_fake_news_alerts = models.PositiveIntegerField(default=0)
+    recorded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['candidate', 'date']
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Analytics for {self.candidate.name} on {self.date}"
+
+
 # ===== PUBLIC CONTACT/LEADS =====
 class ContactMessage(models.Model):
     """Lead/contact message submitted from public landing pages."""
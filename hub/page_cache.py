@@ -0,0 +1,120 @@
+"""
+Full-page cache for the public pages, for anonymous GETs only.
+
+``@cache_public_page(version)`` stores the rendered response in the
+``HUB_CACHE['LANDING_CACHE_ALIAS']`` cache under the request path and a
+*version token* computed by ``version(request, *args, **kwargs)`` -- for a
+candidate page the landing version of hub/landing.py, which signals move
+whenever the page's rows change. A new token means a new key, so stale
+pages are never served and simply expire. Figures that are not versioned
+(supporter counts, poll results) may lag by up to ``PAGE_CACHE_TTL``
+seconds, like the landing counts do.
+
+Each stored page carries a strong ETag (a hash of the version token and
+the body) and the time it was rendered as Last-Modified, so conditional
+requests are answered with 304. Cached responses are sent with
+``Cache-Control: public, max-age=PAGE_CACHE_MAX_AGE`` and ``Vary: Cookie``
+so a CDN or reverse proxy can serve them too.
+
+The cache is bypassed for anything but GET/HEAD, for requests carrying a
+session or messages cookie or an Authorization header, and for signed-in
+users; those GET responses are marked ``Cache-Control: private``. A page
+that rendered a CSRF token is not stored, since the token would be wrong
+for every other visitor. Views that are already csrf_exempt (the candidate
+landing forms) are the exception; apply the decorator *above*
+``@csrf_exempt`` so it can see the flag. Don't make a form csrf_exempt just
+to get it cached -- leave that page uncached instead.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .cache import cache_settings
+from .landing import landing_cache
+
+
+def is_anonymous_request(request) -> bool:
+    """True when the response to ``request`` can be shared between visitors."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if 'HTTP_AUTHORIZATION' in request.META:
+        return False
+    # A session may hold a login or flash messages; either makes the page personal
+    if settings.SESSION_COOKIE_NAME in request.COOKIES or CookieStorage.cookie_name in request.COOKIES:
+        return False
+    user = getattr(request, 'user', None)
+    return not (user is not None and user.is_authenticated)
+
+
+def _page_key(request, version: str) -> str:
+    raw = f"{request.get_full_path()}\n{version}"
+    return f"hub:page:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+def _storable(request, response, csrf_exempt: bool) -> bool:
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if response.has_header('Cache-Control'):
+        return False
+    return csrf_exempt or not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+
+
+def _cached_response(request, entry: dict, max_age: int) -> HttpResponse:
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_public_page(version=None):
+    """Serve anonymous GETs of the decorated view from the page cache.
+
+    ``version`` returns the token the page depends on, or None to skip the
+    cache for this request (e.g. an unknown candidate). Without it the page
+    is keyed on its path alone and refreshed every ``PAGE_CACHE_TTL``.
+    """
+    def decorator(view_func):
+        csrf_exempt = getattr(view_func, 'csrf_exempt', False)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not is_anonymous_request(request):
+                response = view_func(request, *args, **kwargs)
+                if request.method in ('GET', 'HEAD'):
+                    patch_cache_control(response, private=True)
+                    patch_vary_headers(response, ('Cookie',))
+                return response
+
+            token = version(request, *args, **kwargs) if version is not None else ''
+            if token is None:
+                return view_func(request, *args, **kwargs)
+
+            conf = cache_settings()
+            cache = landing_cache()
+            key = _page_key(request, token)
+            entry = cache.get(key)
+            if entry is None:
+                response = view_func(request, *args, **kwargs)
+                if not _storable(request, response, csrf_exempt):
+                    return response
+                content = response.content
+                entry = {
+                    'content': content,
+                    'content_type': response['Content-Type'],
+                    'etag': '"%s"' % hashlib.sha256(token.encode('utf-8') + b'\n' + content).hexdigest()[:32],
+                    'last_modified': int(timezone.now().timestamp()),
+                }
+                cache.set(key, entry, conf['PAGE_CACHE_TTL'])
+            return _cached_response(request, entry, conf['PAGE_CACHE_MAX_AGE'])
+        return wrapper
+    return decorator
@@ -0,0 +1,228 @@
+"""
+Monthly range partitioning of the log tables (PostgreSQL only).
+
+``MessageLog`` is partitioned on ``received_at`` and ``SendLog`` on
+``created_at``, one partition per calendar month (UTC) plus a default
+partition that catches rows outside the created ranges. Recent-window
+queries only touch the newest partitions, and expiring history is a
+``DROP``/``DETACH`` instead of a bulk ``DELETE`` followed by vacuum.
+
+Django keeps treating ``id`` as the primary key; in the database the key is
+``(id, <partition column>)`` because PostgreSQL requires the partition
+column in every unique constraint. Nothing references these tables by
+foreign key, and ids still come from a single sequence, so they
+stay unique.
+
+On other databases (SQLite in development) every function here is a no-op
+and the tables stay plain. Converting existing tables is an explicit step,
+``manage_partitions --convert``, because it rewrites them; after that the
+daily ``manage_partitions`` run creates future partitions and expires old
+ones.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+# table -> partition column
+PARTITIONED_TABLES = {
+    'hub_messagelog': 'received_at',
+    'hub_sendlog': 'created_at',
+}
+
+DEFAULT_PARTITION_SETTINGS = {
+    'MONTHS_AHEAD': 3,
+    'RETENTION_MONTHS': {
+        'hub_messagelog': 12,
+        'hub_sendlog': 6,
+    },
+}
+
+
+def partition_settings() -> dict:
+    """Return LOG_PARTITIONS settings merged over the defaults."""
+    merged = dict(DEFAULT_PARTITION_SETTINGS)
+    merged.update(getattr(settings, 'LOG_PARTITIONS', {}) or {})
+    return merged
+
+
+def supported(connection) -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def _bound(month: date) -> str:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def is_partitioned(connection, table: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection, table: str) -> dict:
+    """Return ``{month: partition name}`` for the monthly partitions of ``table``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = {}
+    prefix = f"{table}_y"
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        suffix = name[len(prefix):]
+        try:
+            months[date(int(suffix[:4]), int(suffix[5:7]), 1)] = name
+        except ValueError:
+            continue
+    return months
+
+
+def create_partition(connection, table: str, month: date) -> str | None:
+    """Create the partition for ``month`` unless it exists; returns its name if created.
+
+    Rows of that month already sitting in the default partition are moved
+    into the new partition first, since PostgreSQL refuses to attach a
+    range the default partition still holds rows for.
+    """
+    name = partition_name(table, month)
+    if month in list_partitions(connection, table):
+        return None
+    column = PARTITIONED_TABLES[table]
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(table + '_default')} WHERE {qn(column)} >= %s AND {qn(column)} < %s "
+            f"RETURNING *) INSERT INTO {qn(name)} SELECT * FROM moved",
+            [lower, upper],
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+                       [lower, upper])
+    return name
+
+
+def ensure_partitions(connection, months_ahead: int | None = None, today: date | None = None) -> list:
+    """Create partitions from the current month through ``months_ahead``; returns the names created."""
+    if not supported(connection):
+        return []
+    if months_ahead is None:
+        months_ahead = int(partition_settings()['MONTHS_AHEAD'])
+    current = month_start(today or datetime.now(dt_timezone.utc).date())
+    created = []
+    for table in PARTITIONED_TABLES:
+        for offset in range(months_ahead + 1):
+            name = create_partition(connection, table, add_months(current, offset))
+            if name:
+                created.append(name)
+    return created
+
+
+def expire_partitions(connection, table: str, retention_months: int, archive: bool = False,
+                      today: date | None = None, dry_run: bool = False) -> list:
+    """Drop (or with ``archive`` detach) monthly partitions older than ``retention_months``.
+
+    A detached partition stays in the database as an ordinary table with the
+    same name, out of the way of queries, until it is dumped and dropped.
+    """
+    if not supported(connection):
+        return []
+    oldest_kept = add_months(month_start(today or datetime.now(dt_timezone.utc).date()), -int(retention_months))
+    expired = [name for month, name in sorted(list_partitions(connection, table).items()) if month < oldest_kept]
+    if dry_run:
+        return expired
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for name in expired:
+            if archive:
+                cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+            else:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+    return expired
+
+
+def convert_to_partitioned(connection, table: str) -> None:
+    """Rebuild ``table`` as a monthly range-partitioned table, keeping its rows.
+
+    Index and foreign key definitions are copied from the old table and ids
+    continue from the old maximum. Call it inside a transaction: the table
+    is locked ACCESS EXCLUSIVE from the rename until commit, so writers
+    (the poller, webhooks, broadcasts) block for the whole copy.
+    """
+    if is_partitioned(connection, table):
+        return
+    column = PARTITIONED_TABLES[table]
+    qn = connection.ops.quote_name
+    legacy = f"{table}_legacy"
+    sequence = f"{table}_id_seq"
+    with connection.cursor() as cursor:
+        # Django's foreign keys are deferred; checks still queued from earlier
+        # writes in this transaction would otherwise block dropping the old table.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+            [table, table],
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT min({qn(column)}), max(id) FROM {qn(table)}")
+        first_row_at, max_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE ({qn(column)})"
+        )
+        # The old id default (serial) belongs to the legacy table; a new
+        # sequence is attached once that is gone.
+        cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id DROP DEFAULT")
+        cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+
+    if first_row_at is not None:
+        month = month_start(first_row_at.astimezone(dt_timezone.utc).date())
+        current = month_start(datetime.now(dt_timezone.utc).date())
+        while month <= current:
+            create_partition(connection, table, month)
+            month = add_months(month, 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {qn(table)} SELECT * FROM {qn(legacy)}")
+        cursor.execute(f"DROP TABLE {qn(legacy)}")
+
+        # Sequence, primary key, indexes and foreign keys get their original
+        # names back, so later migrations and sqlsequencereset keep working.
+        cursor.execute(f"CREATE SEQUENCE {qn(sequence)} START WITH {int(max_id or 0) + 1}")
+        cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)", [sequence])
+        cursor.execute(f"ALTER SEQUENCE {qn(sequence)} OWNED BY {qn(table)}.id")
+        cursor.execute(f"ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, {qn(column)})")
+        for index_def in index_defs:
+            cursor.execute(index_def)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
@@ -0,0 +1,161 @@
+"""
+Raw Telegram payload storage policy.
+
+Only the extracted columns of an update (chat, sender, text, ids) live in
+the hot tables. What happens to the raw JSON is set by
+``TELEGRAM_PAYLOADS['POLICY']``:
+
+* ``off``        -- raw payloads are dropped once applied.
+* ``sampled``    -- a ``SAMPLE_RATE`` fraction of updates is archived.
+* ``compressed`` -- every update is archived.
+* ``inline``     -- the old behaviour: the message is kept in
+  ``MessageLog.raw``.
+
+Archived updates go to an append-only segment store on disk: gzip-compressed
+JSON lines under ``SEGMENT_DIR/<YYYY-MM-DD>/``, one file per process, so
+writers never share a file. With every policy except ``inline`` the
+webhook queue drops ``WebhookEvent.payload`` once the event is processed.
+``manage.py prune_payloads`` enforces ``RETENTION_DAYS`` in batches.
+"""
+import gzip
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+from datetime import date
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+POLICY_OFF = 'off'
+POLICY_SAMPLED = 'sampled'
+POLICY_COMPRESSED = 'compressed'
+POLICY_INLINE = 'inline'
+POLICIES = (POLICY_OFF, POLICY_SAMPLED, POLICY_COMPRESSED, POLICY_INLINE)
+
+DEFAULT_PAYLOAD_SETTINGS = {
+    'POLICY': POLICY_COMPRESSED,
+    'SAMPLE_RATE': 0.01,
+    'RETENTION_DAYS': 30,
+    'WEBHOOK_EVENT_RETENTION_DAYS': 7,
+    'SEGMENT_DIR': None,
+    'SEGMENT_MAX_BYTES': 64 * 1024 * 1024,
+}
+
+
+def payload_settings() -> dict:
+    """Return TELEGRAM_PAYLOADS settings merged over the defaults."""
+    merged = dict(DEFAULT_PAYLOAD_SETTINGS)
+    merged.update(getattr(settings, 'TELEGRAM_PAYLOADS', {}) or {})
+    if merged['POLICY'] not in POLICIES:
+        raise ImproperlyConfigured(
+            f"TELEGRAM_PAYLOADS['POLICY'] must be one of {', '.join(POLICIES)}, not {merged['POLICY']!r}"
+        )
+    if not merged['SEGMENT_DIR']:
+        merged['SEGMENT_DIR'] = os.path.join(settings.BASE_DIR, 'payload_segments')
+    return merged
+
+
+def keep_inline() -> bool:
+    """Whether raw payloads stay in MessageLog.raw / WebhookEvent.payload."""
+    return payload_settings()['POLICY'] == POLICY_INLINE
+
+
+def should_archive(conf: dict | None = None) -> bool:
+    conf = conf or payload_settings()
+    if conf['POLICY'] == POLICY_COMPRESSED:
+        return True
+    if conf['POLICY'] == POLICY_SAMPLED:
+        return random.random() < float(conf['SAMPLE_RATE'])
+    return False
+
+
+class SegmentStore:
+    """Append-only gzip JSON-lines segments, one directory per UTC day.
+
+    Each ``append`` writes its records as one gzip member, so a segment is
+    a valid multi-member gzip file after every call and can be read with
+    ``gzip.open`` while it is still growing.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = str(root)
+        self.max_bytes = int(max_bytes)
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._lock = threading.Lock()
+        self._day = None
+        self._path = None
+
+    def _segment_path(self, day: date) -> str:
+        directory = os.path.join(self.root, day.isoformat())
+        if self._day != day or self._path is None or os.path.getsize(self._path) >= self.max_bytes:
+            os.makedirs(directory, exist_ok=True)
+            seq = 0
+            while True:
+                path = os.path.join(directory, f"{self.prefix}-{seq:04d}.jsonl.gz")
+                if not os.path.exists(path) or os.path.getsize(path) < self.max_bytes:
+                    break
+                seq += 1
+            self._day, self._path = day, path
+        return self._path
+
+    def append(self, records: list) -> None:
+        if not records:
+            return
+        data = ''.join(json.dumps(record, separators=(',', ':'), default=str) + '\n' for record in records)
+        with self._lock:
+            with open(self._segment_path(timezone.now().date()), 'ab') as fh:
+                fh.write(gzip.compress(data.encode('utf-8')))
+
+    def read(self, day: date):
+        """Yield the records archived on ``day`` (UTC)."""
+        directory = os.path.join(self.root, day.isoformat())
+        if not os.path.isdir(directory):
+            return
+        for name in sorted(os.listdir(directory)):
+            with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as fh:
+                for line in fh:
+                    yield json.loads(line)
+
+    def prune(self, older_than: date) -> int:
+        """Delete day directories before ``older_than``; returns how many were removed."""
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for name in os.listdir(self.root):
+            try:
+                day = date.fromisoformat(name)
+            except ValueError:
+                continue
+            if day < older_than:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_segment_store() -> SegmentStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            conf = payload_settings()
+            _store = SegmentStore(conf['SEGMENT_DIR'], conf['SEGMENT_MAX_BYTES'])
+    return _store
+
+
+def archive_updates(bot_id: int, updates: list) -> None:
+    """Archive ``updates`` according to the policy (call after commit)."""
+    conf = payload_settings()
+    received_at = timezone.now().isoformat()
+    records = [
+        {'bot_id': bot_id, 'update_id': upd.get('update_id'), 'received_at': received_at, 'update': upd}
+        for upd in updates if should_archive(conf)
+    ]
+    get_segment_store().append(records)
+
@@ -0,0 +1,184 @@
+"""
+Poll result tallies.
+
+Results are kept as running counters: one PollTally row per (poll, option)
+plus ``Poll.response_count`` for respondents. Every code path that records
+a vote (a PollResponse from the bot or a landing page, a PollVote from the
+mobile page) calls :func:`record_vote` in the same transaction, which bumps
+the counters with ``F()`` expressions. Rendering results is then a single
+indexed read, whatever the vote volume.
+
+:func:`count_poll_votes` recomputes a poll's results from the raw rows.
+``PollResponse.selected_options`` is a JSON array of option indices, which
+is unnested in SQL and grouped:
+
+* PostgreSQL: ``jsonb_array_elements``
+* SQLite:     ``json_each``
+* others:     the responses' ``selected_options`` are streamed and counted
+  in Python.
+
+Only non-negative integer elements count, each once per response;
+responses whose value is not an array are ignored. ``manage.py
+reconcile_poll_tallies`` uses this to repair counters after edits that
+bypass record_vote (admin, deletes).
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+
+from .models import Poll, PollResponse, PollTally, PollVote
+
+_POSTGRES_SQL = """
+    SELECT r.poll_id, (e.value)::int, COUNT(DISTINCT r.id)
+    FROM {table} r
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(r.selected_options) = 'array' THEN r.selected_options ELSE '[]'::jsonb END
+    ) AS e(value)
+    WHERE r.poll_id IN ({placeholders}) AND jsonb_typeof(e.value) = 'number'
+    GROUP BY 1, 2
+"""
+
+_SQLITE_SQL = """
+    SELECT r.poll_id, e.value, COUNT(DISTINCT r.id)
+    FROM {table} r,
+         json_each(CASE WHEN json_type(r.selected_options) = 'array' THEN r.selected_options ELSE '[]' END) e
+    WHERE r.poll_id IN ({placeholders}) AND e.type = 'integer'
+    GROUP BY 1, 2
+"""
+
+
+def selected_indices(selected) -> set:
+    """The option indices a ``selected_options`` value votes for."""
+    if not isinstance(selected, list):
+        return set()
+    return {index for index in selected if isinstance(index, int) and not isinstance(index, bool) and index >= 0}
+
+
+def _sql_counts(sql: str, poll_ids: list) -> dict:
+    pk = Poll._meta.pk
+    params = [pk.get_db_prep_value(poll_id, connection) for poll_id in poll_ids]
+    query = sql.format(
+        table=connection.ops.quote_name(PollResponse._meta.db_table),
+        placeholders=', '.join(['%s'] * len(params)),
+    )
+    counts = defaultdict(dict)
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for poll_id, index, total in cursor.fetchall():
+            if int(index) >= 0:
+                counts[pk.to_python(poll_id)][int(index)] = total
+    return counts
+
+
+def _python_counts(poll_ids: list) -> dict:
+    counts = defaultdict(lambda: defaultdict(int))
+    rows = PollResponse.objects.filter(poll_id__in=poll_ids).values_list('poll_id', 'selected_options')
+    for poll_id, selected in rows.iterator(chunk_size=2000):
+        for index in selected_indices(selected):
+            counts[poll_id][index] += 1
+    return counts
+
+
+def poll_option_counts(poll_ids) -> dict:
+    """Return ``{poll_id: {option_index: votes}}`` from PollResponse rows, in one query."""
+    poll_ids = list(poll_ids)
+    if not poll_ids:
+        return {}
+    if connection.vendor == 'postgresql':
+        return _sql_counts(_POSTGRES_SQL, poll_ids)
+    if connection.vendor == 'sqlite':
+        return _sql_counts(_SQLITE_SQL, poll_ids)
+    return _python_counts(poll_ids)
+
+
+def count_poll_votes(poll_id) -> tuple:
+    """Recompute ``({option_index: votes}, respondents)`` for a poll from the raw votes."""
+    counts = defaultdict(int, poll_option_counts([poll_id]).get(poll_id, {}))
+    ip_votes = PollVote.objects.filter(poll_id=poll_id).values('option_index').annotate(total=Count('id'))
+    for row in ip_votes.order_by():
+        counts[row['option_index']] += row['total']
+    respondents = PollResponse.objects.filter(poll_id=poll_id).count() + sum(row['total'] for row in ip_votes)
+    return {index: total for index, total in counts.items() if total}, respondents
+
+
+def record_vote(poll_id, selected, previous=None) -> None:
+    """Apply one vote to the poll's counters; call inside the vote's transaction.
+
+    ``selected`` is the list of chosen option indices. When a respondent
+    changes an earlier answer, pass that answer as ``previous`` so its
+    options are decremented and the respondent is not counted twice.
+    """
+    added = selected_indices(selected)
+    removed = set()
+    respondents = 1
+    if previous is not None:
+        old = selected_indices(previous)
+        added, removed = added - old, old - added
+        respondents = 0
+    # Updating the poll row first (even by zero) serialises the vote with
+    # reconcile_poll_tallies, which recounts while holding that row lock.
+    Poll.objects.filter(pk=poll_id).update(response_count=F('response_count') + respondents)
+    if added:
+        PollTally.objects.bulk_create(
+            [PollTally(poll_id=poll_id, option_index=index) for index in added], ignore_conflicts=True,
+        )
+        PollTally.objects.filter(poll_id=poll_id, option_index__in=added).update(votes=F('votes') + 1)
+    if removed:
+        PollTally.objects.filter(poll_id=poll_id, option_index__in=removed, votes__gt=0).update(votes=F('votes') - 1)
+
+
+def rebuild_poll_tallies(poll_id) -> tuple:
+    """Replace a poll's counters with a recount; returns ``(counts, respondents)``."""
+    with transaction.atomic():
+        Poll.objects.select_for_update().filter(pk=poll_id).first()
+        counts, respondents = count_poll_votes(poll_id)
+        PollTally.objects.filter(poll_id=poll_id).exclude(option_index__in=list(counts)).delete()
+        PollTally.objects.bulk_create(
+            [PollTally(poll_id=poll_id, option_index=index, votes=total) for index, total in counts.items()],
+            update_conflicts=True, unique_fields=['poll', 'option_index'], update_fields=['votes'],
+        )
+        Poll.objects.filter(pk=poll_id).update(response_count=respondents)
+    return counts, respondents
+
+
+def poll_results(poll_ids) -> dict:
+    """Return ``{poll_id: (respondents, {option_index: votes})}`` from the counters."""
+    poll_ids = list(poll_ids)
+    if not poll_ids:
+        return {}
+    results = {
+        poll_id: (respondents, {})
+        for poll_id, respondents in Poll.objects.filter(pk__in=poll_ids).values_list('pk', 'response_count')
+    }
+    for poll_id, index, votes in PollTally.objects.filter(poll_id__in=poll_ids).values_list(
+            'poll_id', 'option_index', 'votes'):
+        results[poll_id][1][index] = votes
+    return results
+
+
+def attach_poll_counts(polls, results: dict | None = None) -> list:
+    """Set ``option_votes_list``, ``options_with_counts`` and ``total_responses``
+    on each poll for the templates.
+
+    ``results`` is a :func:`poll_results` mapping (e.g. a cached one); by
+    default the tallies are read in one query and respondents come from
+    the poll rows themselves. Returns the polls as a list.
+    """
+    polls = list(polls)
+    if results is None:
+        tallies = defaultdict(dict)
+        if polls:
+            rows = PollTally.objects.filter(poll_id__in=[poll.pk for poll in polls])
+            for poll_id, index, votes in rows.values_list('poll_id', 'option_index', 'votes'):
+                tallies[poll_id][index] = votes
+        results = {poll.pk: (poll.response_count, tallies.get(poll.pk, {})) for poll in polls}
+    for poll in polls:
+        respondents, tally = results.get(poll.pk, (0, {}))
+        poll.total_responses = respondents
+        poll.option_votes_list = [tally.get(i, 0) for i in range(len(poll.options or []))]
+        poll.options_with_counts = [
+            {'index': i, 'text': option, 'count': tally.get(i, 0)}
+            for i, option in enumerate(poll.options or [])
+        ]
+    return polls
@@ -0,0 +1,321 @@
+"""
+Background generation of downloadable exports.
+
+A report is requested with :func:`enqueue_report`, which stores a ReportJob
+and returns immediately; the ``run_report_jobs`` worker claims it, writes
+the file under ``MEDIA_ROOT/reports/`` and marks the job completed. Clients
+poll ``/hub/reports/<id>/`` and fetch ``/hub/reports/<id>/download/``.
+While writing, the worker refreshes ``heartbeat_at`` every
+``HEARTBEAT_EVERY`` seconds; a running job is only handed to another worker
+after ``STALE_AFTER`` seconds without one, however long the export takes.
+
+Each kind of export is a :class:`ReportSpec` in ``REPORTS``. Besides
+writing the file, a spec reports a cheap *data version* of its input (row
+count plus the newest id or modification time). The job fingerprint hashes
+kind, parameters and data version, so asking again for the same export
+while the data is unchanged hands back the existing job (finished or still
+in flight) instead of generating another file.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .cache import bot_cache
+from .exports import require_reportlab, write_message_log_pdf
+from .message_logs import InvalidLogQuery, can_view_bot, filter_message_logs
+from .models import Candidate, ReportJob
+from .supporter_exports import FILTERS as SUPPORTER_FILTERS
+from .supporter_exports import InvalidSupporterQuery, filter_supporters, supporter_json_chunks
+
+logger = logging.getLogger(__name__)
+
+STALE_AFTER = 5 * 60  # seconds without a heartbeat before a running job is considered abandoned
+HEARTBEAT_EVERY = 30  # seconds between heartbeats while a report is written
+
+
+class InvalidReport(ValueError):
+    """Unknown report kind or unusable parameters."""
+
+
+class ReportJobLost(Exception):
+    """The job was reclaimed by another worker while this one was writing it."""
+
+
+def _int_param(params: dict, name: str) -> int:
+    try:
+        return int(params.get(name))
+    except (TypeError, ValueError):
+        raise InvalidReport(f"{name} must be an integer")
+
+
+class ReportSpec:
+    """One kind of export.
+
+    ``clean`` normalises request parameters into the JSON stored on the job;
+    the other methods receive those cleaned parameters.
+    """
+    kind = None
+    extension = None
+    content_type = 'application/octet-stream'
+
+    def clean(self, params: dict) -> dict:
+        raise NotImplementedError
+
+    def can_access(self, user, params: dict) -> bool:
+        return user.is_superuser
+
+    def data_version(self, params: dict) -> dict:
+        """Cheap summary of the input data; must include ``rows``."""
+        raise NotImplementedError
+
+    def filename(self, params: dict) -> str:
+        return f"{self.kind}.{self.extension}"
+
+    def write(self, params: dict, fh) -> None:
+        """Write the export to the binary file object ``fh``."""
+        raise NotImplementedError
+
+
+class MessageLogsPdfReport(ReportSpec):
+    """The log viewer's PDF download (see exports.message_log_pdf_chunks)."""
+    kind = ReportJob.KIND_MESSAGE_LOGS_PDF
+    extension = 'pdf'
+    content_type = 'application/pdf'
+    FILTERS = ('chat_id', 'date_from', 'date_to', 'has_phone')
+
+    def _bot(self, params: dict):
+        bot = bot_cache.first(id=params['bot_id'])
+        if bot is None:
+            raise InvalidReport('bot not found')
+        return bot
+
+    def _logs(self, params: dict):
+        try:
+            return filter_message_logs(self._bot(params), params)
+        except InvalidLogQuery as ex:
+            raise InvalidReport(str(ex))
+
+    def clean(self, params: dict) -> dict:
+        cleaned = {'bot_id': _int_param(params, 'bot_id')}
+        for key in self.FILTERS:
+            value = str(params.get(key) or '').strip()
+            if value:
+                cleaned[key] = value
+        self._logs(cleaned)  # validates the bot and the filters
+        return cleaned
+
+    def can_access(self, user, params: dict) -> bool:
+        bot = bot_cache.first(id=params['bot_id'])
+        return bot is not None and can_view_bot(user, bot)
+
+    def data_version(self, params: dict) -> dict:
+        # Logs are append-only, so the count and the newest id identify the set
+        summary = self._logs(params).aggregate(rows=Count('id'), last_id=Max('id'))
+        return {'rows': summary['rows'], 'last_id': summary['last_id']}
+
+    def filename(self, params: dict) -> str:
+        return f"bot_{params['bot_id']}_logs.pdf"
+
+    def write(self, params: dict, fh) -> None:
+        require_reportlab()
+        write_message_log_pdf(self._bot(params), self._logs(params), fh)
+
+
+class SupportersJsonReport(ReportSpec):
+    """Same document as election_views.export_supporters_report, built by the worker."""
+    kind = ReportJob.KIND_SUPPORTERS_JSON
+    extension = 'json'
+    content_type = 'application/json'
+
+    def _candidate(self, params: dict):
+        try:
+            return Candidate.objects.get(id=params['candidate_id'])
+        except Candidate.DoesNotExist:
+            raise InvalidReport('candidate not found')
+
+    def _supporters(self, candidate, params: dict):
+        try:
+            return filter_supporters(candidate, params)
+        except InvalidSupporterQuery as ex:
+            raise InvalidReport(str(ex))
+
+    def clean(self, params: dict) -> dict:
+        try:
+            candidate_id = str(uuid.UUID(str(params.get('candidate_id') or '').strip()))
+        except ValueError:
+            raise InvalidReport('candidate_id must be a UUID')
+        cleaned = {'candidate_id': candidate_id}
+        for key in SUPPORTER_FILTERS:
+            value = str(params.get(key) or '').strip()
+            if value:
+                cleaned[key] = value
+        self._supporters(self._candidate(cleaned), cleaned)  # validates the filters
+        return cleaned
+
+    def can_access(self, user, params: dict) -> bool:
+        # Mirrors export_supporters_report, which any signed-in user may call
+        return user.is_authenticated
+
+    def data_version(self, params: dict) -> dict:
+        # updated_at moves on every save and on insert; a delete lowers the count
+        supporters = self._supporters(self._candidate(params), params)
+        summary = supporters.aggregate(rows=Count('id'), changed=Max('updated_at'))
+        return {'rows': summary['rows'], 'changed': summary['changed']}
+
+    def filename(self, params: dict) -> str:
+        return f"supporters_{params['candidate_id']}.json"
+
+    def write(self, params: dict, fh) -> None:
+        candidate = self._candidate(params)
+        for chunk in supporter_json_chunks(candidate, self._supporters(candidate, params)):
+            fh.write(chunk)
+
+
+REPORTS = {}
+
+
+def register_report(spec: ReportSpec) -> None:
+    REPORTS[spec.kind] = spec
+
+
+register_report(MessageLogsPdfReport())
+register_report(SupportersJsonReport())
+
+
+def get_report(kind: str) -> ReportSpec:
+    try:
+        return REPORTS[kind]
+    except KeyError:
+        raise InvalidReport(f"unknown report kind: {kind}")
+
+
+def report_fingerprint(spec: ReportSpec, params: dict) -> tuple:
+    """Return ``(fingerprint, data_version)`` for ``params`` as the data stands now."""
+    version = spec.data_version(params)
+    raw = json.dumps([spec.kind, params, version], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest(), version
+
+
+def has_file(job: ReportJob) -> bool:
+    return bool(job.file) and job.file.storage.exists(job.file.name)
+
+
+def enqueue_report(kind: str, params: dict, user=None) -> tuple:
+    """Queue an export, or reuse an identical one; returns ``(job, reused)``.
+
+    Raises InvalidReport for an unknown kind or bad parameters.
+    """
+    spec = get_report(kind)
+    params = spec.clean(params or {})
+    fingerprint, _ = report_fingerprint(spec, params)
+    candidates = ReportJob.objects.filter(
+        kind=kind,
+        fingerprint=fingerprint,
+        status__in=[ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING, ReportJob.STATUS_COMPLETED],
+    ).order_by('-created_at', '-id')
+    for job in candidates[:5]:
+        if job.status != ReportJob.STATUS_COMPLETED or has_file(job):
+            return job, True
+
+    job = ReportJob.objects.create(
+        kind=kind,
+        params=params,
+        fingerprint=fingerprint,
+        created_by=user if getattr(user, 'is_authenticated', False) else None,
+    )
+    return job, False
+
+
+def claim_report_job(worker: str, stale_after: int | None = None):
+    """Atomically take the oldest pending job, or a running one whose worker died."""
+    stale_after = STALE_AFTER if stale_after is None else stale_after
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            ReportJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ReportJob.STATUS_PENDING)
+                | Q(status=ReportJob.STATUS_RUNNING, heartbeat_at__lt=now - timedelta(seconds=stale_after))
+                | Q(status=ReportJob.STATUS_RUNNING, heartbeat_at__isnull=True)
+            )
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ReportJob.STATUS_RUNNING
+        job.worker = worker
+        job.started_at = now
+        job.heartbeat_at = now
+        job.save(update_fields=['status', 'worker', 'started_at', 'heartbeat_at'])
+    return job
+
+
+def heartbeat_report_job(job: ReportJob) -> None:
+    """Record that ``job``'s worker is alive; raises ReportJobLost if it was reclaimed."""
+    job.heartbeat_at = timezone.now()
+    alive = ReportJob.objects.filter(pk=job.pk, status=ReportJob.STATUS_RUNNING, worker=job.worker).update(
+        heartbeat_at=job.heartbeat_at,
+    )
+    if not alive:
+        raise ReportJobLost(f"report job {job.pk} is no longer held by {job.worker}")
+
+
+class _HeartbeatFile:
+    """Output file wrapper that sends the job's heartbeat as the writer makes progress."""
+
+    def __init__(self, fh, job: ReportJob):
+        self._fh = fh
+        self._job = job
+        self._last_beat = time.monotonic()
+
+    def write(self, data):
+        now = time.monotonic()
+        if now - self._last_beat >= HEARTBEAT_EVERY:
+            self._last_beat = now
+            heartbeat_report_job(self._job)
+        return self._fh.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._fh, name)
+
+
+def finish_report_job(job: ReportJob, status: str, error: str | None = None) -> ReportJob:
+    job.status = status
+    job.finished_at = timezone.now()
+    job.error = error
+    job.save(update_fields=['status', 'finished_at', 'error', 'file', 'fingerprint', 'rows'])
+    return job
+
+
+def run_report_job(job: ReportJob) -> ReportJob:
+    """Generate the file for a claimed job."""
+    try:
+        spec = get_report(job.kind)
+        # Fingerprint the data actually exported, which may have moved on
+        # since the job was queued, so reuse matches the file's contents.
+        job.fingerprint, version = report_fingerprint(spec, job.params)
+        job.rows = version['rows']
+        with tempfile.TemporaryFile() as fh:
+            spec.write(job.params, _HeartbeatFile(fh, job))
+            heartbeat_report_job(job)
+            fh.seek(0)
+            job.file.save(f"{job.kind}_{job.pk}.{spec.extension}", File(fh), save=False)
+    except ReportJobLost:
+        # The other worker owns the job now; leave its row alone
+        logger.warning("Report job %s was reclaimed by another worker", job.pk)
+        return job
+    except Exception as ex:
+        logger.exception("Report job %s failed", job.pk)
+        return finish_report_job(job, ReportJob.STATUS_FAILED, str(ex))
+    return finish_report_job(job, ReportJob.STATUS_COMPLETED)
@@ -0,0 +1,100 @@
+"""Evict hub/cache.py and hub/landing.py entries, and move the hub/counters.py
+counters, when the underlying rows are saved or deleted."""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters
+from .cache import bot_cache, user_cache
+from .landing import forget_landing_candidate, invalidate_landing, invalidate_public_landing
+from .models import (
+    Bot, BotUser, CampaignBenefit, Candidate, Event, FakeNewsAlert, Gallery, Poll, Speech, Supporter, Testimonial,
+    Volunteer,
+)
+
+
+@receiver(post_save, sender=BotUser)
+@receiver(post_delete, sender=BotUser)
+def forget_bot_user(sender, instance, **kwargs):
+    bot_id, telegram_id = instance.bot_id, instance.telegram_id
+    transaction.on_commit(lambda: user_cache.forget_many(bot_id, [telegram_id]))
+
+
+@receiver(post_save, sender=Bot)
+@receiver(post_delete, sender=Bot)
+def forget_bot(sender, instance, **kwargs):
+    bot_id, token = instance.id, instance.token
+    bot_cache.forget(bot_id, token)
+    # Again after commit, in case a concurrent request re-cached the old row
+    transaction.on_commit(lambda: bot_cache.forget(bot_id, token))
+    # Landing pages show the candidate's bot link
+    if bot_id is not None:
+        candidate_ids = list(Candidate.objects.filter(bot_id=bot_id).values_list('id', flat=True))
+        transaction.on_commit(lambda: [forget_landing_candidate(candidate_id) for candidate_id in candidate_ids])
+
+
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+def forget_candidate(sender, instance, **kwargs):
+    candidate_id, names = instance.pk, (instance.name, instance.public_url_name)
+    transaction.on_commit(lambda: forget_landing_candidate(candidate_id, names))
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Speech)
+@receiver(post_delete, sender=Speech)
+@receiver(post_save, sender=Poll)
+@receiver(post_delete, sender=Poll)
+@receiver(post_save, sender=Gallery)
+@receiver(post_delete, sender=Gallery)
+@receiver(post_save, sender=Testimonial)
+@receiver(post_delete, sender=Testimonial)
+@receiver(post_save, sender=CampaignBenefit)
+@receiver(post_delete, sender=CampaignBenefit)
+def invalidate_candidate_landing(sender, instance, **kwargs):
+    # After commit, so a request racing the write cannot cache the old rows
+    # under the new version
+    candidate_id = instance.candidate_id
+    transaction.on_commit(lambda: invalidate_landing(candidate_id))
+
+
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_public_page(sender, instance, **kwargs):
+    # public_landing lists the candidates and counts public events
+    transaction.on_commit(invalidate_public_landing)
+
+
+# Counters move inside the writer's transaction so they roll back with it
+
+@receiver(pre_save, sender=Supporter)
+@receiver(pre_save, sender=Volunteer)
+@receiver(pre_save, sender=Event)
+@receiver(pre_save, sender=Poll)
+@receiver(pre_save, sender=Speech)
+@receiver(pre_save, sender=FakeNewsAlert)
+def track_counted_row(sender, instance, update_fields=None, **kwargs):
+    counters.track_change(instance, update_fields)
+
+
+@receiver(post_save, sender=Supporter)
+@receiver(post_save, sender=Volunteer)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Poll)
+@receiver(post_save, sender=Speech)
+@receiver(post_save, sender=FakeNewsAlert)
+def count_saved_row(sender, instance, created, **kwargs):
+    counters.apply_save(instance, created)
+
+
+@receiver(post_delete, sender=Supporter)
+@receiver(post_delete, sender=Volunteer)
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Poll)
+@receiver(post_delete, sender=Speech)
+@receiver(post_delete, sender=FakeNewsAlert)
+def count_deleted_row(sender, instance, **kwargs):
+    counters.apply_delete(instance)
@@ -0,0 +1,142 @@
+"""
+Constant-memory supporter exports (CSV, XLSX and JSON).
+
+Rows are read with a ``values_list`` projection through
+``QuerySet.iterator(chunk_size=...)``, which uses a server-side cursor on
+PostgreSQL, and are written out as they arrive: CSV and JSON are streamed to
+the client chunk by chunk, XLSX goes through openpyxl's write-only workbook
+into a temporary file. No Supporter or BotUser instances are built and no
+list of rows is ever held.
+"""
+import csv
+from datetime import datetime, time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+CHUNK_SIZE = 2000
+
+FIELDS = (
+    'bot_user__first_name', 'bot_user__last_name', 'bot_user__phone_number',
+    'city', 'district', 'support_level', 'registered_at', 'notes',
+)
+COLUMNS = ('name', 'phone', 'city', 'district', 'support_level', 'registered_at', 'notes')
+FILTERS = ('city', 'district', 'support_level', 'date_from', 'date_to')
+
+
+class InvalidSupporterQuery(ValueError):
+    """A filter parameter could not be parsed."""
+
+
+def _day_bound(value: str, name: str, end: bool = False) -> datetime:
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise InvalidSupporterQuery(f"{name} must be YYYY-MM-DD")
+    return timezone.make_aware(datetime.combine(day, time.max if end else time.min))
+
+
+def filter_supporters(candidate, params) -> QuerySet:
+    """Supporters of ``candidate`` narrowed by export filters, newest first.
+
+    Supported: ``city`` and ``district`` (case-insensitive exact match),
+    ``support_level`` (one level or a comma-separated list) and
+    ``date_from`` / ``date_to`` (inclusive registration days).
+    """
+    qs = candidate.supporters.all()
+    for field in ('city', 'district'):
+        value = (params.get(field) or '').strip()
+        if value:
+            qs = qs.filter(**{f'{field}__iexact': value})
+    levels = str(params.get('support_level') or '').strip()
+    if levels:
+        try:
+            qs = qs.filter(support_level__in=[int(level) for level in levels.split(',') if level.strip()])
+        except ValueError:
+            raise InvalidSupporterQuery('support_level must be an integer or a comma-separated list')
+    date_from = (params.get('date_from') or '').strip()
+    if date_from:
+        qs = qs.filter(registered_at__gte=_day_bound(date_from, 'date_from'))
+    date_to = (params.get('date_to') or '').strip()
+    if date_to:
+        qs = qs.filter(registered_at__lte=_day_bound(date_to, 'date_to', end=True))
+    return qs.order_by('-registered_at')
+
+
+def supporter_rows(queryset, chunk_size: int = CHUNK_SIZE):
+    """Yield one tuple per supporter in ``COLUMNS`` order."""
+    rows = queryset.values_list(*FIELDS).iterator(chunk_size=chunk_size)
+    for first, last, phone, city, district, level, registered_at, notes in rows:
+        yield f"{first or ''} {last or ''}".strip(), phone, city, district, level, registered_at, notes
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def supporter_csv_chunks(queryset, chunk_size: int = CHUNK_SIZE):
+    """Yield the CSV export, a few hundred rows per chunk."""
+    writer = csv.writer(_Echo())
+    # BOM so spreadsheet apps detect UTF-8 (names are mostly Arabic)
+    lines = ['\ufeff' + writer.writerow(COLUMNS)]
+    for name, phone, city, district, level, registered_at, notes in supporter_rows(queryset, chunk_size):
+        lines.append(writer.writerow([
+            name, phone or '', city or '', district or '', level,
+            timezone.localtime(registered_at).isoformat() if registered_at else '', notes or '',
+        ]))
+        if len(lines) >= 500:
+            yield ''.join(lines).encode('utf-8')
+            lines = []
+    if lines:
+        yield ''.join(lines).encode('utf-8')
+
+
+def require_openpyxl():
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImproperlyConfigured('XLSX export requires openpyxl. Install with: pip install openpyxl')
+    return Workbook
+
+
+def write_supporters_xlsx(queryset, fh, chunk_size: int = CHUNK_SIZE) -> None:
+    """Write the XLSX export to the binary file object ``fh``.
+
+    The write-only workbook spools rows to disk as they are appended, so
+    memory stays flat; the zip container is assembled on ``save``.
+    """
+    workbook = require_openpyxl()(write_only=True)
+    sheet = workbook.create_sheet('Supporters')
+    sheet.append(COLUMNS)
+    for name, phone, city, district, level, registered_at, notes in supporter_rows(queryset, chunk_size):
+        if registered_at:
+            # Excel has no time zones; write local wall-clock time
+            registered_at = timezone.localtime(registered_at).replace(tzinfo=None)
+        sheet.append([name, phone, city, district, level, registered_at, notes])
+    workbook.save(fh)
+
+
+def supporter_json_chunks(candidate, queryset, chunk_size: int = CHUNK_SIZE):
+    """Yield the JSON document of export_supporters_report without building the list."""
+    encoder = DjangoJSONEncoder()
+    head = encoder.encode({
+        'candidate_name': candidate.name,
+        'export_date': timezone.now(),
+        'total_supporters': queryset.count(),
+    })
+    yield head[:-1].encode('utf-8') + b', "supporters": ['
+    parts = []
+    for index, row in enumerate(supporter_rows(queryset, chunk_size)):
+        parts.append((', ' if index else '') + encoder.encode(dict(zip(COLUMNS, row))))
+        if len(parts) >= 500:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+    yield (''.join(parts) + ']}').encode('utf-8')
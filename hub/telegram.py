@@ -0,0 +1,186 @@
+"""Shared Telegram Bot API client.
+
+Every Bot API call in the project goes through :class:`TelegramClient`, which
+keeps one pooled keep-alive ``requests.Session`` per bot token so repeated
+calls (broadcasts, webhook replies, long polling) reuse TCP/TLS connections.
+
+``request()`` returns the Telegram JSON dict exactly like the old ad-hoc
+``requests.post(...).json()`` calls did, so callers keep checking
+``js.get('ok')``. ``call()`` is the strict variant that returns ``result``
+and raises :class:`TelegramAPIError` on ``ok: false``. Transport failures
+raise :class:`TelegramNetworkError` after connection-level retries.
+
+:class:`AsyncTelegramClient` is the asyncio counterpart used by the async
+broadcast sender; it needs the optional ``httpx`` package.
+"""
+import threading
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TELEGRAM_API_URL = "https://api.telegram.org/bot{token}/{method}"
+
+DEFAULT_TELEGRAM_SETTINGS = {
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 15,
+    'RETRIES': 3,
+    'BACKOFF_FACTOR': 0.5,
+    'POOL_MAXSIZE': 32,
+    'MAX_CLIENTS': 256,
+}
+
+
+def telegram_settings() -> dict:
+    """Return TELEGRAM_CLIENT settings merged over the defaults."""
+    merged = dict(DEFAULT_TELEGRAM_SETTINGS)
+    merged.update(getattr(settings, 'TELEGRAM_CLIENT', {}) or {})
+    return merged
+
+
+class TelegramError(Exception):
+    """Base class for Telegram Bot API failures."""
+
+
+class TelegramNetworkError(TelegramError):
+    """The request never produced an HTTP response (DNS, connect, timeout)."""
+
+
+class TelegramAPIError(TelegramError):
+    """Telegram answered with ``ok: false``."""
+
+    def __init__(self, js: dict):
+        self.js = js
+        self.error_code = js.get('error_code')
+        self.description = js.get('description') or 'Unknown error'
+        self.retry_after = (js.get('parameters') or {}).get('retry_after')
+        super().__init__(f"{self.error_code}: {self.description}")
+
+
+class TelegramClient:
+    """Pooled Bot API client for one token; safe to share between threads."""
+
+    def __init__(self, token: str, conf: dict | None = None):
+        conf = conf or telegram_settings()
+        self.token = token
+        self.connect_timeout = float(conf['CONNECT_TIMEOUT'])
+        self.read_timeout = float(conf['READ_TIMEOUT'])
+        # Only connection failures and gateway errors are retried: a read
+        # timeout on sendMessage may already have delivered the message.
+        retry = Retry(
+            total=int(conf['RETRIES']),
+            read=0,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            backoff_factor=float(conf['BACKOFF_FACTOR']),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(conf['POOL_MAXSIZE']), max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+
+    def url(self, method: str) -> str:
+        return TELEGRAM_API_URL.format(token=self.token, method=method)
+
+    def request(self, method: str, http_method: str = 'POST', timeout: float | None = None, **kwargs) -> dict:
+        """Call ``method`` and return Telegram's JSON response dict.
+
+        ``timeout`` is the read timeout in seconds (long polling passes its
+        own); extra keyword arguments go straight to ``Session.request``
+        (``json=``, ``params=``, ``data=``, ``files=``).
+        """
+        read_timeout = self.read_timeout if timeout is None else timeout
+        try:
+            resp = self.session.request(
+                http_method, self.url(method), timeout=(self.connect_timeout, read_timeout), **kwargs
+            )
+        except requests.RequestException as ex:
+            raise TelegramNetworkError(f"{method}: {ex}") from ex
+        try:
+            return resp.json()
+        except ValueError:
+            return {'ok': False, 'error_code': resp.status_code, 'description': 'Invalid JSON response'}
+
+    def call(self, method: str, http_method: str = 'POST', timeout: float | None = None, **kwargs):
+        """Like :meth:`request` but return ``result`` or raise :class:`TelegramAPIError`."""
+        js = self.request(method, http_method=http_method, timeout=timeout, **kwargs)
+        if not js.get('ok'):
+            raise TelegramAPIError(js)
+        return js.get('result')
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncTelegramClient:
+    """asyncio Bot API client for one token over a pooled ``httpx.AsyncClient``.
+
+    Mirrors :meth:`TelegramClient.request`; create it inside the event loop
+    that uses it and ``await aclose()`` when done.
+    """
+
+    def __init__(self, token: str, max_connections: int = 100, conf: dict | None = None):
+        try:
+            import httpx
+        except ImportError:
+            raise ImproperlyConfigured('Async Telegram client requires httpx. Install with: pip install httpx')
+        conf = conf or telegram_settings()
+        self._httpx = httpx
+        self.token = token
+        self.connect_timeout = float(conf['CONNECT_TIMEOUT'])
+        self.read_timeout = float(conf['READ_TIMEOUT'])
+        # httpx transport retries cover connection failures only
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=httpx.AsyncHTTPTransport(retries=int(conf['RETRIES'])),
+        )
+
+    def url(self, method: str) -> str:
+        return TELEGRAM_API_URL.format(token=self.token, method=method)
+
+    async def request(self, method: str, http_method: str = 'POST', timeout: float | None = None, **kwargs) -> dict:
+        read_timeout = self.read_timeout if timeout is None else timeout
+        try:
+            resp = await self.client.request(
+                http_method,
+                self.url(method),
+                timeout=self._httpx.Timeout(read_timeout, connect=self.connect_timeout),
+                **kwargs,
+            )
+        except self._httpx.HTTPError as ex:
+            raise TelegramNetworkError(f"{method}: {ex}") from ex
+        try:
+            return resp.json()
+        except ValueError:
+            return {'ok': False, 'error_code': resp.status_code, 'description': 'Invalid JSON response'}
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_clients: OrderedDict[str, TelegramClient] = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def get_client(token: str) -> TelegramClient:
+    """Return the process-wide client for ``token``, creating it on first use.
+
+    Clients are kept in LRU order and capped at ``MAX_CLIENTS`` because some
+    endpoints accept arbitrary tokens (validate_token, create_bot). Evicted
+    clients are not closed so in-flight requests on other threads finish.
+    """
+    with _clients_lock:
+        client = _clients.get(token)
+        if client is not None:
+            _clients.move_to_end(token)
+            return client
+        conf = telegram_settings()
+        client = _clients[token] = TelegramClient(token, conf)
+        while len(_clients) > int(conf['MAX_CLIENTS']):
+            _clients.popitem(last=False)
+    return client
+
@@ -1,3 +1,765 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.utils import timezone
+
+from . import broadcast
+from .broadcast import (
+    BroadcastEngine, BroadcastJobLost, checkpoint_broadcast_job, claim_broadcast_job, classify_send_error,
+    enqueue_broadcast, run_broadcast_job,
+)
+from .counters import candidate_counts, global_counts, rebuild_counters, record_snapshots
+from .landing import landing_cache
+from .message_logs import InvalidLogQuery, message_log_page
+from .models import (
+    Bot, BotUser, BroadcastJob, CampaignAnalytics, CampaignAnalyticsSnapshot, Candidate, ContactMessage, Event,
+    MessageLog, Poll,
+    PollResponse, PollVote, SendLog, Supporter, WebhookEvent,
+)
+from .page_cache import cache_public_page
+from .partitions import is_partitioned, list_partitions, month_start
+from .polls import poll_results, rebuild_poll_tallies, record_vote
+from .telegram import TelegramClient
+from .cache import user_cache
+from .updates import StartHandler, WEBHOOK_MAX_ATTEMPTS, process_updates, process_webhook_events
+
+
+class ClassifySendErrorTests(SimpleTestCase):
+    def test_success_is_not_an_error(self):
+        self.assertIsNone(classify_send_error({'ok': True, 'result': {}}))
+
+    def test_blocked_by_user(self):
+        js = {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+        self.assertEqual(classify_send_error(js), 'blocked')
+
+    def test_any_403_marks_blocked(self):
+        js = {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was kicked from the group chat'}
+        self.assertEqual(classify_send_error(js), 'blocked')
+
+    def test_deactivated_account(self):
+        js = {'ok': False, 'error_code': 403, 'description': 'Forbidden: user is deactivated'}
+        self.assertEqual(classify_send_error(js), 'deactivated')
+
+    def test_chat_not_found(self):
+        js = {'ok': False, 'error_code': 400, 'description': 'Bad Request: chat not found'}
+        self.assertEqual(classify_send_error(js), 'chat_not_found')
+
+    def test_transient_errors_say_nothing_about_the_recipient(self):
+        for js in (
+            {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 5',
+             'parameters': {'retry_after': 5}},
+            {'ok': False, 'error_code': 400, 'description': 'Bad Request: message text is empty'},
+            {'ok': False, 'error_code': 502, 'description': None},
+            {'ok': False},
+        ):
+            with self.subTest(js=js):
+                self.assertIsNone(classify_send_error(js))
+
+
+class MessageLogPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:log')
+        other = Bot.objects.create(name='Other', token='222:log')
+        base = timezone.now().replace(microsecond=0)
+        # Rows 2-4 share a timestamp, so the id tie-breaker decides their order
+        times = [base, base - timedelta(minutes=1)] + [base - timedelta(minutes=2)] * 3 + [base - timedelta(minutes=3)]
+        for index, received_at in enumerate(times):
+            log = MessageLog.objects.create(bot=cls.bot, chat_id=index, text=f'm{index}')
+            MessageLog.objects.filter(pk=log.pk).update(received_at=received_at)
+        MessageLog.objects.create(bot=other, chat_id=99, text='elsewhere')
+
+    def logs(self):
+        return MessageLog.objects.filter(bot=self.bot)
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        expected = list(self.logs().order_by('-received_at', '-id').values_list('id', flat=True))
+        seen, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = message_log_page(self.logs(), cursor, limit=2)
+            seen += [row['id'] for row in rows]
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 3)
+
+    def test_cursor_continues_inside_a_timestamp_tie(self):
+        first, cursor = message_log_page(self.logs(), limit=3)
+        second, _ = message_log_page(self.logs(), cursor, limit=3)
+        self.assertEqual(first[-1]['received_at'], second[0]['received_at'])
+        self.assertGreater(first[-1]['id'], second[0]['id'])
+
+    def test_last_page_has_no_cursor(self):
+        rows, cursor = message_log_page(self.logs(), limit=6)
+        self.assertEqual(len(rows), 6)
+        self.assertIsNone(cursor)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-base64!', 'e30', 'WyJ4IiwgMV0'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidLogQuery):
+                message_log_page(self.logs(), cursor)
+
+
+class PollTallyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:poll')
+        candidate = Candidate.objects.create(name='Candidate', position='Mayor')
+        cls.poll = Poll.objects.create(candidate=candidate, title='Poll', question='?', options=['a', 'b', 'c'])
+
+    def respond(self, telegram_id, selected):
+        """What the vote endpoints do: store the response and count it in one transaction."""
+        user = BotUser.objects.create(bot=self.bot, telegram_id=telegram_id)
+        with transaction.atomic():
+            response = PollResponse.objects.create(poll=self.poll, bot_user=user, selected_options=selected)
+            record_vote(self.poll.pk, selected)
+        return response
+
+    def results(self):
+        return poll_results([self.poll.pk])[self.poll.pk]
+
+    def test_vote_increments_tally(self):
+        self.respond(1, [0])
+        self.respond(2, [0, 2])
+        self.assertEqual(self.results(), (2, {0: 2, 2: 1}))
+
+    def test_changed_answer_moves_the_vote(self):
+        response = self.respond(1, [0, 1])
+        with transaction.atomic():
+            record_vote(self.poll.pk, [1, 2], previous=response.selected_options)
+            response.selected_options = [1, 2]
+            response.save()
+        self.assertEqual(self.results(), (1, {0: 0, 1: 1, 2: 1}))
+
+    def test_rebuild_agrees_with_incremental_counts(self):
+        self.respond(1, [0])
+        self.respond(2, [1, 2])
+        self.respond(3, [2, 2, -1, 'x'])
+        with transaction.atomic():
+            PollVote.objects.create(poll=self.poll, user_ip='10.0.0.1', option_index=1)
+            record_vote(self.poll.pk, [1])
+        incremental = self.results()
+
+        counts, respondents = rebuild_poll_tallies(self.poll.pk)
+        self.assertEqual((respondents, counts), (4, {0: 1, 1: 2, 2: 2}))
+        self.assertEqual(self.results(), incremental)
+
+    def test_rebuild_repairs_drift(self):
+        self.respond(1, [0])
+        PollResponse.objects.filter(poll=self.poll).delete()  # bypasses record_vote
+        rebuild_poll_tallies(self.poll.pk)
+        self.assertEqual(self.results(), (0, {}))
+
+
+class PublicPageCacheTests(SimpleTestCase):
+    def setUp(self):
+        landing_cache().clear()
+        self.factory = RequestFactory()
+        self.renders = 0
+        self.version = 'v1'
+
+        @cache_public_page(lambda request: self.version)
+        def page(request):
+            self.renders += 1
+            return HttpResponse(f'<p>{self.version}</p>')
+        self.page = page
+
+    def test_first_get_is_rendered_and_stored(self):
+        response = self.page(self.factory.get('/page/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+        self.page(self.factory.get('/page/'))
+        self.assertEqual(self.renders, 1)
+
+    def test_matching_etag_gets_304_without_rendering(self):
+        etag = self.page(self.factory.get('/page/'))['ETag']
+        response = self.page(self.factory.get('/page/', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.renders, 1)
+
+    def test_if_modified_since_gets_304(self):
+        last_modified = self.page(self.factory.get('/page/'))['Last-Modified']
+        response = self.page(self.factory.get('/page/', HTTP_IF_MODIFIED_SINCE=last_modified))
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_version_invalidates_the_etag(self):
+        etag = self.page(self.factory.get('/page/'))['ETag']
+        self.version = 'v2'
+        response = self.page(self.factory.get('/page/', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'<p>v2</p>')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_session_cookie_bypasses_the_cache(self):
+        etag = self.page(self.factory.get('/page/'))['ETag']
+        request = self.factory.get('/page/', HTTP_IF_NONE_MATCH=etag)
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'abc'
+        response = self.page(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.renders, 2)
+
+
+    def test_page_with_csrf_token_is_not_stored(self):
+        @cache_public_page()
+        def form(request):
+            self.renders += 1
+            return HttpResponse(get_token(request))
+
+        for _ in range(2):
+            response = form(self.factory.get('/form/'))
+            self.assertNotIn('public', response.get('Cache-Control', ''))
+        self.assertEqual(self.renders, 2)
+
+
+class ContactFormTests(TestCase):
+    def test_election_360_form_requires_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        form = {'name': 'Name', 'message': 'Hello'}
+        self.assertEqual(client.post('/hub/election-360/', form).status_code, 403)
+
+        response = client.get('/hub/election-360/')
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+        form['csrfmiddlewaretoken'] = response.context['csrf_token']
+        self.assertEqual(client.post('/hub/election-360/', form).status_code, 200)
+        self.assertEqual(ContactMessage.objects.get().source_page, 'election_360_landing')
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:count')
+        cls.candidate = Candidate.objects.create(name='Candidate', position='Mayor')
+        cls.other = Candidate.objects.create(name='Other', position='Mayor')
+
+    def counts(self, candidate=None):
+        return candidate_counts((candidate or self.candidate).pk)
+
+    def supporter(self, telegram_id, candidate=None):
+        user = BotUser.objects.create(bot=self.bot, telegram_id=telegram_id)
+        return Supporter.objects.create(candidate=candidate or self.candidate, bot_user=user)
+
+    def event(self, **fields):
+        return Event.objects.create(
+            candidate=self.candidate, title='Rally', description='-', location='Square',
+            start_datetime=timezone.now(), **fields,
+        )
+
+    def test_supporter_create_and_delete(self):
+        first = self.supporter(1)
+        self.supporter(2)
+        self.supporter(3, candidate=self.other)
+        self.assertEqual(self.counts()['total_supporters'], 2)
+        self.assertEqual(global_counts()['total_supporters'], 3)
+
+        first.delete()
+        self.assertEqual(self.counts()['total_supporters'], 1)
+        self.assertEqual(self.counts(self.other)['total_supporters'], 1)
+
+    def test_supporter_moved_to_another_candidate(self):
+        supporter = self.supporter(1)
+        supporter.candidate = self.other
+        supporter.save()
+        self.assertEqual(self.counts()['total_supporters'], 0)
+        self.assertEqual(self.counts(self.other)['total_supporters'], 1)
+
+    def test_event_is_public_change(self):
+        event = self.event(is_public=True)
+        self.event(is_public=False)
+        self.assertEqual((self.counts()['total_events'], self.counts()['total_public_events']), (2, 1))
+
+        event.is_public = False
+        event.save()
+        self.assertEqual((self.counts()['total_events'], self.counts()['total_public_events']), (2, 0))
+
+        event.is_public = True
+        event.save(update_fields=['is_public'])
+        self.assertEqual(self.counts()['total_public_events'], 1)
+
+        event.delete()
+        self.assertEqual((self.counts()['total_events'], self.counts()['total_public_events']), (1, 0))
+
+    def test_unrelated_save_leaves_counters_alone(self):
+        event = self.event(is_public=True)
+        event.title = 'Town hall'
+        event.save(update_fields=['title'])
+        self.assertEqual((self.counts()['total_events'], self.counts()['total_public_events']), (1, 1))
+
+
+class AnalyticsSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:snap')
+        cls.candidate = Candidate.objects.create(name='Candidate', position='Mayor')
+
+    def add_supporter(self, telegram_id):
+        user = BotUser.objects.create(bot=self.bot, telegram_id=telegram_id)
+        Supporter.objects.create(candidate=self.candidate, bot_user=user)
+
+    def snapshots(self):
+        return CampaignAnalyticsSnapshot.objects.filter(candidate=self.candidate)
+
+    def test_second_run_on_the_same_day_updates_the_row(self):
+        today = timezone.localdate()
+        self.add_supporter(1)
+        self.assertEqual(record_snapshots(today), 1)
+        self.add_supporter(2)
+        self.assertEqual(record_snapshots(today), 1)
+
+        self.assertEqual(list(self.snapshots().values_list('date', 'total_supporters')), [(today, 2)])
+
+    def test_each_day_keeps_its_own_row(self):
+        today = timezone.localdate()
+        self.add_supporter(1)
+        record_snapshots(today - timedelta(days=1))
+        self.add_supporter(2)
+        record_snapshots(today)
+        self.assertEqual(
+            list(self.snapshots().order_by('date').values_list('total_supporters', flat=True)), [1, 2],
+        )
+
+    def test_rebuild_corrects_writes_that_bypass_signals(self):
+        self.add_supporter(1)
+        CampaignAnalytics.objects.filter(candidate=self.candidate).update(total_supporters=7)
+        before, after = rebuild_counters(self.candidate.pk)
+        self.assertEqual((before['total_supporters'], after['total_supporters']), (7, 1))
+        self.assertEqual(candidate_counts(self.candidate.pk)['total_supporters'], 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'log partitioning is PostgreSQL only')
+class LogPartitionTests(TestCase):
+    FOREIGN_KEYS = (
+        "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid IN ('hub_messagelog'::regclass, 'hub_sendlog'::regclass) AND contype = 'f' "
+        "ORDER BY 1, 2"
+    )
+
+    def test_migrate_leaves_the_log_tables_plain(self):
+        self.assertFalse(is_partitioned(connection, 'hub_messagelog'))
+        self.assertFalse(is_partitioned(connection, 'hub_sendlog'))
+
+    def test_convert_keeps_rows_indexes_and_ids(self):
+        bot = Bot.objects.create(name='Bot', token='111:partition')
+        user = BotUser.objects.create(bot=bot, telegram_id=1)
+        now = timezone.now()
+        for months_ago in (0, 1, 3):
+            log = MessageLog.objects.create(bot=bot, bot_user=user, chat_id=1, text=f'{months_ago}')
+            MessageLog.objects.filter(pk=log.pk).update(received_at=now - timedelta(days=31 * months_ago))
+            SendLog.objects.create(bot_user=user, status=SendLog.STATUS_SENT)
+        last_log_id = MessageLog.objects.latest('id').id
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'hub_messagelog'")
+            indexes = {row[0] for row in cursor.fetchall()}
+            cursor.execute(self.FOREIGN_KEYS)
+            foreign_keys = cursor.fetchall()
+
+        out = io.StringIO()
+        call_command('manage_partitions', convert=True, months_ahead=1, stdout=out)
+
+        self.assertIn('Converted hub_messagelog', out.getvalue())
+        self.assertTrue(is_partitioned(connection, 'hub_messagelog'))
+        self.assertTrue(is_partitioned(connection, 'hub_sendlog'))
+        first_month = month_start((now - timedelta(days=93)).date())
+        self.assertIn(first_month, list_partitions(connection, 'hub_messagelog'))
+        self.assertEqual(sorted(MessageLog.objects.values_list('text', flat=True)), ['0', '1', '3'])
+        self.assertEqual(SendLog.objects.filter(bot_user=user).count(), 3)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'hub_messagelog'")
+            self.assertTrue(indexes <= {row[0] for row in cursor.fetchall()})
+            cursor.execute(self.FOREIGN_KEYS)
+            self.assertEqual(cursor.fetchall(), foreign_keys)
+            cursor.execute("SELECT count(*) FROM hub_messagelog_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+        # New rows continue the id sequence and land in their month's partition
+        log = MessageLog.objects.create(bot=bot, chat_id=1, text='new')
+        self.assertGreater(log.id, last_log_id)
+
+        # Converting again is a no-op
+        out = io.StringIO()
+        call_command('manage_partitions', convert=True, stdout=out)
+        self.assertNotIn('Converting', out.getvalue())
+
+    def test_maintenance_refuses_unconverted_tables(self):
+        out = io.StringIO()
+        call_command('manage_partitions', stdout=out)
+        self.assertIn('manage_partitions --convert', out.getvalue())
+        self.assertFalse(is_partitioned(connection, 'hub_messagelog'))
+
+
+class FakeTelegram:
+    """Stands in for ``TelegramClient.request``; ``updates`` answers getUpdates."""
+
+    def __init__(self, updates=()):
+        self.updates = list(updates)
+        self.calls = []
+
+    def __call__(self, client, method, http_method='POST', timeout=None, **kwargs):
+        self.calls.append((method, kwargs.get('json') or kwargs.get('params')))
+        if method == 'getUpdates':
+            return {'ok': True, 'result': self.updates}
+        return {'ok': True, 'result': {'message_id': len(self.calls)}}
+
+    def patch(self):
+        return mock.patch.object(TelegramClient, 'request', autospec=True, side_effect=self)
+
+    def methods(self):
+        return [method for method, _ in self.calls]
+
+
+def start_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'chat': {'id': chat_id}, 'from': {'id': chat_id}, 'text': '/start'},
+    }
+
+
+class AudienceHygieneTests(TestCase):
+    def run_hygiene(self, bot, limit):
+        telegram = FakeTelegram()
+        with telegram.patch():
+            call_command('audience_hygiene', bot_id=bot.id, limit=limit, rate=1000, stdout=io.StringIO())
+        return sorted(payload['chat_id'] for method, payload in telegram.calls if method == 'getChat')
+
+    def test_runs_continue_past_reachable_users(self):
+        bot = Bot.objects.create(name='Bot', token='111:hygiene')
+        for telegram_id in range(1, 6):
+            BotUser.objects.create(bot=bot, telegram_id=telegram_id)
+        BotUser.objects.create(bot=bot, telegram_id=9, last_seen_at=timezone.now())
+
+        self.assertEqual(self.run_hygiene(bot, 2), [1, 2])
+        self.assertEqual(self.run_hygiene(bot, 2), [3, 4])
+        # The end of the list wraps round to the start
+        self.assertEqual(self.run_hygiene(bot, 2), [1, 5])
+        self.assertEqual(self.run_hygiene(bot, 10), [1, 2, 3, 4, 5])
+        bot.refresh_from_db()
+        self.assertIsNone(bot.hygiene_cursor)
+
+
+class BroadcastTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:broadcast')
+        started = timezone.now() - timedelta(days=1)
+        for telegram_id in range(1, 6):
+            BotUser.objects.create(bot=cls.bot, telegram_id=telegram_id, started_at=started)
+
+    def enqueue(self):
+        return enqueue_broadcast(self.bot, 'text', {'text': 'Hello'})
+
+    def sent_to(self, telegram):
+        return sorted(payload['chat_id'] for method, payload in telegram.calls if method == 'sendMessage')
+
+
+class BroadcastOwnershipTests(BroadcastTestCase):
+    def test_reclaimed_job_is_left_to_the_new_worker(self):
+        self.enqueue()
+        job = claim_broadcast_job('w1')
+        BroadcastJob.objects.filter(pk=job.pk).update(worker='w2')
+
+        telegram = FakeTelegram()
+        with telegram.patch(), self.assertLogs('hub.broadcast', 'WARNING'):
+            job = run_broadcast_job(job)
+        self.assertEqual((job.status, job.worker, job.sent_count, job.cursor), (BroadcastJob.STATUS_RUNNING, 'w2', 0, None))
+        self.assertFalse(SendLog.objects.exists())
+
+    def test_checkpoint_of_a_lost_job_writes_nothing(self):
+        self.enqueue()
+        job = claim_broadcast_job('w1')
+        BroadcastJob.objects.filter(pk=job.pk).update(worker='w2', cursor=3, sent_count=3)
+        user_ids = dict(BotUser.objects.filter(telegram_id__in=[1, 2]).values_list('telegram_id', 'id'))
+        with self.assertRaises(BroadcastJobLost):
+            checkpoint_broadcast_job(job, user_ids, [(1, {'ok': True}), (2, {'ok': True})])
+        job.refresh_from_db()
+        self.assertEqual((job.cursor, job.sent_count), (3, 3))
+        self.assertFalse(SendLog.objects.exists())
+
+    @override_settings(TELEGRAM_BROADCAST={'HEARTBEAT_EVERY': 0.05})
+    def test_engine_beats_while_a_send_is_stalled(self):
+        beats = []
+
+        def slow_send(api, chat_id):
+            time.sleep(0.3)
+            return {'ok': True}
+
+        engine = BroadcastEngine(self.bot, workers=1)
+        results = list(engine.run([1], slow_send, heartbeat=lambda: beats.append(time.monotonic())))
+        self.assertEqual(results, [(1, {'ok': True})])
+        self.assertGreaterEqual(len(beats), 2)
+
+    @override_settings(TELEGRAM_BROADCAST={'HEARTBEAT_EVERY': 0.05})
+    def test_failed_heartbeat_stops_the_engine(self):
+        def slow_send(api, chat_id):
+            time.sleep(0.1)
+            return {'ok': True}
+
+        def lost():
+            raise BroadcastJobLost('gone')
+
+        engine = BroadcastEngine(self.bot, workers=1)
+        with self.assertRaises(BroadcastJobLost):
+            list(engine.run(range(1, 50), slow_send, heartbeat=lost))
+
+
+class WorkerDied(BaseException):
+    """Escapes every ``except Exception``, like the process being killed."""
+
+
+class BroadcastJobTests(BroadcastTestCase):
+    def stale(self, job):
+        BroadcastJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+    def test_claim_takes_pending_jobs_oldest_first(self):
+        first, second = self.enqueue(), self.enqueue()
+        self.assertEqual(claim_broadcast_job('w1').pk, first.pk)
+        self.assertEqual(claim_broadcast_job('w2').pk, second.pk)
+        self.assertIsNone(claim_broadcast_job('w3'))
+
+    def test_running_job_is_reclaimed_only_once_its_heartbeat_is_stale(self):
+        self.enqueue()
+        job = claim_broadcast_job('w1')
+        self.assertIsNone(claim_broadcast_job('w2'))
+        self.stale(job)
+        reclaimed = claim_broadcast_job('w2')
+        self.assertEqual((reclaimed.pk, reclaimed.worker), (job.pk, 'w2'))
+
+    @override_settings(TELEGRAM_BROADCAST={'CHECKPOINT_EVERY': 2, 'WORKERS': 1})
+    def test_resume_from_cursor_after_a_crash(self):
+        self.enqueue()
+        job = claim_broadcast_job('w1')
+        telegram = FakeTelegram()
+
+        def dies_on_chat_3(client, method, **kwargs):
+            if (kwargs.get('json') or {}).get('chat_id') == 3:
+                raise WorkerDied()
+            return telegram(client, method, **kwargs)
+
+        with mock.patch.object(TelegramClient, 'request', autospec=True, side_effect=dies_on_chat_3):
+            with self.assertRaises(WorkerDied):
+                run_broadcast_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.cursor, job.sent_count), (BroadcastJob.STATUS_RUNNING, 2, 2))
+
+        self.stale(job)
+        job = claim_broadcast_job('w2')
+        resumed = FakeTelegram()
+        with resumed.patch():
+            job = run_broadcast_job(job)
+        self.assertEqual(self.sent_to(resumed), [3, 4, 5])
+        self.assertEqual((job.status, job.sent_count, job.cursor), (BroadcastJob.STATUS_COMPLETED, 5, 5))
+        self.assertEqual(SendLog.objects.count(), 5)
+
+    def run_cancelled_after(self, chunks, **conf):
+        """Run a job, cancelling it as the ``chunks``-th chunk is checkpointed."""
+        self.enqueue()
+        job = claim_broadcast_job('w1')
+        checkpoints = []
+        real_checkpoint = broadcast.checkpoint_broadcast_job
+
+        def checkpoint(job, user_ids, results):
+            checkpoints.append(sorted(user_ids))
+            if len(checkpoints) == chunks:
+                BroadcastJob.objects.filter(pk=job.pk).update(status=BroadcastJob.STATUS_CANCELLED)
+            real_checkpoint(job, user_ids, results)
+
+        telegram = FakeTelegram()
+        with override_settings(TELEGRAM_BROADCAST=conf), telegram.patch(), \
+                mock.patch.object(broadcast, 'checkpoint_broadcast_job', side_effect=checkpoint):
+            job = run_broadcast_job(job)
+        return job, telegram
+
+    def test_cancel_while_running_stops_after_the_current_chunk(self):
+        job, telegram = self.run_cancelled_after(1, CHECKPOINT_EVERY=2)
+        self.assertEqual(self.sent_to(telegram), [1, 2])
+        self.assertEqual((job.status, job.sent_count), (BroadcastJob.STATUS_CANCELLED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_cancel_during_the_last_chunk_is_kept(self):
+        job, telegram = self.run_cancelled_after(1, CHECKPOINT_EVERY=10)
+        self.assertEqual(self.sent_to(telegram), [1, 2, 3, 4, 5])
+        self.assertEqual((job.status, job.sent_count), (BroadcastJob.STATUS_CANCELLED, 5))
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class BroadcastClaimSkipLockedTests(TransactionTestCase):
+    def test_concurrent_claims_skip_a_locked_job(self):
+        bot = Bot.objects.create(name='Bot', token='111:skip')
+        first = enqueue_broadcast(bot, 'text', {'text': 'a'})
+        second = enqueue_broadcast(bot, 'text', {'text': 'b'})
+        locked, release, claimed = threading.Event(), threading.Event(), []
+
+        def hold_first():
+            try:
+                with transaction.atomic():
+                    BroadcastJob.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_first)
+        holder.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            claimed.append(claim_broadcast_job('w1'))
+        finally:
+            release.set()
+            holder.join()
+        self.assertEqual(claimed[0].pk, second.pk)
+
+
+class UpdatesTestCase(TestCase):
+    def setUp(self):
+        # Snapshots are keyed on bot id, which a rolled-back test may reuse
+        user_cache.backend.clear()
+
+    def failing_start(self, *update_ids):
+        """Patch StartHandler so the given updates raise after it has done its work."""
+        handle = StartHandler.handle
+
+        def side_effect(handler, batch, upd):
+            handled = handle(handler, batch, upd)
+            if upd['update_id'] in update_ids:
+                raise RuntimeError(f"boom {upd['update_id']}")
+            return handled
+
+        return mock.patch.object(StartHandler, 'handle', autospec=True, side_effect=side_effect)
+
+
+class WebhookEventTests(UpdatesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:webhook')
+
+    def queue(self, *updates, bot=None):
+        return [
+            WebhookEvent.objects.create(bot=bot or self.bot, update_id=upd['update_id'], event_type='message', payload=upd)
+            for upd in updates
+        ]
+
+    def test_events_are_applied_in_update_id_order(self):
+        self.queue(start_update(12, 502), start_update(11, 501))
+        self.assertEqual(process_webhook_events(), 2)
+        self.assertEqual(list(MessageLog.objects.order_by('id').values_list('update_id', flat=True)), [11, 12])
+        for event in WebhookEvent.objects.all():
+            self.assertEqual(event.status, WebhookEvent.STATUS_PROCESSED)
+            self.assertIsNotNone(event.processed_at)
+            self.assertIsNone(event.payload)
+
+    @override_settings(TELEGRAM_PAYLOADS={'POLICY': 'inline'})
+    def test_inline_policy_keeps_the_payload(self):
+        self.queue(start_update(11, 501))
+        process_webhook_events()
+        self.assertEqual(WebhookEvent.objects.get().payload, start_update(11, 501))
+
+    def test_one_bot_per_call(self):
+        other = Bot.objects.create(name='Other', token='222:webhook')
+        self.queue(start_update(11, 501))
+        self.queue(start_update(7, 601), bot=other)
+        self.queue(start_update(12, 502))
+        self.assertEqual(process_webhook_events(), 2)
+        self.assertEqual(WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PENDING).get().bot, other)
+        self.assertEqual(process_webhook_events(), 1)
+        self.assertEqual(process_webhook_events(), 0)
+
+    def test_failing_event_is_retried_then_marked_failed(self):
+        failing, ok = self.queue(start_update(21, 501), start_update(22, 502))
+        with self.failing_start(21), self.assertLogs('hub.updates', 'ERROR'):
+            process_webhook_events()
+            failing.refresh_from_db()
+            ok.refresh_from_db()
+            self.assertEqual((failing.status, failing.attempts, failing.error), (WebhookEvent.STATUS_PENDING, 1, 'boom 21'))
+            self.assertEqual(failing.payload, start_update(21, 501))
+            self.assertEqual(ok.status, WebhookEvent.STATUS_PROCESSED)
+
+            for _ in range(WEBHOOK_MAX_ATTEMPTS - 1):
+                self.assertEqual(process_webhook_events(), 1)
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), (WebhookEvent.STATUS_FAILED, WEBHOOK_MAX_ATTEMPTS))
+        self.assertEqual(failing.payload, start_update(21, 501))
+        self.assertEqual(process_webhook_events(), 0)
+        self.assertEqual(list(MessageLog.objects.values_list('update_id', flat=True)), [22])
+
+
+class ImportUpdatesTests(UpdatesTestCase):
+    def test_import_leaves_the_poller_offset_so_the_welcome_is_sent(self):
+        bot = Bot.objects.create(name='Bot', token='111:import', last_update_id=5)
+        telegram = FakeTelegram([start_update(10, 501)])
+        with telegram.patch():
+            response = self.client.post(
+                '/hub/import_updates/', json.dumps({'bot_token': bot.token}), content_type='application/json',
+            )
+            self.assertEqual(response.json()['started_marked'], 1)
+            self.assertEqual(telegram.methods(), ['getUpdates'])
+            bot.refresh_from_db()
+            self.assertEqual(bot.last_update_id, 5)
+
+            # The poller later receives the same update and answers it
+            with self.captureOnCommitCallbacks(execute=True):
+                batch = process_updates(bot, telegram.updates)
+        self.assertEqual(batch.applied, 1)
+        self.assertEqual(telegram.methods(), ['getUpdates', 'sendMessage', 'pinChatMessage'])
+        self.assertEqual(telegram.calls[1][1]['chat_id'], 501)
+        bot.refresh_from_db()
+        self.assertEqual(bot.last_update_id, 10)
+
+
+def callback_update(update_id, chat_id, data):
+    return {
+        'update_id': update_id,
+        'callback_query': {'id': str(update_id), 'from': {'id': chat_id}, 'message': {'chat': {'id': chat_id}},
+                           'data': data},
+    }
+
+
+class UpdateSavepointTests(UpdatesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bot = Bot.objects.create(name='Bot', token='111:savepoint')
+
+    def process(self, updates, *failing):
+        telegram = FakeTelegram()
+        with telegram.patch(), self.failing_start(*failing), self.assertLogs('hub.updates', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            batch = process_updates(self.bot, updates)
+        return batch, telegram
+
+    def test_failed_update_is_undone_and_the_rest_applied(self):
+        batch, telegram = self.process([start_update(31, 701), start_update(32, 702)], 31)
+
+        self.assertEqual(batch.errors, {31: 'boom 31'})
+        self.assertEqual(batch.started_users, 1)
+        failed = BotUser.objects.get(bot=self.bot, telegram_id=701)
+        self.assertEqual((failed.state, failed.started_at), (None, None))
+        self.assertEqual(BotUser.objects.get(bot=self.bot, telegram_id=702).state, 'await_button')
+        self.assertEqual(list(MessageLog.objects.values_list('chat_id', flat=True)), [702])
+        # Only the successful update's replies are sent
+        self.assertEqual({payload['chat_id'] for method, payload in telegram.calls}, {702})
+
+    def test_undo_restores_changes_of_earlier_updates_in_the_batch(self):
+        batch, telegram = self.process(
+            [callback_update(41, 801, 'enable_questions'), start_update(42, 801)], 42,
+        )
+        user = BotUser.objects.get(bot=self.bot, telegram_id=801)
+        self.assertEqual(user.state, 'enabled')
+        self.assertIsNotNone(user.started_at)
+        self.assertEqual(batch.started_users, 1)
+        self.assertFalse(MessageLog.objects.exists())
+        self.assertEqual(telegram.methods(), ['answerCallbackQuery', 'sendMessage'])
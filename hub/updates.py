@@ -0,0 +1,609 @@
+"""
+Telegram update pipeline shared by every ingestion path.
+
+Updates reach the hub three ways: the webhook queue (``process_webhook_events``),
+long polling (``poll_updates`` / ``poll_all_updates``) and the ``import_updates``
+endpoint. All of them hand a list of raw updates to ``process_updates``, which
+applies it as one unit: BotUsers are resolved with one ``telegram_id__in``
+query plus a ``bulk_create`` for newcomers, profile/state/``last_seen_at``
+changes are written with ``bulk_update`` and MessageLogs with
+``bulk_create``, all in a single transaction. Replies to users (welcome,
+prompts, pins) are queued with ``transaction.on_commit`` so nothing is sent
+for a batch that rolled back. Each update is applied in a savepoint; when a
+handler raises, that update's changes are undone and its replies dropped,
+and the rest of the batch goes ahead.
+
+The conversation flow is split into handlers (see ``HANDLERS``). For every
+update each handler in turn may claim the users it needs and apply its part
+of the flow against the in-memory BotUser objects, so later updates in a
+batch see the state set by earlier ones. Extra handlers can be added with
+``register_handler``.
+
+Known users come from ``hub.cache.user_cache`` instead of the database
+(only ``is_blocked`` and ``state``, which other processes write, are
+re-read in one query per batch) and ``last_seen_at`` is written at most
+once per ``LAST_SEEN_INTERVAL`` seconds per user, so a chatty user whose
+messages are gated costs no writes.
+
+Raw payloads are not kept in MessageLog unless the payload policy says so;
+see hub/payloads.py.
+
+Polled batches are idempotent per ``(bot, update_id)``: ``Bot.last_update_id``
+is advanced in the batch transaction and pollers resume from it. Webhook
+events are already deduplicated by their ``(bot, update_id)`` unique key.
+"""
+import json
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .cache import cache_settings, user_cache
+from .models import Bot, BotUser, MessageLog, WebhookEvent
+from .payloads import POLICY_INLINE, POLICY_OFF, archive_updates, keep_inline, payload_settings
+from .telegram import get_client
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'language_code')
+
+ASK_ANOTHER_MARKUP = {
+    'inline_keyboard': [[
+        {
+            'text': 'Ask another question',
+            'callback_data': 'enable_questions'
+        }
+    ]]
+}
+
+
+def _profile(from_user: dict, chat: dict | None = None) -> dict:
+    chat = chat or {}
+    return {field: from_user.get(field) or chat.get(field) for field in PROFILE_FIELDS}
+
+
+def _message(upd: dict) -> dict:
+    return upd.get('message') or upd.get('edited_message') or {}
+
+
+def _message_chat_id(msg: dict):
+    return (msg.get('chat') or {}).get('id') or (msg.get('from') or {}).get('id')
+
+
+class UpdateBatch:
+    """DB writes and outbound replies collected while applying one batch.
+
+    With ``side_effects=False`` replies are dropped, which lets historical
+    updates (``import_updates``) be ingested without messaging users again.
+    """
+
+    def __init__(self, bot, side_effects: bool = True):
+        self.bot = bot
+        self.client = get_client(bot.token) if side_effects else None
+        self.now = timezone.now()
+        self.last_seen_interval = cache_settings()['LAST_SEEN_INTERVAL']
+        self.payload_policy = payload_settings()['POLICY']
+        self.users = {}
+        self.loaded = set()  # telegram_ids read from the database, not the cache
+        self.dirty = defaultdict(set)
+        self.logs = []
+        self.applied = 0
+        self.created_users = 0
+        self.started_users = 0
+        self.errors = {}  # update_id -> error message
+        self._undo = None  # (user, field, old value, was dirty) while applying an update
+        self._pending = None  # replies of the update being applied
+
+    def resolve_users(self, wanted: dict) -> None:
+        """Load or create BotUsers for ``{telegram_id: creation defaults}``."""
+        self.users = user_cache.get_many(self.bot, wanted)
+        if self.users:
+            # The broadcast worker and the admin change these without reaching
+            # a per-process cache; a user deleted meanwhile is loaded afresh.
+            fresh = {
+                tid: (is_blocked, state) for tid, is_blocked, state in BotUser.objects.filter(
+                    bot=self.bot, telegram_id__in=list(self.users),
+                ).values_list('telegram_id', 'is_blocked', 'state')
+            }
+            self.users = {tid: user for tid, user in self.users.items() if tid in fresh}
+            for tid, user in self.users.items():
+                user.is_blocked, user.state = fresh[tid]
+        uncached = [tid for tid in wanted if tid not in self.users]
+        if uncached:
+            loaded = {u.telegram_id: u for u in BotUser.objects.filter(bot=self.bot, telegram_id__in=uncached)}
+            self.users.update(loaded)
+            self.loaded.update(loaded)
+        missing = [tid for tid in wanted if tid not in self.users]
+        if missing:
+            BotUser.objects.bulk_create(
+                [BotUser(bot=self.bot, telegram_id=tid, **wanted[tid]) for tid in missing],
+                ignore_conflicts=True,
+            )
+            # ignore_conflicts does not return primary keys; re-read the new rows
+            created = {u.telegram_id: u for u in BotUser.objects.filter(bot=self.bot, telegram_id__in=missing)}
+            self.users.update(created)
+            self.loaded.update(created)
+            self.created_users += len(created)
+
+    @contextmanager
+    def applying(self):
+        """Apply one update in a savepoint; if the body raises, undo its changes.
+
+        Field changes, logs and the started count of a failed update are
+        rolled back and its replies are dropped, so a retry of the same
+        update does not message the user twice. Replies of a successful
+        update are queued for after the batch commits.
+        """
+        self._undo, self._pending = [], []
+        logs, started_users = len(self.logs), self.started_users
+        try:
+            with transaction.atomic():
+                yield
+        except Exception:
+            for user, field, value, was_dirty in reversed(self._undo):
+                setattr(user, field, value)
+                if not was_dirty:
+                    self.dirty[user.telegram_id].discard(field)
+                    if not self.dirty[user.telegram_id]:
+                        del self.dirty[user.telegram_id]
+            del self.logs[logs:]
+            self.started_users = started_users
+            raise
+        else:
+            for send in self._pending:
+                transaction.on_commit(send)
+        finally:
+            self._undo = self._pending = None
+
+    def set(self, user: BotUser, **values) -> None:
+        for field, value in values.items():
+            if self._undo is not None:
+                self._undo.append((user, field, getattr(user, field), field in self.dirty.get(user.telegram_id, ())))
+            setattr(user, field, value)
+            self.dirty[user.telegram_id].add(field)
+
+    def touch(self, user: BotUser) -> None:
+        """Record activity, coalescing ``last_seen_at`` writes per user."""
+        last_seen_at = user.last_seen_at
+        if last_seen_at is None or (self.now - last_seen_at).total_seconds() >= self.last_seen_interval:
+            self.set(user, last_seen_at=self.now)
+
+    def mark_started(self, user: BotUser) -> None:
+        if not user.started_at:
+            self.set(user, started_at=self.now)
+            self.started_users += 1
+
+    def log(self, user: BotUser, msg: dict, update_id=None) -> None:
+        self.logs.append(MessageLog(
+            bot=self.bot,
+            bot_user=user,
+            message_id=str(msg.get('message_id')) if msg.get('message_id') is not None else None,
+            chat_id=user.telegram_id,
+            from_user_id=(msg.get('from') or {}).get('id'),
+            text=(msg.get('text') or '').strip() or None,
+            raw=msg if self.payload_policy == POLICY_INLINE else None,
+            update_id=update_id,
+        ))
+
+    def reply(self, method: str, payload: dict, what: str, then=None) -> None:
+        """Send ``method`` after the batch commits; ``then(js)`` may chain a call."""
+        if self.client is None:
+            return
+
+        def send():
+            try:
+                js = self.client.request(method, json=payload, timeout=10)
+            except Exception as ex:
+                logger.warning(f"Error {what}: {ex}")
+                return
+            if then is not None:
+                then(js)
+        if self._pending is not None:
+            self._pending.append(send)
+        else:
+            # Chained from a sent reply, i.e. after the batch committed
+            transaction.on_commit(send)
+
+    def flush(self) -> None:
+        groups = defaultdict(list)
+        for telegram_id, fields in self.dirty.items():
+            groups[frozenset(fields)].append(self.users[telegram_id])
+        for fields, users in groups.items():
+            BotUser.objects.bulk_update(users, sorted(fields))
+        if self.logs:
+            MessageLog.objects.bulk_create(self.logs)
+        # Rows served from the cache and left untouched are not stored again,
+        # so their entries still expire USER_CACHE_TTL after they were loaded
+        users = [user for tid, user in self.users.items() if tid in self.loaded or tid in self.dirty]
+        if users:
+            transaction.on_commit(lambda: user_cache.store(users))
+
+
+class UpdateHandler:
+    """One step of the conversation flow.
+
+    ``users(upd)`` returns ``{telegram_id: creation defaults}`` for every user
+    the handler will touch, so the batch can resolve them all up front.
+    ``handle(batch, upd)`` applies the step and returns True to stop later
+    handlers from seeing the update.
+    """
+
+    def users(self, upd: dict) -> dict:
+        return {}
+
+    def handle(self, batch: UpdateBatch, upd: dict) -> bool:
+        raise NotImplementedError
+
+
+class CallbackQueryHandler(UpdateHandler):
+    """Inline buttons from the /start intro and the relock prompt."""
+
+    @staticmethod
+    def _chat_id(callback_query: dict):
+        cq_chat = (callback_query.get('message') or {}).get('chat') or {}
+        return cq_chat.get('id') or (callback_query.get('from') or {}).get('id')
+
+    def users(self, upd):
+        callback_query = upd.get('callback_query') or {}
+        cq_chat_id = self._chat_id(callback_query)
+        if not cq_chat_id:
+            return {}
+        return {cq_chat_id: {**_profile(callback_query.get('from') or {}), 'last_seen_at': timezone.now()}}
+
+    def handle(self, batch, upd):
+        callback_query = upd.get('callback_query')
+        if not callback_query:
+            return False
+        cq_chat_id = self._chat_id(callback_query)
+        if not cq_chat_id:
+            return True
+        data = callback_query.get('data') or ''
+
+        bot_user = batch.users[cq_chat_id]
+        batch.touch(bot_user)
+
+        # Acknowledge callback to avoid loading state on client
+        batch.reply('answerCallbackQuery', {
+            'callback_query_id': callback_query.get('id'),
+            'text': 'Ready! You can send your question now.',
+            'show_alert': False,
+        }, 'answering callback')
+
+        if data == 'enable_questions':
+            batch.set(bot_user, state='enabled')
+            batch.mark_started(bot_user)
+            batch.reply('sendMessage', {
+                'chat_id': cq_chat_id,
+                'text': 'You can now send your question about campaigns/candidates.',
+            }, 'sending enabled message')
+        elif data == 'request_contact_btn':
+            # Show a reply keyboard that requests contact
+            batch.reply('sendMessage', {
+                'chat_id': cq_chat_id,
+                'text': 'Please tap the button below to share your phone number.',
+                'reply_markup': {
+                    'keyboard': [[{'text': 'Share my phone number', 'request_contact': True}]],
+                    'resize_keyboard': True,
+                    'one_time_keyboard': True,
+                }
+            }, 'sending contact request keyboard')
+        return True
+
+
+class ChatMemberHandler(UpdateHandler):
+    """``my_chat_member``: the user started or blocked the bot."""
+
+    def users(self, upd):
+        from_user = (upd.get('my_chat_member') or {}).get('from') or {}
+        if not from_user.get('id'):
+            return {}
+        return {from_user['id']: {**_profile(from_user), 'last_seen_at': timezone.now()}}
+
+    def handle(self, batch, upd):
+        my_chat_member = upd.get('my_chat_member')
+        if not my_chat_member:
+            return False
+        from_user = my_chat_member.get('from') or {}
+        if not from_user.get('id'):
+            return True
+
+        bot_user = batch.users[from_user['id']]
+        batch.touch(bot_user)
+        new_status = (my_chat_member.get('new_chat_member') or {}).get('status')
+        if new_status == 'member':
+            batch.mark_started(bot_user)
+            if bot_user.is_blocked:
+                batch.set(bot_user, is_blocked=False)
+        elif new_status == 'kicked' and not bot_user.is_blocked:
+            batch.set(bot_user, is_blocked=True)
+        return True
+
+
+class ProfileHandler(UpdateHandler):
+    """Refresh the sender's profile and ``last_seen_at`` for every message."""
+
+    def users(self, upd):
+        msg = _message(upd)
+        chat_id = _message_chat_id(msg)
+        if not chat_id:
+            return {}
+        return {chat_id: {**_profile(msg.get('from') or {}, msg.get('chat')), 'last_seen_at': timezone.now()}}
+
+    def handle(self, batch, upd):
+        msg = _message(upd)
+        chat_id = _message_chat_id(msg)
+        if not chat_id:
+            return True
+
+        bot_user = batch.users[chat_id]
+        # Update missing/changed profile fields when provided
+        changed = {
+            field: value for field, value in _profile(msg.get('from') or {}, msg.get('chat')).items()
+            if value and getattr(bot_user, field) != value
+        }
+        batch.set(bot_user, **changed)
+        batch.touch(bot_user)
+        return False
+
+
+class ContactHandler(UpdateHandler):
+    """Save the phone number from a shared contact."""
+
+    @staticmethod
+    def _target(msg: dict):
+        contact = msg.get('contact') or {}
+        return contact.get('user_id') or (msg.get('from') or {}).get('id') or _message_chat_id(msg)
+
+    def users(self, upd):
+        msg = _message(upd)
+        if not msg.get('contact'):
+            return {}
+        target_user_id = self._target(msg)
+        if not target_user_id:
+            return {}
+        return {target_user_id: _profile(msg.get('from') or {}, msg.get('chat'))}
+
+    def handle(self, batch, upd):
+        msg = _message(upd)
+        contact = msg.get('contact') or {}
+        if not contact:
+            return False
+
+        logger.info("Contact received: %s", json.dumps(contact))
+        chat_id = _message_chat_id(msg)
+        phone = (contact.get('phone_number') or '').strip()
+        bu = batch.users[self._target(msg)]
+        if phone and (not bu.phone_number or bu.phone_number != phone):
+            batch.set(bu, phone_number=phone)
+            logger.info(f"Saved phone for user {bu.telegram_id}: {phone}")
+            # Hide the contact keyboard and unpin the request message(s)
+            batch.reply('sendMessage', {
+                'chat_id': chat_id,
+                'text': 'Thanks! Your phone number was received.',
+                'reply_markup': {'remove_keyboard': True},
+            }, 'sending confirmation/hiding keyboard')
+            batch.reply('unpinAllChatMessages', {'chat_id': chat_id}, 'unpinning messages')
+        else:
+            logger.info(f"No phone saved. Existing={bu.phone_number!r} Incoming={phone!r}")
+        return False
+
+
+class StartHandler(UpdateHandler):
+    """/start: register the user and send the pinned intro with buttons."""
+
+    def handle(self, batch, upd):
+        msg = _message(upd)
+        if not (msg.get('text') or '').strip().startswith('/start'):
+            return False
+        chat_id = _message_chat_id(msg)
+        bot_user = batch.users[chat_id]
+        batch.mark_started(bot_user)
+        if bot_user.is_blocked:
+            batch.set(bot_user, is_blocked=False)
+        batch.set(bot_user, state='await_button')
+        batch.log(bot_user, msg, upd.get('update_id'))
+
+        def pin(send_js):
+            message_to_pin_id = (send_js.get('result') or {}).get('message_id') if send_js.get('ok') else None
+            if message_to_pin_id:
+                batch.reply('pinChatMessage', {
+                    'chat_id': chat_id,
+                    'message_id': message_to_pin_id,
+                    'disable_notification': True,
+                }, 'pinning message')
+
+        batch.reply('sendMessage', {
+            'chat_id': chat_id,
+            'text': "Welcome! Use the buttons below to ask a question or share your phone number.",
+            'reply_markup': {
+                'inline_keyboard': [
+                    [
+                        {
+                            'text': 'Ask a question',
+                            'callback_data': 'enable_questions'
+                        },
+                        {
+                            'text': 'Share my phone number',
+                            'callback_data': 'request_contact_btn'
+                        }
+                    ]
+                ]
+            },
+        }, 'sending intro/button', then=pin)
+        return True
+
+
+class TextHandler(UpdateHandler):
+    """Any other message: accept one question after 'Ask a question', else gate it."""
+
+    def handle(self, batch, upd):
+        msg = _message(upd)
+        chat_id = _message_chat_id(msg)
+        bot_user = batch.users[chat_id]
+
+        if bot_user.state != 'enabled':
+            # Gate messages until enabled: delete the incoming message to simulate blocking send
+            incoming_message_id = msg.get('message_id')
+            if incoming_message_id is not None:
+                batch.reply('deleteMessage', {
+                    'chat_id': chat_id,
+                    'message_id': incoming_message_id,
+                }, 'deleting gated message')
+            batch.reply('sendMessage', {
+                'chat_id': chat_id,
+                'text': 'Thanks! Press the button to ask another question.',
+                'reply_markup': ASK_ANOTHER_MARKUP,
+            }, 'sending gate prompt')
+            return True
+
+        batch.log(bot_user, msg, upd.get('update_id'))
+
+        # After accepting one question, close chat again until button is pressed
+        batch.set(bot_user, state='await_button')
+        batch.reply('sendMessage', {
+            'chat_id': chat_id,
+            'text': 'Thanks! Press the button to ask another question.',
+            'reply_markup': ASK_ANOTHER_MARKUP,
+        }, 'sending relock prompt')
+        return True
+
+
+# Order matters: ProfileHandler ends the chain for updates without a message,
+# so handlers for other update types must come before it.
+HANDLERS: list[UpdateHandler] = [
+    CallbackQueryHandler(),
+    ChatMemberHandler(),
+    ProfileHandler(),
+    ContactHandler(),
+    StartHandler(),
+    TextHandler(),
+]
+
+
+def register_handler(handler: UpdateHandler, before: type | None = None) -> None:
+    """Add ``handler`` to the chain, at the end or ahead of the ``before`` handler class."""
+    if before is not None:
+        for index, existing in enumerate(HANDLERS):
+            if isinstance(existing, before):
+                HANDLERS.insert(index, handler)
+                return
+    HANDLERS.append(handler)
+
+
+def _wanted_users(updates: list) -> dict:
+    """Map every telegram_id referenced by the batch to its creation defaults."""
+    wanted = {}
+    for upd in updates:
+        for handler in HANDLERS:
+            for telegram_id, defaults in handler.users(upd).items():
+                wanted.setdefault(telegram_id, defaults)
+    return wanted
+
+
+def process_updates(bot, updates: list, side_effects: bool = True, track_offset: bool = True) -> UpdateBatch:
+    """Apply a batch of updates for ``bot`` in one transaction, then send replies.
+
+    With ``track_offset`` the bot row is locked and ``Bot.last_update_id``
+    advanced in the same transaction, so updates Telegram redelivers after a
+    restart (or that a second poller already handled) are skipped instead of
+    re-running their side effects. ``side_effects=False`` suppresses replies.
+    Returns the batch; ``applied``, ``created_users``, ``started_users`` and
+    ``errors`` describe what happened.
+    """
+    batch = UpdateBatch(bot, side_effects=side_effects)
+    updates = sorted(updates, key=lambda upd: upd['update_id'])
+    with transaction.atomic():
+        if track_offset:
+            last_update_id = Bot.objects.select_for_update().values_list('last_update_id', flat=True).get(pk=bot.pk)
+            if last_update_id is not None:
+                updates = [upd for upd in updates if upd['update_id'] > last_update_id]
+        if not updates:
+            return batch
+        batch.resolve_users(_wanted_users(updates))
+        for upd in updates:
+            # One bad update is undone and skipped without rolling back the
+            # rest of the batch (see UpdateBatch.applying).
+            try:
+                with batch.applying():
+                    for handler in HANDLERS:
+                        if handler.handle(batch, upd):
+                            break
+            except Exception as ex:
+                logger.exception("Error processing update %s for bot %s", upd.get('update_id'), bot.id)
+                batch.errors[upd.get('update_id')] = str(ex)
+        batch.flush()
+        batch.applied = len(updates)
+        if batch.payload_policy not in (POLICY_INLINE, POLICY_OFF):
+            transaction.on_commit(lambda: _archive(bot, updates))
+        if track_offset:
+            bot.last_update_id = max(upd['update_id'] for upd in updates)
+            Bot.objects.filter(pk=bot.pk).update(last_update_id=bot.last_update_id)
+    return batch
+
+
+def _archive(bot, updates: list) -> None:
+    try:
+        archive_updates(bot.id, updates)
+    except Exception as ex:
+        logger.warning(f"Error archiving updates for bot {bot.id}: {ex}")
+
+
+WEBHOOK_MAX_ATTEMPTS = 5
+
+
+def process_webhook_events(limit: int = 100) -> int:
+    """Apply up to ``limit`` pending webhook events of one bot; returns how many were taken.
+
+    A worker claims a *bot*, not individual events: it locks the Bot row of
+    the bot with the oldest pending event (``FOR NO KEY UPDATE SKIP
+    LOCKED``, which does not block webhook inserts referencing it) and
+    applies that bot's pending events in ``update_id`` order as one
+    ``process_updates`` batch. Several workers (threads or processes) can
+    drain the queue concurrently, but never two for the same bot, so each
+    chat's conversation state moves in order. A failing event is retried up
+    to WEBHOOK_MAX_ATTEMPTS times, then left as failed for inspection.
+    Unless the payload policy is ``inline``, a processed event's payload is
+    dropped (see hub/payloads.py).
+    """
+    keep_payload = keep_inline()
+    pending = WebhookEvent.objects.filter(status=WebhookEvent.STATUS_PENDING)
+    with transaction.atomic():
+        bot = (
+            Bot.objects.select_for_update(skip_locked=True, no_key=True)
+            .annotate(oldest_event=Subquery(pending.filter(bot=OuterRef('pk')).order_by('id').values('id')[:1]))
+            .filter(oldest_event__isnull=False)
+            .order_by('oldest_event')
+            .first()
+        )
+        if bot is None:
+            return 0
+        events = list(pending.filter(bot=bot).order_by('update_id')[:limit])
+        for event in events:
+            event.attempts += 1
+
+        try:
+            # Savepoint: a failed batch must not lose the events' status updates
+            with transaction.atomic():
+                # Events can arrive after a later update_id was applied, so
+                # dedupe relies on the event key rather than last_update_id.
+                batch = process_updates(bot, [event.payload for event in events], track_offset=False)
+            errors = batch.errors
+        except Exception as ex:
+            logger.exception("Error processing webhook events for bot %s", bot.id)
+            errors = {event.update_id: str(ex) for event in events}
+
+        for event in events:
+            if event.update_id in errors:
+                event.error = errors[event.update_id]
+                if event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                    event.status = WebhookEvent.STATUS_FAILED
+                continue
+            event.status = WebhookEvent.STATUS_PROCESSED
+            event.processed_at = timezone.now()
+            if not keep_payload:
+                event.payload = None
+        WebhookEvent.objects.bulk_update(events, ['status', 'attempts', 'error', 'processed_at', 'payload'])
+    return len(events)
@@ -10,6 +10,7 @@ from .views import (
     bot_logs_html,
     bot_logs_pdf,
     bot_logs_html_token,
+    bot_logs_data,
     bot_logs_pdf_token,
     send_to_chat,
     update_bot_profile,
@@ -27,6 +28,10 @@ from .views import (
     test_webhook,     # Add this
     import_updates,
     broadcast_action,
+    broadcast_job_status,
+    create_report,
+    report_job_status,
+    report_job_download,
     election_dashboard,
     public_landing,
     candidate_landing,
@@ -51,6 +56,7 @@ urlpatterns = [
     path('upload_photo/', upload_photo, name='hub_upload_photo'),
     path('logs/<int:bot_id>/', bot_logs_html, name='hub_logs_html'),
     path('logs/<int:bot_id>/pdf/', bot_logs_pdf, name='hub_logs_pdf'),
+    path('logs/<int:bot_id>/data/', bot_logs_data, name='hub_logs_data'),
     path('logs/token/<str:bot_token>/', bot_logs_html_token, name='hub_logs_html_token'),
     path('logs/token/<str:bot_token>/pdf/', bot_logs_pdf_token, name='hub_logs_pdf_token'),
     path('send_to_chat/', send_to_chat, name='hub_send_to_chat'),
@@ -61,6 +67,10 @@ urlpatterns = [
     path('broadcast/', broadcast),
     path('broadcast_all/', broadcast_all),
     path('broadcast_action/', broadcast_action),
+    path('broadcast_jobs/<int:job_id>/', broadcast_job_status, name='hub_broadcast_job_status'),
+    path('reports/', create_report, name='hub_create_report'),
+    path('reports/<int:job_id>/', report_job_status, name='hub_report_job_status'),
+    path('reports/<int:job_id>/download/', report_job_download, name='hub_report_job_download'),
     path('import_updates/', import_updates),
     path('bots/create/', create_bot),
     path('bots/start/', start_bot),
@@ -1,5 +1,4 @@
 import json
-import requests
 import logging
 from django.http import JsonResponse, HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
@@ -9,11 +8,26 @@ from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from .models import (
-    Bot, Campaign, CampaignAssignment, BotUser, SendLog, WebhookEvent, MessageLog,
+    Bot, Campaign, CampaignAssignment, BotUser, SendLog, WebhookEvent,
     Candidate, CandidateUser, Gallery, Event, EventAttendance, Speech, Poll, PollResponse, Supporter, 
     Volunteer, VolunteerActivity, FakeNewsAlert, DailyQuestion, CampaignAnalytics, Question, PollVote, Testimonial,
-    ContactMessage,
+    ContactMessage, BroadcastJob, ReportJob,
 )
+from .broadcast import build_action_sender, enqueue_broadcast
+from .cache import bot_cache
+from .counters import global_counts
+from .exports import message_log_pdf_chunks, require_reportlab
+from .reports import InvalidReport, enqueue_report, get_report, has_file
+from .landing import (
+    DESKTOP, MOBILE, get_landing_candidate, get_landing_candidate_by_name, landing_context, landing_version,
+    public_version,
+)
+from .page_cache import cache_public_page
+from .polls import record_vote
+from .message_logs import PAGE_SIZE, InvalidLogQuery, can_view_bot, filter_message_logs, message_log_page
+from .telegram import TelegramError, get_client
+from .updates import process_updates
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.core.files.storage import default_storage
@@ -21,7 +35,9 @@ from django.core.files.base import ContentFile
 from django.conf import settings
 from django.http import StreamingHttpResponse
 from django.http import FileResponse
-import mimetypes
+from urllib.parse import urlencode
+from django.utils.formats import date_format
+from django.core.exceptions import ImproperlyConfigured
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -33,11 +49,7 @@ def validate_token(request):
     token = (data.get('bot_token') or "").strip()
     if not token:
         return JsonResponse({"error": "bot_token required"}, status=400)
-    r = requests.get(f"https://api.telegram.org/bot{token}/getMe", timeout=10)
-    try:
-        js = r.json()
-    except Exception:
-        js = {"ok": False, "status_code": r.status_code}
+    js = get_client(token).request('getMe', http_method='GET', timeout=10)
     return JsonResponse(js, status=200 if js.get('ok') else 400)
 
 
@@ -50,15 +62,11 @@ def broadcast(request):
     text = (data.get('text') or "").strip()
     if not token or not chat_id or not text:
         return JsonResponse({"error": "bot_token, chat_id, text required"}, status=400)
-    r = requests.post(f"https://api.telegram.org/bot{token}/sendMessage", json={
+    js = get_client(token).request('sendMessage', json={
         "chat_id": chat_id,
         "text": text,
         "disable_web_page_preview": True,
     }, timeout=15)
-    try:
-        js = r.json()
-    except Exception:
-        js = {"ok": False, "status_code": r.status_code}
     return JsonResponse(js, status=200 if js.get('ok') else 400)
 
 
@@ -83,7 +91,7 @@ def broadcast_landing(request: HttpRequest) -> HttpResponse:
 def broadcast_landing_bot(request: HttpRequest, bot_id: int) -> HttpResponse:
     """Per-bot landing page; access controlled by simple mapping rules."""
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return HttpResponse(status=404)
 
@@ -115,7 +123,7 @@ def broadcast_landing_bot(request: HttpRequest, bot_id: int) -> HttpResponse:
 def broadcast_landing_bot_token(request: HttpRequest, bot_token: str) -> HttpResponse:
     """Per-bot landing page by token; same access rules as ID-based view."""
     try:
-        bot = Bot.objects.get(token=bot_token)
+        bot = bot_cache.get(token=bot_token)
     except Bot.DoesNotExist:
         return HttpResponse(status=404)
 
@@ -137,10 +145,75 @@ def broadcast_landing_bot_token(request: HttpRequest, bot_token: str) -> HttpRes
     return render(request, 'hub/landing.html', {'bot': bot})
 
 
+def _render_logs_page(request: HttpRequest, bot) -> HttpResponse:
+    """First page of the log viewer; later pages come from bot_logs_data."""
+    try:
+        logs, next_cursor = message_log_page(filter_message_logs(bot, request.GET))
+    except InvalidLogQuery as ex:
+        return HttpResponse(str(ex), status=400)
+    filters = {key: request.GET.get(key, '') for key in ('chat_id', 'date_from', 'date_to', 'has_phone')}
+    return render(request, 'hub/logs.html', {
+        'bot': bot,
+        'logs': logs,
+        'next_cursor': next_cursor,
+        'filters': filters,
+        'filter_query': urlencode({key: value for key, value in filters.items() if value}),
+    })
+
+
+def _message_log_pdf_response(request: HttpRequest, bot):
+    """Stream the full (filtered) log history of ``bot`` as a PDF."""
+    try:
+        require_reportlab()
+        logs = filter_message_logs(bot, request.GET)
+    except ImproperlyConfigured as ex:
+        return JsonResponse({'error': str(ex)}, status=501)
+    except InvalidLogQuery as ex:
+        return JsonResponse({'error': str(ex)}, status=400)
+    response = StreamingHttpResponse(message_log_pdf_chunks(bot, logs), content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="bot_{bot.id}_logs.pdf"'
+    return response
+
+
+@login_required()
+@require_http_methods(['GET'])
+def bot_logs_data(request: HttpRequest, bot_id: int) -> JsonResponse:
+    """JSON page of MessageLogs for infinite scroll: ``?cursor=`` plus the viewer filters."""
+    try:
+        bot = bot_cache.get(id=bot_id)
+    except Bot.DoesNotExist:
+        return JsonResponse({'error': 'bot not found'}, status=404)
+    if not can_view_bot(request.user, bot):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        rows, next_cursor = message_log_page(
+            filter_message_logs(bot, request.GET),
+            cursor=request.GET.get('cursor') or None,
+            limit=request.GET.get('limit') or PAGE_SIZE,
+        )
+    except (InvalidLogQuery, ValueError) as ex:
+        return JsonResponse({'error': str(ex)}, status=400)
+    return JsonResponse({
+        'ok': True,
+        'results': [
+            {
+                'id': row['id'],
+                'received_at': date_format(timezone.localtime(row['received_at']), 'DATETIME_FORMAT'),
+                'chat_id': row['chat_id'],
+                'phone': row['bot_user__phone_number'] or None,
+                'message_id': row['message_id'],
+                'text': row['text'],
+            }
+            for row in rows
+        ],
+        'next_cursor': next_cursor,
+    })
+
+
 @login_required()
 def bot_logs_html_token(request: HttpRequest, bot_token: str) -> HttpResponse:
     try:
-        bot = Bot.objects.get(token=bot_token)
+        bot = bot_cache.get(token=bot_token)
     except Bot.DoesNotExist:
         return HttpResponse(status=404)
     # Access control mirrors ID-based
@@ -156,14 +229,13 @@ def bot_logs_html_token(request: HttpRequest, bot_token: str) -> HttpResponse:
             allowed = True
     if not allowed:
         return HttpResponse("Forbidden", status=403)
-    logs = MessageLog.objects.filter(bot=bot).select_related('bot_user').order_by('-received_at')[:500]
-    return render(request, 'hub/logs.html', {'bot': bot, 'logs': logs})
+    return _render_logs_page(request, bot)
 
 
 @login_required()
 def bot_logs_pdf_token(request: HttpRequest, bot_token: str):
     try:
-        bot = Bot.objects.get(token=bot_token)
+        bot = bot_cache.get(token=bot_token)
     except Bot.DoesNotExist:
         return HttpResponse(status=404)
     user = request.user
@@ -179,42 +251,7 @@ def bot_logs_pdf_token(request: HttpRequest, bot_token: str):
     if not allowed:
         return HttpResponse("Forbidden", status=403)
 
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-    except Exception:
-        return JsonResponse({'error': 'PDF export requires reportlab. Install with: pip install reportlab'}, status=501)
-
-    logs = MessageLog.objects.filter(bot=bot).select_related('bot_user').order_by('-received_at')[:1000]
-
-    from io import BytesIO
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    margin = 15 * mm
-    y = height - margin
-    title = f"Message Logs for {bot.name}"
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(margin, y, title)
-    y -= 12 * mm
-    c.setFont("Helvetica", 9)
-    for log in logs:
-        line = f"{log.received_at:%Y-%m-%d %H:%M} | {getattr(log.bot_user, 'username', '-') or getattr(log.bot_user, 'phone_number', '-')} | {log.text or ''}"
-        if y < margin + 20:
-            c.showPage()
-            y = height - margin
-            c.setFont("Helvetica", 9)
-        c.drawString(margin, y, line[:120])
-        y -= 6 * mm
-    c.showPage()
-    c.save()
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="bot_{bot.id}_logs.pdf"'
-    return response
+    return _message_log_pdf_response(request, bot)
 
 @csrf_exempt
 @login_required()
@@ -239,7 +276,7 @@ def upload_photo(request: HttpRequest) -> JsonResponse:
 @login_required()
 def bot_logs_html(request: HttpRequest, bot_id: int) -> HttpResponse:
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return HttpResponse(status=404)
     # Access control: superuser or candidate user owning the bot
@@ -255,14 +292,13 @@ def bot_logs_html(request: HttpRequest, bot_id: int) -> HttpResponse:
             allowed = True
     if not allowed:
         return HttpResponse("Forbidden", status=403)
-    logs = MessageLog.objects.filter(bot=bot).select_related('bot_user').order_by('-received_at')[:500]
-    return render(request, 'hub/logs.html', {'bot': bot, 'logs': logs})
+    return _render_logs_page(request, bot)
 
 
 @login_required()
 def bot_logs_pdf(request: HttpRequest, bot_id: int):
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return HttpResponse(status=404)
     user = request.user
@@ -278,62 +314,7 @@ def bot_logs_pdf(request: HttpRequest, bot_id: int):
     if not allowed:
         return HttpResponse("Forbidden", status=403)
 
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-    except Exception:
-        return JsonResponse({'error': 'PDF export requires reportlab. Install with: pip install reportlab'}, status=501)
-
-    logs = MessageLog.objects.filter(bot=bot).select_related('bot_user').order_by('-received_at')[:1000]
-
-    def pdf_generator():
-        from io import BytesIO
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-        margin = 15 * mm
-        y = height - margin
-        title = f"Message Logs for {bot.name}"
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(margin, y, title)
-        y -= 12 * mm
-        c.setFont("Helvetica", 9)
-        for log in logs:
-            phone = (getattr(log.bot_user, 'phone_number', None) or '') if log.bot_user else ''
-            line = f"{log.received_at.strftime('%Y-%m-%d %H:%M:%S')} | chat={log.chat_id} | phone={phone or '-'} | msg={log.message_id or '-'} | {(log.text or '')[:1000]}"
-            # Wrap long lines
-            max_width = width - 2 * margin
-            words = line.split(' ')
-            current = ''
-            for w in words:
-                test = (current + (' ' if current else '') + w)
-                if c.stringWidth(test, "Helvetica", 9) <= max_width:
-                    current = test
-                else:
-                    if y < margin + 20:
-                        c.showPage()
-                        y = height - margin
-                        c.setFont("Helvetica", 9)
-                    c.drawString(margin, y, current)
-                    y -= 12
-                    current = w
-            if current:
-                if y < margin + 20:
-                    c.showPage()
-                    y = height - margin
-                    c.setFont("Helvetica", 9)
-                c.drawString(margin, y, current)
-                y -= 14
-        c.showPage()
-        c.save()
-        pdf = buffer.getvalue()
-        buffer.close()
-        yield pdf
-
-    response = StreamingHttpResponse(pdf_generator(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="bot_{bot_id}_logs.pdf"'
-    return response
+    return _message_log_pdf_response(request, bot)
 
 
 @csrf_exempt
@@ -352,25 +333,24 @@ def send_to_chat(request: HttpRequest) -> JsonResponse:
     bot = None
     if bot_id:
         try:
-            bot = Bot.objects.get(id=bot_id)
+            bot = bot_cache.get(id=bot_id)
         except Bot.DoesNotExist:
             return JsonResponse({'error': 'bot not found'}, status=404)
     elif bot_token:
-        bot = Bot.objects.filter(token=bot_token).first()
+        bot = bot_cache.first(token=bot_token)
         if not bot:
             return JsonResponse({'error': 'bot not found for token'}, status=404)
     else:
         return JsonResponse({'error': 'bot_id or bot_token required'}, status=400)
 
-    resp = requests.post(
-        f"https://api.telegram.org/bot{bot.token}/sendMessage",
-        json={'chat_id': chat_id, 'text': text, 'disable_web_page_preview': True},
-        timeout=15,
-    )
     try:
-        js = resp.json()
-    except Exception:
-        js = {'ok': False, 'description': 'Invalid response'}
+        js = get_client(bot.token).request(
+            'sendMessage',
+            json={'chat_id': chat_id, 'text': text, 'disable_web_page_preview': True},
+            timeout=15,
+        )
+    except TelegramError as ex:
+        js = {'ok': False, 'description': str(ex)}
 
     # log
     try:
@@ -445,7 +425,7 @@ def sync_bot_profile_to_telegram(request: HttpRequest, bot_id: int) -> JsonRespo
     Note: Telegram Bot API does not support changing the bot's profile photo programmatically; use @BotFather for that.
     """
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return JsonResponse({'error': 'bot not found'}, status=404)
 
@@ -459,43 +439,25 @@ def sync_bot_profile_to_telegram(request: HttpRequest, bot_id: int) -> JsonRespo
     short_description = (data.get('short_description') or '').strip()
 
     results = {}
+    client = get_client(bot.token)
 
     # Update name
     if name:
-        r = requests.post(
-            f"https://api.telegram.org/bot{bot.token}/setMyName",
-            json={'name': name}, timeout=15
-        )
-        try:
-            results['setMyName'] = r.json()
-        except Exception:
-            results['setMyName'] = {'ok': False, 'description': 'Invalid response'}
+        results['setMyName'] = client.request('setMyName', json={'name': name}, timeout=15)
 
     # Update description
     if description or ('description' in data):
         # Telegram max 512 chars
         desc = description[:512] if description else ''
-        r = requests.post(
-            f"https://api.telegram.org/bot{bot.token}/setMyDescription",
-            json={'description': desc}, timeout=15
-        )
-        try:
-            results['setMyDescription'] = r.json()
-        except Exception:
-            results['setMyDescription'] = {'ok': False, 'description': 'Invalid response'}
+        results['setMyDescription'] = client.request('setMyDescription', json={'description': desc}, timeout=15)
 
     # Update short description
     if short_description or ('short_description' in data):
         # Telegram max 120 chars
         sdesc = short_description[:120] if short_description else ''
-        r = requests.post(
-            f"https://api.telegram.org/bot{bot.token}/setMyShortDescription",
-            json={'short_description': sdesc}, timeout=15
+        results['setMyShortDescription'] = client.request(
+            'setMyShortDescription', json={'short_description': sdesc}, timeout=15
         )
-        try:
-            results['setMyShortDescription'] = r.json()
-        except Exception:
-            results['setMyShortDescription'] = {'ok': False, 'description': 'Invalid response'}
 
     return JsonResponse({'ok': True, 'results': results})
 
@@ -504,7 +466,7 @@ def sync_bot_profile_to_telegram(request: HttpRequest, bot_id: int) -> JsonRespo
 @require_http_methods(['GET'])
 def fetch_bot_profile_from_telegram(request: HttpRequest, bot_id: int) -> JsonResponse:
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return JsonResponse({'error': 'bot not found'}, status=404)
 
@@ -513,24 +475,12 @@ def fetch_bot_profile_from_telegram(request: HttpRequest, bot_id: int) -> JsonRe
         return JsonResponse({'error': 'forbidden'}, status=403)
 
     out = {}
-    # getMyName
-    try:
-        r = requests.get(f"https://api.telegram.org/bot{bot.token}/getMyName", timeout=15)
-        out['getMyName'] = r.json()
-    except Exception as e:
-        out['getMyName'] = {'ok': False, 'description': str(e)}
-    # getMyDescription
-    try:
-        r = requests.get(f"https://api.telegram.org/bot{bot.token}/getMyDescription", timeout=15)
-        out['getMyDescription'] = r.json()
-    except Exception as e:
-        out['getMyDescription'] = {'ok': False, 'description': str(e)}
-    # getMyShortDescription
-    try:
-        r = requests.get(f"https://api.telegram.org/bot{bot.token}/getMyShortDescription", timeout=15)
-        out['getMyShortDescription'] = r.json()
-    except Exception as e:
-        out['getMyShortDescription'] = {'ok': False, 'description': str(e)}
+    client = get_client(bot.token)
+    for method in ('getMyName', 'getMyDescription', 'getMyShortDescription'):
+        try:
+            out[method] = client.request(method, http_method='GET', timeout=15)
+        except TelegramError as e:
+            out[method] = {'ok': False, 'description': str(e)}
 
     # Normalize values for convenience
     name_val = ((out.get('getMyName') or {}).get('result') or {}).get('name')
@@ -548,11 +498,7 @@ def create_bot(request: HttpRequest) -> JsonResponse:
     if not name or not token:
         return JsonResponse({'error': 'name and bot_token required'}, status=400)
     # Validate token with Telegram API
-    r = requests.get(f"https://api.telegram.org/bot{token}/getMe", timeout=10)
-    try:
-        js = r.json()
-    except Exception:
-        js = {"ok": False}
+    js = get_client(token).request('getMe', http_method='GET', timeout=10)
     if not js.get('ok'):
         return JsonResponse({'error': 'Invalid bot token'}, status=400)
     bot, created = Bot.objects.get_or_create(token=token, defaults={'name': name})
@@ -597,7 +543,7 @@ def assign_bot_to_campaign(request: HttpRequest) -> JsonResponse:
     bot_id = data.get('bot_id')
     campaign_id = data.get('campaign_id')
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
         campaign = Campaign.objects.get(id=campaign_id)
     except (Bot.DoesNotExist, Campaign.DoesNotExist):
         return JsonResponse({'error': 'bot or campaign not found'}, status=404)
@@ -608,311 +554,31 @@ def assign_bot_to_campaign(request: HttpRequest) -> JsonResponse:
 @csrf_exempt
 @require_http_methods(['POST'])
 def telegram_webhook(request: HttpRequest, bot_id: int) -> JsonResponse:
-    # Log the incoming request
-    logger.info(f"Webhook received for bot_id: {bot_id}")
-    print(f"=== WEBHOOK DEBUG START ===")
-    print(f"Bot ID: {bot_id}")
-    print(f"Request body: {request.body.decode('utf-8')}")
-    
-    try:
-        bot = Bot.objects.get(id=bot_id)
-        print(f"Bot found: {bot.name} (Active: {bot.is_active})")
-    except Bot.DoesNotExist:
-        print(f"Bot with ID {bot_id} not found!")
+    """Validate and queue a Telegram update, then answer immediately.
+
+    The update is stored as a pending WebhookEvent and applied by the
+    process_webhook_events worker, so response time does not depend on
+    the database work or Telegram API calls the handlers make.
+    """
+    if bot_cache.first(id=bot_id) is None:
         return JsonResponse({'error': 'bot not found'}, status=404)
 
     try:
         payload = json.loads(request.body.decode('utf-8') or '{}')
-        print(f"Parsed payload: {json.dumps(payload, indent=2)}")
-    except Exception as e:
-        print(f"Error parsing payload: {e}")
-        payload = {}
-
-    # Persist event for debugging
-    try:
-        webhook_event = WebhookEvent.objects.create(bot=bot, event_type='update', payload=payload)
-        print(f"WebhookEvent created: {webhook_event.id}")
-    except Exception as e:
-        print(f"Error creating WebhookEvent: {e}")
-
-    # Extract message
-    message = payload.get('message') or payload.get('edited_message') or {}
-    print(f"Message data: {json.dumps(message, indent=2)}")
-
-    # Persist message into MessageLog if present and capture phone numbers from contact messages
+    except ValueError:
+        return JsonResponse({'error': 'invalid JSON'}, status=400)
+    update_id = payload.get('update_id') if isinstance(payload, dict) else None
+    if not isinstance(update_id, int):
+        return JsonResponse({'error': 'update_id required'}, status=400)
+
+    event_type = next((key for key in payload if key != 'update_id'), 'update')
+    # (bot, update_id) is unique, so an update Telegram redelivers is
+    # acknowledged without being queued twice
     try:
-        if message:
-            chat = message.get('chat', {})
-            from_user = message.get('from', {})
-            chat_id = chat.get('id')
-            bot_user = BotUser.objects.filter(bot=bot, telegram_id=chat_id).first() if chat_id else None
-            # If message contains a contact, store phone_number on BotUser
-            contact = message.get('contact') or {}
-            if contact:
-                try:
-                    print("=== CONTACT RECEIVED ===")
-                    try:
-                        print(json.dumps(contact, indent=2))
-                    except Exception:
-                        print(str(contact))
-                    target_user_id = contact.get('user_id') or from_user.get('id') or chat_id
-                    bu, _ = BotUser.objects.get_or_create(
-                        bot=bot,
-                        telegram_id=target_user_id or chat_id or 0,
-                        defaults={
-                            'username': from_user.get('username') or chat.get('username'),
-                            'first_name': from_user.get('first_name') or chat.get('first_name'),
-                            'last_name': from_user.get('last_name') or chat.get('last_name'),
-                            'language_code': from_user.get('language_code') or chat.get('language_code'),
-                        }
-                    )
-                    phone = (contact.get('phone_number') or '').strip()
-                    if phone and bu.phone_number != phone:
-                        bu.phone_number = phone
-                        bu.save(update_fields=['phone_number'])
-                        print(f"✓ Saved phone number for user {bu.telegram_id}: {phone}")
-                    else:
-                        print(f"No phone saved. Existing={bu.phone_number!r} Incoming={phone!r}")
-                    bot_user = bu
-                except Exception as e:
-                    print(f"Error saving phone number: {e}")
-            MessageLog.objects.create(
-                bot=bot,
-                bot_user=bot_user,
-                message_id=str(message.get('message_id')) if message.get('message_id') is not None else None,
-                chat_id=chat_id or 0,
-                from_user_id=from_user.get('id'),
-                text=message.get('text'),
-                raw=message,
-            )
-    except Exception as e:
-        print(f"Error persisting MessageLog: {e}")
-
-    # Check if this is a /start command
-    text = (message.get('text') or '').strip()
-    print(f"Message text: '{text}'")
-    
-    if text.startswith('/start'):
-        print("=== PROCESSING /START COMMAND ===")
-        
-        # Get chat and user info
-        chat = message.get('chat', {})
-        from_user = message.get('from', {})
-        chat_id = chat.get('id')
-        
-        if not chat_id:
-            print("ERROR: No chat_id found!")
-            return JsonResponse({'ok': False, 'error': 'No chat_id'})
-        
-        # Send welcome message first
-        try:
-            welcome_response = requests.post(
-                f"https://api.telegram.org/bot{bot.token}/sendMessage", 
-                json={
-                    'chat_id': chat_id,
-                    'text': 'Welcome! You are now registered and can receive broadcasts.'
-                }, 
-                timeout=10
-            )
-            print(f"Welcome message status: {welcome_response.status_code}")
-            print(f"Welcome message response: {welcome_response.text}")
-        except Exception as e:
-            print(f"Error sending welcome message: {e}")
-
-        # Ask user to share their contact (phone number)
-        try:
-            contact_prompt = requests.post(
-                f"https://api.telegram.org/bot{bot.token}/sendMessage",
-                json={
-                    'chat_id': chat_id,
-                    'text': 'Please share your phone number to complete registration.',
-                    'reply_markup': {
-                        'keyboard': [[{'text': 'Share my phone number', 'request_contact': True}]],
-                        'resize_keyboard': True,
-                        'one_time_keyboard': True
-                    }
-                },
-                timeout=10
-            )
-            print(f"Contact request status: {contact_prompt.status_code}")
-            print(f"Contact request response: {contact_prompt.text}")
-        except Exception as e:
-            print(f"Error requesting contact: {e}")
-        
-        # Register/update user
-        try:
-            print(f"Creating/updating user with telegram_id: {chat_id}")
-            
-            # Use from_user data if available, otherwise use chat data
-            user_data = {
-                'username': from_user.get('username') or chat.get('username'),
-                'first_name': from_user.get('first_name') or chat.get('first_name'),
-                'last_name': from_user.get('last_name') or chat.get('last_name'),
-                'language_code': from_user.get('language_code') or chat.get('language_code'),
-                'started_at': timezone.now(),
-                'last_seen_at': timezone.now(),
-            }
-            
-            print(f"User data for creation: {user_data}")
-            
-            bot_user, created = BotUser.objects.get_or_create(
-                bot=bot, 
-                telegram_id=chat_id,
-                defaults=user_data
-            )
-            
-            if created:
-                print(f"✓ NEW USER CREATED: ID={bot_user.id}, telegram_id={bot_user.telegram_id}")
-            else:
-                print(f"✓ EXISTING USER FOUND: ID={bot_user.id}, telegram_id={bot_user.telegram_id}")
-                print(f"  - Current started_at: {bot_user.started_at}")
-                print(f"  - Current is_blocked: {bot_user.is_blocked}")
-                
-                # Update user info and ensure started_at is set
-                update_fields = []
-                
-                if not bot_user.started_at:
-                    bot_user.started_at = timezone.now()
-                    update_fields.append('started_at')
-                    print("  - Setting started_at")
-                
-                # Update other fields
-                for field, value in user_data.items():
-                    if field in ['started_at', 'last_seen_at']:
-                        continue
-                    if value and getattr(bot_user, field) != value:
-                        setattr(bot_user, field, value)
-                        update_fields.append(field)
-                        print(f"  - Updating {field} to {value}")
-                
-                # Always update last_seen_at
-                bot_user.last_seen_at = timezone.now()
-                update_fields.append('last_seen_at')
-                
-                # Unblock if blocked
-                if bot_user.is_blocked:
-                    bot_user.is_blocked = False
-                    update_fields.append('is_blocked')
-                    print("  - Unblocking user")
-                
-                if update_fields:
-                    bot_user.save(update_fields=update_fields)
-                    print(f"  - Updated fields: {update_fields}")
-            
-            # Verify the user was saved correctly
-            saved_user = BotUser.objects.get(bot=bot, telegram_id=chat_id)
-            print(f"✓ VERIFICATION: User saved with started_at={saved_user.started_at}, blocked={saved_user.is_blocked}")
-
-            # If Telegram unexpectedly includes phone in from_user (rare), save it
-            possible_phone = (from_user.get('phone_number') or '').strip()
-            if possible_phone and saved_user.phone_number != possible_phone:
-                saved_user.phone_number = possible_phone
-                saved_user.save(update_fields=['phone_number'])
-                print("✓ Phone number saved from from_user payload")
-            
-            # Count total active users for this bot
-            active_count = BotUser.objects.filter(
-                bot=bot, 
-                started_at__isnull=False, 
-                is_blocked=False
-            ).count()
-            print(f"✓ Total active users for bot {bot.name}: {active_count}")
-            
-        except Exception as e:
-            print(f"ERROR registering user: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    else:
-        print(f"Not a /start command, text was: '{text}'")
-        
-        # Still register/update user for any interaction
-        if message:
-            chat = message.get('chat', {})
-            from_user = message.get('from', {})
-            chat_id = chat.get('id')
-            
-            if chat_id:
-                try:
-                    bot_user, created = BotUser.objects.get_or_create(
-                        bot=bot, 
-                        telegram_id=chat_id,
-                        defaults={
-                            'username': from_user.get('username') or chat.get('username'),
-                            'first_name': from_user.get('first_name') or chat.get('first_name'),
-                            'last_name': from_user.get('last_name') or chat.get('last_name'),
-                            'language_code': from_user.get('language_code'),
-                            'last_seen_at': timezone.now(),
-                        }
-                    )
-                    
-                    if not created:
-                        bot_user.last_seen_at = timezone.now()
-                        bot_user.save(update_fields=['last_seen_at'])
-                    
-                    print(f"User interaction logged: {chat_id}")
-                    
-                except Exception as e:
-                    print(f"Error logging user interaction: {e}")
-
-    # Handle callback queries and other update types
-    callback_query = payload.get('callback_query')
-    if callback_query:
-        from_user = callback_query.get('from', {})
-        if from_user and from_user.get('id'):
-            try:
-                bot_user, created = BotUser.objects.get_or_create(
-                    bot=bot, 
-                    telegram_id=from_user['id'],
-                    defaults={
-                        'username': from_user.get('username'),
-                        'first_name': from_user.get('first_name'),
-                        'last_name': from_user.get('last_name'),
-                        'language_code': from_user.get('language_code'),
-                        'last_seen_at': timezone.now(),
-                    }
-                )
-                if not created:
-                    bot_user.last_seen_at = timezone.now()
-                    bot_user.save(update_fields=['last_seen_at'])
-                print(f"Callback query user logged: {from_user['id']}")
-            except Exception as e:
-                print(f"Error logging callback query user: {e}")
-
-    # Handle my_chat_member (join/left events)
-    my_chat_member = payload.get('my_chat_member')
-    if my_chat_member:
-        from_user = my_chat_member.get('from', {})
-        chat = my_chat_member.get('chat', {})
-        
-        if from_user and from_user.get('id'):
-            try:
-                bot_user, created = BotUser.objects.get_or_create(
-                    bot=bot, 
-                    telegram_id=from_user['id'],
-                    defaults={
-                        'username': from_user.get('username'),
-                        'first_name': from_user.get('first_name'),
-                        'last_name': from_user.get('last_name'),
-                        'language_code': from_user.get('language_code'),
-                        'last_seen_at': timezone.now(),
-                    }
-                )
-                
-                # Check if user became a member
-                new_status = (my_chat_member.get('new_chat_member') or {}).get('status')
-                if new_status == 'member' and not bot_user.started_at:
-                    bot_user.started_at = timezone.now()
-                    bot_user.save(update_fields=['started_at', 'last_seen_at'])
-                    print(f"User {from_user['id']} became member, started_at set")
-                elif not created:
-                    bot_user.last_seen_at = timezone.now()
-                    bot_user.save(update_fields=['last_seen_at'])
-                    
-            except Exception as e:
-                print(f"Error processing my_chat_member: {e}")
-
-    print(f"=== WEBHOOK DEBUG END ===")
+        with transaction.atomic():
+            WebhookEvent.objects.create(bot_id=bot_id, update_id=update_id, event_type=event_type, payload=payload)
+    except IntegrityError:
+        return JsonResponse({'ok': True, 'duplicate': True})
     return JsonResponse({'ok': True})
 
 
@@ -925,16 +591,10 @@ def set_webhook(request: HttpRequest) -> JsonResponse:
     if not bot_id or not webhook_url:
         return JsonResponse({'error': 'bot_id and webhook_url required'}, status=400)
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return JsonResponse({'error': 'bot not found'}, status=404)
-    r = requests.post(f"https://api.telegram.org/bot{bot.token}/setWebhook", json={
-        'url': webhook_url
-    }, timeout=10)
-    try:
-        js = r.json()
-    except Exception:
-        js = {'ok': False}
+    js = get_client(bot.token).request('setWebhook', json={'url': webhook_url}, timeout=10)
     return JsonResponse(js, status=200 if js.get('ok') else 400)
 
 
@@ -947,21 +607,20 @@ def staff_send_form(request: HttpRequest) -> HttpResponse:
         error = None
         ok = False
         try:
-            bot = Bot.objects.get(id=bot_id)
+            bot = bot_cache.get(id=bot_id)
         except Bot.DoesNotExist:
             bot = None
             error = 'Bot not found'
 
         if bot and chat_id and text:
-            resp = requests.post(f"https://api.telegram.org/bot{bot.token}/sendMessage", json={
-                'chat_id': chat_id,
-                'text': text,
-                'disable_web_page_preview': True,
-            }, timeout=10)
             try:
-                js = resp.json()
-            except Exception:
-                js = {'ok': False, 'description': 'Invalid response'}
+                js = get_client(bot.token).request('sendMessage', json={
+                    'chat_id': chat_id,
+                    'text': text,
+                    'disable_web_page_preview': True,
+                }, timeout=10)
+            except TelegramError as ex:
+                js = {'ok': False, 'description': str(ex)}
             ok = bool(js.get('ok'))
             # log
             try:
@@ -1020,14 +679,14 @@ def broadcast_all(request: HttpRequest) -> JsonResponse:
     bot = None
     if bot_id:
         try:
-            bot = Bot.objects.get(id=bot_id)
+            bot = bot_cache.get(id=bot_id)
             print(f"Bot found by ID: {bot.name}")
             print(f"Bot token (last 10 chars): ...{bot.token[-10:] if bot.token else 'None'}")
         except Bot.DoesNotExist:
             print(f"Bot with ID {bot_id} not found!")
             return JsonResponse({'error': 'bot not found'}, status=404)
     elif bot_token:
-        bot = Bot.objects.filter(token=bot_token).first()
+        bot = bot_cache.first(token=bot_token)
         if bot:
             print(f"Bot found by token: {bot.name}")
         else:
@@ -1039,8 +698,7 @@ def broadcast_all(request: HttpRequest) -> JsonResponse:
     # Test bot token first
     print("Testing bot token with Telegram API...")
     try:
-        test_response = requests.get(f"https://api.telegram.org/bot{bot.token}/getMe", timeout=10)
-        test_json = test_response.json()
+        test_json = get_client(bot.token).request('getMe', http_method='GET', timeout=10)
         print(f"Bot API test: {test_json}")
         if not test_json.get('ok'):
             return JsonResponse({'error': 'Invalid bot token or bot not accessible'}, status=400)
@@ -1049,127 +707,17 @@ def broadcast_all(request: HttpRequest) -> JsonResponse:
         print(f"Error testing bot token: {e}")
         return JsonResponse({'error': f'Error testing bot token: {str(e)}'}, status=400)
 
-    # Get all users who have started the bot and are not blocked
-    users = BotUser.objects.filter(
-        bot=bot, 
-        is_blocked=False, 
-        started_at__isnull=False
-    )
-    
-    total_users = users.count()
-    print(f"Total users to broadcast to: {total_users}")
-    
-    # Debug: print all users
-    for user in users:
-        print(f"User: {user.telegram_id} - Started: {user.started_at} - Blocked: {user.is_blocked}")
-    
-    if total_users == 0:
-        print("No users found! Checking all users for this bot...")
-        all_users = BotUser.objects.filter(bot=bot)
-        print(f"Total users in DB for bot: {all_users.count()}")
-        for user in all_users:
-            print(f"All Users: {user.telegram_id} - Started: {user.started_at} - Blocked: {user.is_blocked}")
-    
-    ok_count = 0
-    fail_count = 0
-    failures = []
-    failures = []
-
-    for user in users:
-        try:
-            print(f"Sending to user: {user.telegram_id}")
-            
-            # First, try to get chat info to verify user exists
-            try:
-                chat_response = requests.get(
-                    f"https://api.telegram.org/bot{bot.token}/getChat",
-                    params={'chat_id': user.telegram_id},
-                    timeout=10
-                )
-                chat_json = chat_response.json()
-                print(f"Chat info for {user.telegram_id}: {chat_json}")
-                
-                if not chat_json.get('ok'):
-                    print(f"  - Cannot access chat {user.telegram_id}: {chat_json.get('description')}")
-                    # Mark as blocked if chat not found
-                    if 'not found' in chat_json.get('description', '').lower():
-                        user.is_blocked = True
-                        user.save(update_fields=['is_blocked'])
-                        print(f"  - Marked user {user.telegram_id} as blocked (chat not found)")
-                        continue
-            except Exception as e:
-                print(f"  - Error checking chat {user.telegram_id}: {e}")
-            
-            # Send the message
-            response = requests.post(
-                f"https://api.telegram.org/bot{bot.token}/sendMessage", 
-                json={
-                    'chat_id': user.telegram_id,
-                    'text': text,
-                    'disable_web_page_preview': True,
-                }, 
-                timeout=15
-            )
-            
-            try:
-                js = response.json()
-                print(f"Send response for {user.telegram_id}: {js}")
-            except Exception:
-                js = {'ok': False, 'description': 'Invalid JSON response'}
-            
-            is_success = bool(js.get('ok'))
-            
-            if is_success:
-                ok_count += 1
-                print(f"✓ Sent to user {user.telegram_id}")
-            else:
-                fail_count += 1
-                error_desc = js.get('description', 'Unknown error')
-                print(f"✗ Failed to send to user {user.telegram_id}: {error_desc}")
-                
-                # Handle various error cases
-                error_lower = error_desc.lower()
-                if any(phrase in error_lower for phrase in ['blocked', 'bot was blocked', 'user is deactivated']):
-                    user.is_blocked = True
-                    user.save(update_fields=['is_blocked'])
-                    print(f"  - Marked user {user.telegram_id} as blocked")
-                elif 'chat not found' in error_lower:
-                    user.is_blocked = True
-                    user.save(update_fields=['is_blocked'])
-                    print(f"  - Marked user {user.telegram_id} as blocked (chat not found)")
-            
-            # Create send log
-            SendLog.objects.create(
-                campaign=None,  # This is for ad-hoc broadcasts
-                bot_user=user,
-                status=SendLog.STATUS_SENT if is_success else SendLog.STATUS_FAILED,
-                message_id=str((js.get('result') or {}).get('message_id')) if is_success else None,
-                error=None if is_success else error_desc,
-                sent_at=timezone.now() if is_success else None,
-            )
-            
-        except Exception as ex:
-            fail_count += 1
-            error_msg = str(ex)
-            print(f"✗ Exception sending to user {user.telegram_id}: {error_msg}")
-            
-            # Create failed send log
-            SendLog.objects.create(
-                campaign=None,
-                bot_user=user,
-                status=SendLog.STATUS_FAILED,
-                error=error_msg,
-            )
-
-    print(f"Broadcast completed: {ok_count} sent, {fail_count} failed")
+    # Queue the broadcast; run_broadcast_jobs delivers it outside the request
+    job = enqueue_broadcast(bot, 'text', {'text': text}, user=request.user)
+    logger.info("Broadcast job %s queued for %s users", job.id, job.total_recipients)
     print(f"=== BROADCAST ALL END ===")
     
     return JsonResponse({
         'ok': True, 
-        'total_users': total_users,
-        'sent': ok_count, 
-        'failed': fail_count
-    })
+        'job_id': job.id,
+        'status': job.status,
+        'total_users': job.total_recipients,
+    }, status=202)
 
 
 @csrf_exempt
@@ -1188,268 +736,149 @@ def broadcast_action(request: HttpRequest) -> JsonResponse:
     - options: list[str] poll options (for 'poll')
     - is_anonymous: optional bool (for 'poll')
     - allows_multiple_answers: optional bool (for 'poll')
+
+    The broadcast is queued as a BroadcastJob and delivered by the
+    run_broadcast_jobs worker; poll /hub/broadcast_jobs/<job_id>/ for progress.
     """
     data = json.loads(request.body.decode('utf-8') or '{}')
-    bot_id = data.get('bot_id')
-    bot_token = (data.get('bot_token') or '').strip()
-    action = (data.get('action') or 'text').strip()
+    bot_id = data.pop('bot_id', None)
+    bot_token = (data.pop('bot_token', None) or '').strip()
+    action = (data.pop('action', None) or 'text').strip()
 
     bot = None
     if bot_id:
         try:
-            bot = Bot.objects.get(id=bot_id)
+            bot = bot_cache.get(id=bot_id)
         except Bot.DoesNotExist:
             return JsonResponse({'error': 'bot not found'}, status=404)
     elif bot_token:
-        bot = Bot.objects.filter(token=bot_token).first()
+        bot = bot_cache.first(token=bot_token)
         if not bot:
             return JsonResponse({'error': 'bot not found for token'}, status=404)
     else:
         return JsonResponse({'error': 'bot_id or bot_token required'}, status=400)
 
-    users = BotUser.objects.filter(
-        bot=bot, is_blocked=False, started_at__isnull=False
-    ).only('telegram_id')
+    if action == 'poll':
+        # Accept both JSON and form submissions
+        data['question'] = data.get('question') or request.POST.get('question')
+        if 'options' not in data:
+            data['options'] = request.POST.getlist('options') or request.POST.get('options')
 
-    ok_count = 0
-    fail_count = 0
-    failures = []
+    _, error = build_action_sender(action, data)
+    if error:
+        return JsonResponse({'error': error}, status=400)
 
-    for u in users:
-        try:
-            if action == 'text':
-                text = (data.get('text') or '').strip()
-                if not text:
-                    return JsonResponse({'error': 'text required for action=text'}, status=400)
-                resp = requests.post(
-                    f"https://api.telegram.org/bot{bot.token}/sendMessage",
-                    json={'chat_id': u.telegram_id, 'text': text, 'disable_web_page_preview': True},
-                    timeout=15,
-                )
-            elif action == 'photo':
-                photo = (data.get('photo') or '').strip()
-                photo_path = (data.get('photo_path') or '').strip()
-                if not photo and not photo_path:
-                    return JsonResponse({'error': 'photo or photo_path required for action=photo'}, status=400)
-                caption = data.get('caption')
-                if photo_path:
-                    try:
-                        file_obj = default_storage.open(photo_path, 'rb')
-                    except Exception:
-                        photo_path = ''
-                    if photo_path:
-                        filename = photo_path.split('/')[-1]
-                        mime, _ = mimetypes.guess_type(filename)
-                        files = {
-                            'photo': (filename, file_obj, mime or 'application/octet-stream')
-                        }
-                        data_fields = {'chat_id': str(u.telegram_id)}
-                        if caption:
-                            data_fields['caption'] = caption
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{bot.token}/sendPhoto",
-                            data=data_fields,
-                            files=files,
-                            timeout=60,
-                        )
-                        try:
-                            file_obj.close()
-                        except Exception:
-                            pass
-                    else:
-                        payload = {'chat_id': u.telegram_id, 'photo': photo}
-                        if caption:
-                            payload['caption'] = caption
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{bot.token}/sendPhoto",
-                            json=payload,
-                            timeout=20,
-                        )
-                else:
-                    payload = {'chat_id': u.telegram_id, 'photo': photo}
-                    if caption:
-                        payload['caption'] = caption
-                    resp = requests.post(
-                        f"https://api.telegram.org/bot{bot.token}/sendPhoto",
-                        json=payload,
-                        timeout=20,
-                    )
-            elif action == 'video':
-                video = (data.get('video') or '').strip()
-                video_path = (data.get('video_path') or '').strip()
-                if not video and not video_path:
-                    return JsonResponse({'error': 'video or video_path required for action=video'}, status=400)
-                caption = data.get('caption')
-                if video_path:
-                    # Upload the actual file to Telegram
-                    try:
-                        file_obj = default_storage.open(video_path, 'rb')
-                    except Exception:
-                        # Fallback to URL if path invalid
-                        video_path = ''
-                    if video_path:
-                        filename = video_path.split('/')[-1]
-                        mime, _ = mimetypes.guess_type(filename)
-                        files = {
-                            'video': (filename, file_obj, mime or 'application/octet-stream')
-                        }
-                        data_fields = {'chat_id': str(u.telegram_id)}
-                        if caption:
-                            data_fields['caption'] = caption
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{bot.token}/sendVideo",
-                            data=data_fields,
-                            files=files,
-                            timeout=60,
-                        )
-                        try:
-                            file_obj.close()
-                        except Exception:
-                            pass
-                    else:
-                        payload = {'chat_id': u.telegram_id, 'video': video}
-                        if caption:
-                            payload['caption'] = caption
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{bot.token}/sendVideo",
-                            json=payload,
-                            timeout=30,
-                        )
-                else:
-                    payload = {'chat_id': u.telegram_id, 'video': video}
-                    if caption:
-                        payload['caption'] = caption
-                    resp = requests.post(
-                        f"https://api.telegram.org/bot{bot.token}/sendVideo",
-                        json=payload,
-                        timeout=30,
-                    )
-            elif action == 'document':
-                document = (data.get('document') or '').strip()
-                document_path = (data.get('document_path') or '').strip()
-                if not document and not document_path:
-                    return JsonResponse({'error': 'document or document_path required for action=document'}, status=400)
-                caption = data.get('caption')
-                if document_path:
-                    try:
-                        file_obj = default_storage.open(document_path, 'rb')
-                    except Exception:
-                        document_path = ''
-                    if document_path:
-                        filename = document_path.split('/')[-1]
-                        mime, _ = mimetypes.guess_type(filename)
-                        files = {
-                            'document': (filename, file_obj, mime or 'application/octet-stream')
-                        }
-                        data_fields = {'chat_id': str(u.telegram_id)}
-                        if caption:
-                            data_fields['caption'] = caption
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{bot.token}/sendDocument",
-                            data=data_fields,
-                            files=files,
-                            timeout=60,
-                        )
-                        try:
-                            file_obj.close()
-                        except Exception:
-                            pass
-                    else:
-                        payload = {'chat_id': u.telegram_id, 'document': document}
-                        if caption:
-                            payload['caption'] = caption
-                        resp = requests.post(
-                            f"https://api.telegram.org/bot{bot.token}/sendDocument",
-                            json=payload,
-                            timeout=20,
-                        )
-                else:
-                    payload = {'chat_id': u.telegram_id, 'document': document}
-                    if caption:
-                        payload['caption'] = caption
-                    resp = requests.post(
-                        f"https://api.telegram.org/bot{bot.token}/sendDocument",
-                        json=payload,
-                        timeout=20,
-                    )
-            elif action == 'poll':
-                # Accept both JSON and form submissions
-                question = (data.get('question') or request.POST.get('question') or '').strip()
-                raw_options = data.get('options') if 'options' in data else (request.POST.getlist('options') or request.POST.get('options'))
-                options: list[str] = []
-                if isinstance(raw_options, list):
-                    options = [str(o).strip() for o in raw_options if str(o).strip()]
-                elif isinstance(raw_options, str):
-                    # Split by newline or comma
-                    splitted = [s for chunk in raw_options.split('\n') for s in chunk.split(',')]
-                    options = [s.strip() for s in splitted if s.strip()]
-                # Telegram constraints: 2..10 options, each 1..100 chars
-                if not question:
-                    return JsonResponse({'error': 'poll requires non-empty question'}, status=400)
-                if len(options) < 2:
-                    return JsonResponse({'error': 'poll requires at least 2 options'}, status=400)
-                if len(options) > 10:
-                    options = options[:10]
-                options = [o[:100] for o in options]
-                payload = {
-                    'chat_id': u.telegram_id,
-                    'question': question,
-                    'options': options,
-                }
-                if 'is_anonymous' in data:
-                    payload['is_anonymous'] = bool(data['is_anonymous'])
-                if 'allows_multiple_answers' in data:
-                    payload['allows_multiple_answers'] = bool(data['allows_multiple_answers'])
-                resp = requests.post(
-                    f"https://api.telegram.org/bot{bot.token}/sendPoll",
-                    json=payload,
-                    timeout=20,
-                )
-            elif action == 'pin':
-                text = (data.get('text') or '').strip()
-                if not text:
-                    return JsonResponse({'error': 'text required for action=pin'}, status=400)
-                # Send a message then pin it
-                send = requests.post(
-                    f"https://api.telegram.org/bot{bot.token}/sendMessage",
-                    json={'chat_id': u.telegram_id, 'text': text},
-                    timeout=15,
-                )
-                try:
-                    send_js = send.json()
-                except Exception:
-                    send_js = {'ok': False}
-                if not send_js.get('ok'):
-                    resp = send
-                else:
-                    mid = (send_js.get('result') or {}).get('message_id')
-                    resp = requests.post(
-                        f"https://api.telegram.org/bot{bot.token}/pinChatMessage",
-                        json={'chat_id': u.telegram_id, 'message_id': mid, 'disable_notification': True},
-                        timeout=15,
-                    )
-            else:
-                return JsonResponse({'error': f'unsupported action {action}'}, status=400)
+    job = enqueue_broadcast(bot, action, data, user=request.user)
+    return JsonResponse({
+        'ok': True,
+        'action': action,
+        'job_id': job.id,
+        'status': job.status,
+        'total_users': job.total_recipients,
+    }, status=202)
 
-            try:
-                js = resp.json()
-            except Exception:
-                js = {'ok': False, 'description': 'Invalid JSON response'}
 
-            if js.get('ok'):
-                ok_count += 1
-            else:
-                fail_count += 1
-                failures.append({
-                    'chat_id': u.telegram_id,
-                    'error': js.get('description') or 'Unknown error',
-                    'action': action,
-                })
-        except Exception:
-            fail_count += 1
-            failures.append({'chat_id': u.telegram_id, 'error': 'Unhandled exception', 'action': action})
+@login_required()
+@require_http_methods(['GET'])
+def broadcast_job_status(request: HttpRequest, job_id: int) -> JsonResponse:
+    """Progress of a queued broadcast (see broadcast_all / broadcast_action)."""
+    job = BroadcastJob.objects.select_related('bot').filter(id=job_id).first()
+    # Someone else's job is reported as missing rather than forbidden
+    if job is None or not can_view_bot(request.user, job.bot):
+        return JsonResponse({'error': 'job not found'}, status=404)
+    return JsonResponse({
+        'ok': True,
+        'job_id': job.id,
+        'bot_id': job.bot_id,
+        'action': job.action,
+        'status': job.status,
+        'total_users': job.total_recipients,
+        'sent': job.sent_count,
+        'failed': job.failed_count,
+        'cursor': job.cursor,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    })
+
+
+
+def _report_job_payload(job: ReportJob) -> dict:
+    return {
+        'ok': True,
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'rows': job.rows,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'download_url': f"/hub/reports/{job.id}/download/" if job.status == ReportJob.STATUS_COMPLETED else None,
+    }
+
+
+def _load_report_job(request: HttpRequest, job_id: int):
+    """Return ``(job, error_response)``; the job is None when access is refused."""
+    try:
+        job = ReportJob.objects.get(id=job_id)
+    except ReportJob.DoesNotExist:
+        return None, JsonResponse({'error': 'job not found'}, status=404)
+    if not get_report(job.kind).can_access(request.user, job.params):
+        return None, JsonResponse({'error': 'forbidden'}, status=403)
+    return job, None
 
-    return JsonResponse({'ok': True, 'action': action, 'sent': ok_count, 'failed': fail_count, 'failures': failures})
+
+@csrf_exempt
+@login_required()
+@require_http_methods(['POST'])
+def create_report(request: HttpRequest) -> JsonResponse:
+    """Queue an export for the report worker: ``{"kind": ..., "params": {...}}``.
+
+    Returns 202 with the job id; an identical export of unchanged data
+    returns the existing job (``reused``) instead of queueing another.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8') or '{}')
+    except ValueError:
+        return JsonResponse({'error': 'invalid JSON'}, status=400)
+    kind = data.get('kind') or ''
+    params = data.get('params') or {}
+    try:
+        spec = get_report(kind)
+        params = spec.clean(params)
+    except InvalidReport as ex:
+        return JsonResponse({'error': str(ex)}, status=400)
+    if not spec.can_access(request.user, params):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    job, reused = enqueue_report(kind, params, user=request.user)
+    payload = _report_job_payload(job)
+    payload['reused'] = reused
+    return JsonResponse(payload, status=202)
+
+
+@login_required()
+@require_http_methods(['GET'])
+def report_job_status(request: HttpRequest, job_id: int) -> JsonResponse:
+    """Progress of a queued export; ``download_url`` is set once it completes."""
+    job, error = _load_report_job(request, job_id)
+    if error:
+        return error
+    return JsonResponse(_report_job_payload(job))
+
+
+@login_required()
+@require_http_methods(['GET'])
+def report_job_download(request: HttpRequest, job_id: int):
+    job, error = _load_report_job(request, job_id)
+    if error:
+        return error
+    if job.status != ReportJob.STATUS_COMPLETED or not has_file(job):
+        return JsonResponse({'error': 'report not ready', 'status': job.status}, status=409)
+    spec = get_report(job.kind)
+    return FileResponse(job.file.open('rb'), as_attachment=True,
+                        filename=spec.filename(job.params), content_type=spec.content_type)
 
 
 # Debug endpoint
@@ -1457,7 +886,7 @@ def broadcast_action(request: HttpRequest) -> JsonResponse:
 def debug_bot_users(request: HttpRequest, bot_id: int) -> JsonResponse:
     """Enhanced debug endpoint"""
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return JsonResponse({'error': 'bot not found'}, status=404)
     
@@ -1546,7 +975,7 @@ def test_webhook(request: HttpRequest, bot_id: int) -> JsonResponse:
 def create_test_user(request: HttpRequest, bot_id: int) -> JsonResponse:
     """Manually create a test user for debugging"""
     try:
-        bot = Bot.objects.get(id=bot_id)
+        bot = bot_cache.get(id=bot_id)
     except Bot.DoesNotExist:
         return JsonResponse({'error': 'bot not found'}, status=404)
     
@@ -1599,57 +1028,18 @@ def import_updates(request: HttpRequest) -> JsonResponse:
         bot = Bot.objects.create(name='Imported Bot', token=bot_token, is_active=True)
 
     try:
-        r = requests.get(f"https://api.telegram.org/bot{bot_token}/getUpdates", timeout=15)
-        js = r.json()
-    except Exception as ex:
+        js = get_client(bot_token).request('getUpdates', http_method='GET', timeout=15)
+    except TelegramError as ex:
         return JsonResponse({'error': f'failed to fetch updates: {ex}'}, status=400)
 
     if not js.get('ok'):
         return JsonResponse(js, status=400)
 
-    upserted = 0
-    started = 0
-    for upd in js.get('result', []):
-        msg = upd.get('message') or upd.get('edited_message') or {}
-        if not msg:
-            continue
-        from_user = msg.get('from') or {}
-        chat = msg.get('chat') or {}
-        chat_id = chat.get('id') or from_user.get('id')
-        if not chat_id:
-            continue
-        bu, created = BotUser.objects.get_or_create(
-            bot=bot,
-            telegram_id=chat_id,
-            defaults={
-                'username': from_user.get('username'),
-                'first_name': from_user.get('first_name'),
-                'last_name': from_user.get('last_name'),
-                'language_code': from_user.get('language_code'),
-                'last_seen_at': timezone.now(),
-            }
-        )
-        if created:
-            upserted += 1
-        else:
-            changed = False
-            for field, value in {
-                'username': from_user.get('username'),
-                'first_name': from_user.get('first_name'),
-                'last_name': from_user.get('last_name'),
-                'language_code': from_user.get('language_code'),
-            }.items():
-                if value and getattr(bu, field) != value:
-                    setattr(bu, field, value)
-                    changed = True
-            bu.last_seen_at = timezone.now()
-            if changed:
-                bu.save()
-        text = (msg.get('text') or '').strip()
-        if text.startswith('/start') and not bu.started_at:
-            bu.started_at = timezone.now()
-            bu.save(update_fields=['started_at'])
-            started += 1
+    # Historical updates: apply them through the shared pipeline without replying
+    # to users, and leave Bot.last_update_id alone so the poller still gets them
+    batch = process_updates(bot, js.get('result', []), side_effects=False, track_offset=False)
+    upserted = batch.created_users
+    started = batch.started_users
 
     return JsonResponse({'ok': True, 'upserted': upserted, 'started_marked': started})
 
@@ -1666,12 +1056,15 @@ def election_dashboard(request: HttpRequest) -> HttpResponse:
     return render(request, 'hub/election_dashboard.html', context)
 
 
+@cache_public_page(lambda request: public_version())
 def public_landing(request: HttpRequest) -> HttpResponse:
     """Public landing page for Election 360 - accessible to all users"""
     # Get some basic stats for the landing page
     total_candidates = Candidate.objects.filter(is_active=True).count()
-    total_events = Event.objects.filter(is_public=True).count()
-    total_supporters = Supporter.objects.count()
+    # Running counters (hub/counters.py) rather than scans of the big tables
+    totals = global_counts()
+    total_events = totals['total_public_events']
+    total_supporters = totals['total_supporters']
     
     # Get all active candidates for the candidates section
     candidates = Candidate.objects.filter(is_active=True).order_by('-created_at')
@@ -1709,6 +1102,7 @@ def election_360_landing(request: HttpRequest) -> HttpResponse:
     return render(request, 'hub/election_360_landing.html')
 
 
+@cache_public_page()
 def cv_landing(request: HttpRequest) -> HttpResponse:
     """English CV/Projects landing page."""
     # Curated projects list based on links parsed from CV
@@ -1756,9 +1150,8 @@ def cv_download(request: HttpRequest) -> FileResponse:
 @csrf_exempt
 def candidate_landing(request: HttpRequest, candidate_id: str) -> HttpResponse:
     """Individual candidate landing page"""
-    try:
-        candidate = Candidate.objects.get(id=candidate_id, is_active=True)
-    except Candidate.DoesNotExist:
+    candidate = get_landing_candidate(candidate_id)
+    if candidate is None:
         return HttpResponse("Candidate not found", status=404)
     
     # Determine if the request is an AJAX call (Django 4+ removed request.is_ajax())
@@ -1949,11 +1342,13 @@ def candidate_landing(request: HttpRequest, candidate_id: str) -> HttpResponse:
                     
                     if not existing_response:
                         # Create poll response
-                        PollResponse.objects.create(
-                            poll=poll,
-                            bot_user=bot_user,
-                            selected_options=[int(option_index)]
-                        )
+                        with transaction.atomic():
+                            PollResponse.objects.create(
+                                poll=poll,
+                                bot_user=bot_user,
+                                selected_options=[int(option_index)]
+                            )
+                            record_vote(poll.pk, [int(option_index)])
                         return JsonResponse({'success': True, 'message': 'تم تسجيل تصويتك بنجاح!'})
                     else:
                         return JsonResponse({'success': False, 'message': 'لقد قمت بالتصويت من قبل باستخدام هذا الرقم.'})
@@ -1964,68 +1359,20 @@ def candidate_landing(request: HttpRequest, candidate_id: str) -> HttpResponse:
         else:
             return JsonResponse({'success': False, 'message': 'يرجى ملء جميع الحقول المطلوبة'})
     
-    # Get candidate's events
-    events = Event.objects.filter(candidate=candidate, is_public=True).order_by('-start_datetime')[:5]
-    
-    # Get candidate's supporters count
-    supporters_count = Supporter.objects.filter(candidate=candidate).count()
-    
-    # Get recent speeches
-    speeches = Speech.objects.filter(candidate=candidate).order_by('-created_at')[:3]
-    
-    # Get recent polls with vote counts
-    polls = Poll.objects.filter(candidate=candidate).order_by('-created_at')[:5]
-    for poll in polls:
-        # Calculate vote counts for each option
-        all_responses = PollResponse.objects.filter(poll=poll)
-        option_votes_list = []
-        options_with_counts = []
-        for i, option in enumerate(poll.options):
-            vote_count = 0
-            for response in all_responses:
-                if i in response.selected_options:
-                    vote_count += 1
-            option_votes_list.append(vote_count)
-            options_with_counts.append({
-                'index': i,
-                'text': option,
-                'count': vote_count,
-            })
-        # Attach convenient attributes for templates
-        poll.option_votes_list = option_votes_list
-        poll.options_with_counts = options_with_counts
-    
-    # Get candidate's bot (if any)
-    candidate_bot = candidate.bot
-    
-    # Get gallery items
-    gallery_items = Gallery.objects.filter(candidate=candidate, is_public=True).order_by('-is_featured', '-created_at')[:12]
-    # Get testimonials
-    from .models import Testimonial
-    testimonials = Testimonial.objects.filter(candidate=candidate, is_public=True).order_by('display_order', '-created_at')[:6]
-    # Get dynamic benefits
-    from .models import CampaignBenefit
-    benefits = CampaignBenefit.objects.filter(candidate=candidate, is_public=True).order_by('display_order', '-created_at')[:8]
-    
-    context = {
+    # Events, speeches, polls with vote counts, gallery, testimonials, benefits
+    # and the supporters count, from the landing cache (hub/landing.py)
+    context = landing_context(candidate, DESKTOP)
+    context.update({
         'candidate': candidate,
-        'events': events,
-        'supporters_count': supporters_count,
-        'speeches': speeches,
-        'polls': polls,
-        'candidate_bot': candidate_bot,
-        'gallery_items': gallery_items,
-        'testimonials': testimonials,
-        'benefits': benefits,
-    }
+        'candidate_bot': candidate.bot,
+    })
     return render(request, 'hub/candidate_landing.html', context)
 
 
 def candidate_landing_mobile(request: HttpRequest, candidate_id: str) -> HttpResponse:
     """Mobile-optimized candidate landing page"""
-    try:
-        candidate = Candidate.objects.get(id=candidate_id, is_active=True)
-    except Candidate.DoesNotExist:
+    candidate = get_landing_candidate(candidate_id)
+    if candidate is None:
         return HttpResponse("Candidate not found", status=404)
     
     # Debug CSRF token for development
@@ -2123,11 +1470,13 @@ def candidate_landing_mobile(request: HttpRequest, candidate_id: str) -> HttpRes
                 return JsonResponse({'success': False, 'message': 'لقد قمت بالتصويت مسبقاً في هذا الاستطلاع'})
             
             # Create vote
-            PollVote.objects.create(
-                poll=poll,
-                option_index=int(selected_option),
-                user_ip=user_ip
-            )
+            with transaction.atomic():
+                PollVote.objects.create(
+                    poll=poll,
+                    option_index=int(selected_option),
+                    user_ip=user_ip
+                )
+                record_vote(poll.pk, [int(selected_option)])
             
             return JsonResponse({
                 'success': True, 
@@ -2140,32 +1489,25 @@ def candidate_landing_mobile(request: HttpRequest, candidate_id: str) -> HttpRes
             print(f"Error creating poll vote: {e}")
             return JsonResponse({'success': False, 'message': 'حدث خطأ أثناء إرسال التصويت. يرجى المحاولة مرة أخرى.'})
     
-    # Get data for template
-    supporters_count = Supporter.objects.filter(candidate=candidate).count()
-    questions_count = Question.objects.filter(candidate=candidate).count()
-    polls = Poll.objects.filter(candidate=candidate, is_active=True).order_by('-created_at')[:3]
-    events = Event.objects.filter(candidate=candidate, is_public=True).order_by('-start_datetime')[:5]
-    gallery_items = Gallery.objects.filter(candidate=candidate, is_public=True).order_by('-created_at')[:12]
-    testimonials = Testimonial.objects.filter(candidate=candidate, is_public=True).order_by('-created_at')[:5]
-    events_count = events.count()
+    # Get data for template (cached per candidate, see hub/landing.py)
+    context = landing_context(candidate, MOBILE)
     
     # Get candidate bot
     candidate_bot = candidate.bot if (getattr(candidate, 'bot', None) and candidate.bot.is_active) else None
     
-    context = {
+    context.update({
         'candidate': candidate,
-        'supporters_count': supporters_count,
-        'questions_count': questions_count,
-        'events_count': events_count,
-        'polls': polls,
-        'events': events,
         'candidate_bot': candidate_bot,
-        'gallery_items': gallery_items,
-        'testimonials': testimonials,
-    }
+    })
     return render(request, 'hub/candidate_landing_mobile.html', context)
 
 
+def _candidate_page_version(request: HttpRequest, candidate_name: str):
+    candidate = get_landing_candidate_by_name((candidate_name or '').replace('+', ' ').strip())
+    return landing_version(candidate.pk) if candidate else None
+
+
+@cache_public_page(_candidate_page_version)
 @csrf_exempt
 def candidate_landing_by_name(request: HttpRequest, candidate_name: str) -> HttpResponse:
     """Public friendly URL: /<candidate_name> → candidate landing.
@@ -2174,9 +1516,7 @@ def candidate_landing_by_name(request: HttpRequest, candidate_name: str) -> Http
     try:
         # Prefer matching by public_url_name if set, else fallback to exact name
         normalized = (candidate_name or '').replace('+', ' ').strip()
-        candidate = Candidate.objects.filter(is_active=True, public_url_name=normalized).first()
-        if not candidate:
-            candidate = Candidate.objects.filter(is_active=True, name=normalized).first()
+        candidate = get_landing_candidate_by_name(normalized)
         if not candidate:
             return HttpResponse("Candidate not found", status=404)
     except Exception:
@@ -2336,11 +1676,13 @@ def candidate_landing_by_name(request: HttpRequest, candidate_name: str) -> Http
             if existing_response:
                 return JsonResponse({'success': False, 'message': 'لقد قمت بالتصويت من قبل باستخدام هذا الرقم.'})
 
-            PollResponse.objects.create(
-                poll=poll,
-                bot_user=bot_user,
-                selected_options=[selected_index],
-            )
+            with transaction.atomic():
+                PollResponse.objects.create(
+                    poll=poll,
+                    bot_user=bot_user,
+                    selected_options=[selected_index],
+                )
+                record_vote(poll.pk, [selected_index])
             return JsonResponse({'success': True, 'message': 'تم تسجيل تصويتك بنجاح!'})
         except Poll.DoesNotExist:
             return JsonResponse({'success': False, 'message': 'خطأ: استطلاع غير صحيح'})
@@ -2349,41 +1691,11 @@ def candidate_landing_by_name(request: HttpRequest, candidate_name: str) -> Http
             return JsonResponse({'success': False, 'message': 'حدث خطأ أثناء إرسال التصويت. يرجى المحاولة مرة أخرى.'})
 
     # Reuse landing logic data
-    events = Event.objects.filter(candidate=candidate, is_public=True).order_by('-start_datetime')[:5]
-    supporters_count = Supporter.objects.filter(candidate=candidate).count()
-    speeches = Speech.objects.filter(candidate=candidate).order_by('-created_at')[:3]
-    polls = Poll.objects.filter(candidate=candidate).order_by('-created_at')[:5]
-    for poll in polls:
-        all_responses = PollResponse.objects.filter(poll=poll)
-        option_votes_list = []
-        options_with_counts = []
-        for i, option in enumerate(poll.options):
-            vote_count = 0
-            for response in all_responses:
-                if i in response.selected_options:
-                    vote_count += 1
-            option_votes_list.append(vote_count)
-            options_with_counts.append({'index': i, 'text': option, 'count': vote_count})
-        poll.option_votes_list = option_votes_list
-        poll.options_with_counts = options_with_counts
-
-    candidate_bot = candidate.bot
-    gallery_items = Gallery.objects.filter(candidate=candidate, is_public=True).order_by('-is_featured', '-created_at')[:12]
-    # Public testimonials
-    from .models import Testimonial, CampaignBenefit
-    testimonials = Testimonial.objects.filter(candidate=candidate, is_public=True).order_by('display_order', '-created_at')[:6]
-    benefits = CampaignBenefit.objects.filter(candidate=candidate, is_public=True).order_by('display_order', '-created_at')[:8]
-    context = {
+    context = landing_context(candidate, DESKTOP)
+    context.update({
         'candidate': candidate,
-        'events': events,
-        'supporters_count': supporters_count,
-        'speeches': speeches,
-        'polls': polls,
-        'candidate_bot': candidate_bot,
-        'gallery_items': gallery_items,
-        'testimonials': testimonials,
-        'benefits': benefits,
-    }
+        'candidate_bot': candidate.bot,
+    })
     return render(request, 'hub/candidate_landing.html', context)
 
 
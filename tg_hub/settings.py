@@ -209,3 +209,74 @@ ELECTION_360 = {
         'other': 5,
     }
 }
+
+# Telegram broadcast engine (hub/broadcast.py)
+TELEGRAM_BROADCAST = {
+    'WORKERS': 16,               # concurrent HTTP connections per broadcast
+    'MESSAGES_PER_SECOND': 30,   # Telegram's per-bot limit
+    'PER_CHAT_INTERVAL': 1.0,    # minimum seconds between sends to one chat
+    'MAX_RETRIES': 3,            # retries after HTTP 429 or network errors
+    'CHECKPOINT_EVERY': 500,     # recipients per job checkpoint (cursor + logs)
+    'STALE_AFTER': 300,          # seconds without heartbeat before a job is reclaimed
+    'HEARTBEAT_EVERY': 30,       # seconds between heartbeats while a chunk is sending
+    'LOG_BATCH_SIZE': 500,       # rows per SendLog bulk INSERT
+    'ASYNC_CONCURRENCY': 500,    # in-flight requests per job with run_broadcast_jobs --async
+}
+
+# Shared Telegram Bot API client (hub/telegram.py)
+TELEGRAM_CLIENT = {
+    'CONNECT_TIMEOUT': 5,        # seconds to establish a connection
+    'READ_TIMEOUT': 15,          # default seconds to wait for a response
+    'RETRIES': 3,                # connection / 502-504 retries, with backoff
+    'BACKOFF_FACTOR': 0.5,
+    'POOL_MAXSIZE': 32,          # keep-alive connections per bot token
+}
+
+# Per-process memory cache. Landing page invalidations (hub/landing.py) only
+# reach other processes through a shared backend, e.g. django-redis:
+#   'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tg-hub',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# In-process caches for BotUser and Bot lookups, landing page data (hub/cache.py)
+HUB_CACHE = {
+    'USER_CACHE_SIZE': 50000,    # BotUser snapshots kept per process
+    'USER_CACHE_TTL': 300,       # seconds; bounds staleness from uninvalidated writes
+    'USER_CACHE_ALIAS': None,    # Django cache alias to share the cache (e.g. django-redis)
+    'LAST_SEEN_INTERVAL': 60,    # write BotUser.last_seen_at at most once per N seconds
+    'BOT_CACHE_TTL': 60,         # seconds a Bot row is reused by id/token lookups
+    'LANDING_CACHE_ALIAS': 'default',  # cache for candidate landing page data (hub/landing.py)
+    'LANDING_CACHE_TTL': 600,    # seconds; sections are also invalidated by signals
+    'LANDING_COUNTS_TTL': 30,    # seconds supporter counts and poll results may lag
+    'PAGE_CACHE_TTL': 30,        # seconds a rendered public page is reused (hub/page_cache.py)
+    'PAGE_CACHE_MAX_AGE': 30,    # Cache-Control max-age sent with cached public pages
+}
+
+# PDF exports (hub/exports.py)
+HUB_EXPORTS = {
+    'PDF_UNICODE_FONT': None,    # TrueType font for non-Latin text, e.g. DejaVuSans.ttf; None tries common system paths
+}
+
+# Raw update payload storage (hub/payloads.py)
+TELEGRAM_PAYLOADS = {
+    'POLICY': 'compressed',              # off | sampled | compressed | inline
+    'SAMPLE_RATE': 0.01,                 # fraction of updates archived with 'sampled'
+    'RETENTION_DAYS': 30,                # prune_payloads: raw payloads and segments
+    'WEBHOOK_EVENT_RETENTION_DAYS': 7,   # prune_payloads: processed webhook events
+    'SEGMENT_DIR': BASE_DIR / 'payload_segments',
+    'SEGMENT_MAX_BYTES': 64 * 1024 * 1024,
+}
+
+# Monthly partitions of MessageLog/SendLog on PostgreSQL (hub/partitions.py)
+LOG_PARTITIONS = {
+    'MONTHS_AHEAD': 3,           # manage_partitions keeps this many future months ready
+    'RETENTION_MONTHS': {        # older partitions are dropped (or detached with --archive)
+        'hub_messagelog': 12,
+        'hub_sendlog': 6,
+    },
+}